@@ -0,0 +1,65 @@
+"""
+行解码基准测试
+
+对比 DictCursor + Model(**row) 与元组行 + 按列位置生成的解码函数两种方式每秒能构建多少个模型对象。
+不连接数据库，驱动返回的行用预先生成的元组模拟；DictCursor 路径额外计入驱动为每行构建字典的开销。
+
+在仓库根目录运行: python -m benchmarks.bench_hydration [行数]
+"""
+
+import sys
+import time
+
+from tee import DateTime, Decimal, Int, Model, Str
+
+
+class Order(Model):
+    id = Int()
+    user_id = Int()
+    title = Str()
+    amount = Decimal()
+    status = Int()
+    created_at = DateTime()
+
+
+COLUMNS = tuple(Order.get_field_names())
+
+
+def make_rows(count: int):
+    return [(i, i % 1000, f"order-{i}", "12.50", i % 3, "2024-01-01 00:00:00") for i in range(count)]
+
+
+def dict_path(rows):
+    # DictCursor 为每行构建字典，再经过 Model.__init__
+    result = []
+    for row in rows:
+        data = dict(zip(COLUMNS, row))
+        result.append(Order(**data))
+    return result
+
+
+def tuple_path(rows):
+    decode = Order._decoder(COLUMNS)
+    return list(map(decode, rows))
+
+
+def bench(name, fn, rows, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:<24} {len(rows) / best:>14,.0f} rows/sec")
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rows = make_rows(count)
+    before = bench("DictCursor + __init__", dict_path, rows)
+    after = bench("tuple + decoder", tuple_path, rows)
+    print(f"speedup: {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+模型内存占用基准测试
+
+使用 tracemalloc 统计普通模型与紧凑模型(compact=True)每行额外占用的内存，
+两种模型引用同一批字段值，差值只来自实例本身的存储结构。
+
+在仓库根目录运行: python -m benchmarks.bench_memory [行数]
+"""
+
+import sys
+import tracemalloc
+
+from tee import DateTime, Decimal, Int, Model, Str
+
+
+class Order(Model):
+    id = Int()
+    user_id = Int()
+    title = Str()
+    amount = Decimal()
+    status = Int()
+    created_at = DateTime()
+
+
+class CompactOrder(Model, compact=True):
+    id = Int()
+    user_id = Int()
+    title = Str()
+    amount = Decimal()
+    status = Int()
+    created_at = DateTime()
+
+
+COLUMNS = tuple(Order.get_field_names())
+
+
+def measure(model, rows):
+    decode = model._decoder(COLUMNS)
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    instances = list(map(decode, rows))
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    per_row = (after - before) / len(instances)
+    print(f"{model.__name__:<14} {per_row:>8.1f} bytes/row")
+    return per_row
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rows = [(i, i % 1000, f"order-{i}", "12.50", i % 3, "2024-01-01 00:00:00") for i in range(count)]
+    normal = measure(Order, rows)
+    compact = measure(CompactOrder, rows)
+    print(f"saving: {normal - compact:.1f} bytes/row ({1 - compact / normal:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -33,6 +33,9 @@ setup(
         "PyMySQL>=1.0.0",
     ],
     extras_require={
+        "numpy": [
+            "numpy>=1.21.0",
+        ],
         "dev": [
             "pytest>=7.0.0",
             "pytest-cov>=4.0.0",
@@ -1,9 +1,22 @@
-from .connection import transaction
-from .database import set_db, set_default_db
+from .aggregates import Avg, Count, Max, Min, Sum
+from .aio import AsyncExecutor, atransaction
+from .compiler import Param
+from .connection import close_pools, pool_stats, transaction
+from .database import PoolConfig, set_db, set_default_db
+from .entity_cache import configure_entity_cache, entity_cache_stats
 from .executor import Executor
 from .fields import DateTime, Decimal, Float, Int, Str
+from .hooks import QueryEvent, QueryHook, add_hook, remove_hook
+from .loader import AsyncLoader, Loader
 from .model import Model
+from .parallel import aparallel, configure_parallel, parallel
+from .relations import BelongsTo, HasMany
+from .replicas import LatencyWeighted, LeastOutstanding, ReplicaPolicy, RoundRobin, set_replicas
+from .result_cache import configure_result_cache, result_cache_stats
+from .sharding import HashShards, RangeShards, ShardStrategy
+from .single_flight import disable_single_flight, enable_single_flight, single_flight_stats
 from .statement import Statement
+from .stats import StatsRegistry, disable_stats, enable_stats, get_stats
 
 __all__ = [
     "set_default_db",
@@ -17,4 +30,45 @@ __all__ = [
     "Executor",
     "Statement",
     "transaction",
+    "PoolConfig",
+    "pool_stats",
+    "close_pools",
+    "Param",
+    "QueryHook",
+    "QueryEvent",
+    "add_hook",
+    "remove_hook",
+    "StatsRegistry",
+    "enable_stats",
+    "disable_stats",
+    "get_stats",
+    "configure_result_cache",
+    "result_cache_stats",
+    "configure_entity_cache",
+    "entity_cache_stats",
+    "Loader",
+    "AsyncLoader",
+    "BelongsTo",
+    "HasMany",
+    "Count",
+    "Sum",
+    "Avg",
+    "Min",
+    "Max",
+    "AsyncExecutor",
+    "atransaction",
+    "parallel",
+    "aparallel",
+    "configure_parallel",
+    "enable_single_flight",
+    "disable_single_flight",
+    "single_flight_stats",
+    "set_replicas",
+    "ReplicaPolicy",
+    "RoundRobin",
+    "LeastOutstanding",
+    "LatencyWeighted",
+    "ShardStrategy",
+    "HashShards",
+    "RangeShards",
 ]
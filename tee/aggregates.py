@@ -0,0 +1,118 @@
+import decimal
+from typing import Any, Callable, Tuple
+
+from .fields import Decimal, Field, Float, Int
+from .operation import Operation
+
+
+class Aggregate:
+    """聚合表达式，比较运算得到 HAVING 条件：Sum(Order.amount) > 100"""
+
+    function = ""
+
+    def __init__(self, field: Field, distinct: bool = False):
+        self.field = field
+        self.distinct = distinct
+
+    def sql(self, column: Callable[[Field], str]) -> str:
+        """渲染聚合表达式，column 将字段转换为列名"""
+        return f"{self.function}({'DISTINCT ' if self.distinct else ''}{column(self.field)})"
+
+    def shape(self) -> Tuple[Any, ...]:
+        return self.function, self.field.model, self.field.name, self.distinct
+
+    def decode(self, value: Any) -> Any:
+        """按字段类型转换聚合结果"""
+        return _convert(self.field, value)
+
+    def __gt__(self, value: Any) -> "Having":
+        return Having(self, Operation.GT, value)
+
+    def __ge__(self, value: Any) -> "Having":
+        return Having(self, Operation.GE, value)
+
+    def __lt__(self, value: Any) -> "Having":
+        return Having(self, Operation.LT, value)
+
+    def __le__(self, value: Any) -> "Having":
+        return Having(self, Operation.LE, value)
+
+    def __eq__(self, value: Any) -> "Having":  # type: ignore[override]
+        return Having(self, Operation.EQ, value)
+
+    def __ne__(self, value: Any) -> "Having":  # type: ignore[override]
+        return Having(self, Operation.NE, value)
+
+    __hash__ = object.__hash__
+
+
+class Count(Aggregate):
+    function = "COUNT"
+
+    def __init__(self, field: Field | None = None, distinct: bool = False):
+        super().__init__(field, distinct)  # type: ignore[arg-type]
+
+    def sql(self, column: Callable[[Field], str]) -> str:
+        if self.field is None:
+            return "COUNT(*)"
+        return super().sql(column)
+
+    def shape(self) -> Tuple[Any, ...]:
+        if self.field is None:
+            return self.function, None, None, self.distinct
+        return super().shape()
+
+    def decode(self, value: Any) -> Any:
+        return int(value)
+
+
+class Sum(Aggregate):
+    function = "SUM"
+
+
+class Avg(Aggregate):
+    function = "AVG"
+
+    def decode(self, value: Any) -> Any:
+        # MySQL 对整数和定点数求平均返回 DECIMAL
+        if value is None:
+            return None
+        if isinstance(self.field, Float):
+            return float(value)
+        return decimal.Decimal(value)
+
+
+class Min(Aggregate):
+    function = "MIN"
+
+
+class Max(Aggregate):
+    function = "MAX"
+
+
+class Having:
+    """HAVING 条件：聚合表达式 操作符 值"""
+
+    def __init__(self, aggregate: Aggregate, operation: Operation, value: Any):
+        self.aggregate = aggregate
+        self.operation = operation
+        self.value = value
+
+    def shape(self) -> Tuple[Any, ...]:
+        return self.aggregate.shape(), self.operation.value
+
+
+# aggregate(sum=Order.amount) 简写中的函数名
+AGGREGATES = {"count": Count, "sum": Sum, "avg": Avg, "min": Min, "max": Max}
+
+
+def _convert(field: Field | None, value: Any) -> Any:
+    if value is None:
+        return None
+    if isinstance(field, Int):
+        return int(value)
+    if isinstance(field, Float):
+        return float(value)
+    if isinstance(field, Decimal):
+        return decimal.Decimal(value)
+    return value
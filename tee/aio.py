@@ -0,0 +1,159 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Tuple, TypeVar
+
+from pymysql.connections import Connection
+
+from .connection import ConnectionContext, ConnectionPool, _transaction_context, get_pool
+from .executor import Executor
+from .replicas import bind_write_session
+from .statement import Statement
+
+T = TypeVar("T")
+
+# 默认的线程数，与连接池默认的最大连接数一致
+DEFAULT_MAX_WORKERS = 10
+
+
+class AsyncExecutor:
+    """
+    异步执行器：在有界线程池中执行阻塞的 pymysql 调用，不阻塞事件循环
+
+    线程数即同时执行的语句数上限，超出的调用在线程池队列中等待；
+    调用时复制当前的 contextvars 上下文，异步事务中的语句使用事务连接。
+    """
+
+    max_workers = DEFAULT_MAX_WORKERS
+    _pool: ThreadPoolExecutor | None = None
+    # 异步事务获取连接使用单独的线程池，等待连接的任务不会占满执行语句的线程，使已开启的事务无法提交
+    _acquire_pool: ThreadPoolExecutor | None = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, max_workers: int) -> None:
+        """修改线程数，正在执行的调用不受影响"""
+        if max_workers < 1:
+            raise ValueError("max_workers must be positive")
+        with cls._lock:
+            old = [cls._pool, cls._acquire_pool]
+            cls._pool = cls._acquire_pool = None
+            cls.max_workers = max_workers
+        for pool in old:
+            if pool is not None:
+                pool.shutdown(wait=False)
+
+    @classmethod
+    async def run(cls, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """在线程池中执行阻塞调用"""
+        loop = asyncio.get_running_loop()
+        bind_write_session()
+        call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+        return await loop.run_in_executor(cls._executor(), call)
+
+    @classmethod
+    async def acquire(cls, pool: ConnectionPool) -> Connection:
+        """
+        从连接池获取连接，不占用执行语句的线程
+
+        等待期间任务被取消时，线程中稍后取得的连接会被放回连接池。
+        """
+        future = cls._acquirer().submit(pool.acquire)
+        try:
+            return await asyncio.shield(asyncio.wrap_future(future))
+        except asyncio.CancelledError:
+            # 回调在获取连接的线程中执行，事件循环已关闭时也能归还
+            future.add_done_callback(functools.partial(_release_acquired, pool))
+            raise
+
+    @classmethod
+    def _executor(cls) -> ThreadPoolExecutor:
+        pool = cls._pool
+        if pool is None:
+            with cls._lock:
+                if cls._pool is None:
+                    cls._pool = ThreadPoolExecutor(cls.max_workers, thread_name_prefix="tee-async")
+                pool = cls._pool
+        return pool
+
+    @classmethod
+    def _acquirer(cls) -> ThreadPoolExecutor:
+        pool = cls._acquire_pool
+        if pool is None:
+            with cls._lock:
+                if cls._acquire_pool is None:
+                    cls._acquire_pool = ThreadPoolExecutor(cls.max_workers, thread_name_prefix="tee-acquire")
+                pool = cls._acquire_pool
+        return pool
+
+    @staticmethod
+    async def select(stmt: Statement, db_name: str = "default") -> Tuple[Dict[str, Any], ...]:
+        return await AsyncExecutor.run(Executor.select, stmt, db_name)
+
+    @staticmethod
+    async def execute(stmt: Statement, db_name: str = "default") -> int:
+        return await AsyncExecutor.run(Executor.execute, stmt, db_name)
+
+    @staticmethod
+    async def execute_many(stmt: Statement, db_name: str = "default") -> int:
+        return await AsyncExecutor.run(Executor.execute_many, stmt, db_name)
+
+    @staticmethod
+    async def insert(stmt: Statement, db_name: str = "default") -> int:
+        return await AsyncExecutor.run(Executor.insert, stmt, db_name)
+
+
+@asynccontextmanager
+async def atransaction(db_name: str = "default") -> AsyncIterator[Connection]:
+    """
+    异步事务管理上下文管理器
+
+    事务状态保存在 contextvars 中，只对当前任务及其中创建的任务可见，同一线程内的其他协程不受影响：
+        async with atransaction():
+            await User.update().eq(User.id, 1).set(name="张三").aexecute()
+            await Order.insert().aexecute({"user_id": 1})
+    事务中的语句依次使用同一个连接，并发执行时互相等待。
+    """
+    pool = get_pool(db_name)
+    conn = await AsyncExecutor.acquire(pool)
+    context = ConnectionContext(conn, in_transaction=True, pool=pool)
+    token = _transaction_context.set(context)
+
+    # 未正常提交或回滚的连接可能残留事务, 不能放回连接池
+    finished = False
+    try:
+        await AsyncExecutor.run(conn.begin)
+        yield conn
+        await AsyncExecutor.run(_locked, context, conn.commit)
+        finished = True
+    except BaseException:
+        # 任务被取消时也回滚，被取消的语句可能仍在线程中执行，回滚等待其释放连接；
+        # 回滚失败时连接被丢弃，事务同样不会提交，回调总是执行
+        try:
+            await AsyncExecutor.run(_locked, context, conn.rollback)
+            finished = True
+        finally:
+            for callback in reversed(context.after_rollback):
+                callback()
+        raise
+    finally:
+        pool.release(conn, discard=not finished)
+        _transaction_context.reset(token)
+
+    for callback in context.after_commit:
+        callback()
+
+
+def _locked(context: ConnectionContext, func: Callable[[], None]) -> None:
+    """持有事务连接的锁执行调用"""
+    with context.lock:
+        func()
+
+
+def _release_acquired(pool: ConnectionPool, future: "Future[Connection]") -> None:
+    """取消获取连接后，归还线程中已经取得的连接"""
+    if not future.cancelled() and future.exception() is None:
+        pool.release(future.result())
@@ -0,0 +1,84 @@
+from array import array
+from typing import Any, Dict, Iterable, List, Literal, Sequence
+
+from .fields import DateTime, Decimal, Field, Float, Int
+
+ColumnKind = Literal["list", "array", "numpy"]
+
+# array.array 的类型码，只有整数和浮点数字段可以使用
+_ARRAY_TYPECODES = {Int: "q", Float: "d"}
+
+
+def collect_columns(
+    batches: Iterable[Sequence[Sequence[Any]]],
+    columns: Sequence[str],
+    fields: Dict[str, Field],
+    kind: ColumnKind = "list",
+) -> Dict[str, Any]:
+    """
+    将按批读取的元组行转置为列
+
+    kind 为 list 时每列是列表；为 array 时 Int/Float 列是 array.array，含 NULL 的列退化为列表；
+    为 numpy 时按字段类型转为 NumPy 数组，含 NULL 的列返回 masked array。
+    """
+    if kind not in ("list", "array", "numpy"):
+        raise ValueError(f"unsupported column kind: {kind}")
+
+    numpy = _import_numpy() if kind == "numpy" else None
+    data: List[Any] = []
+    for name in columns:
+        typecode = _ARRAY_TYPECODES.get(type(fields.get(name)))
+        data.append(array(typecode) if kind != "list" and typecode is not None else [])
+
+    for batch in batches:
+        if not batch:
+            continue
+        for i, values in enumerate(zip(*batch)):
+            column = data[i]
+            if isinstance(column, array):
+                size = len(column)
+                try:
+                    column.extend(values)
+                    continue
+                except (TypeError, OverflowError):
+                    # 含 NULL 或超出 int64 的值(BIGINT UNSIGNED)的列无法放入 array，退化为列表(extend 失败前可能已追加部分值)
+                    column = data[i] = column.tolist()[:size]
+            column.extend(values)
+
+    if numpy is None:
+        return dict(zip(columns, data))
+    return {name: _to_numpy(numpy, column, fields.get(name)) for name, column in zip(columns, data)}
+
+
+def _import_numpy() -> Any:
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError("to_columns(kind='numpy') requires numpy, install it with: pip install tee-orm[numpy]") from e
+    return numpy
+
+
+def _to_numpy(numpy: Any, column: Any, field: Field | None) -> Any:
+    if isinstance(column, array):
+        # 无 NULL 的数值列直接共享 array 的缓冲区
+        return numpy.frombuffer(column, dtype=numpy.int64 if column.typecode == "q" else numpy.float64)
+
+    if isinstance(field, Int):
+        dtype, fill = numpy.int64, 0
+    elif isinstance(field, (Float, Decimal)):
+        # Decimal 按 float64 处理，便于向量化计算
+        dtype, fill = numpy.float64, 0.0
+    elif isinstance(field, DateTime):
+        dtype, fill = "datetime64[us]", None
+    else:
+        return numpy.array(column, dtype=object)
+
+    mask = [value is None for value in column]
+    try:
+        if not any(mask):
+            return numpy.array(column, dtype=dtype)
+        values = numpy.array([fill if value is None else value for value in column], dtype=dtype)
+    except OverflowError:
+        # 超出 int64 的值(BIGINT UNSIGNED)保留为 Python 整数
+        return numpy.array(column, dtype=object)
+    return numpy.ma.masked_array(values, mask=mask)
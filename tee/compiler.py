@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Dict, Generic, Hashable, Iterator, List, TypeVar
+
+from .executor import Executor
+from .model import Model
+from .statement import Statement
+
+if TYPE_CHECKING:
+    from .select import Select
+
+M = TypeVar("M", bound=Model)
+
+
+class LRUCache:
+    """线程安全的 LRU 缓存"""
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# 查询结构 -> SQL 模板
+statement_cache = LRUCache(1024)
+
+
+def cached_sql(key: Hashable, render: Callable[[], str]) -> str:
+    """按查询结构取 SQL 模板，未命中时渲染并缓存"""
+    sql = statement_cache.get(key)
+    if sql is None:
+        sql = render()
+        statement_cache.put(key, sql)
+    return sql
+
+
+class Param:
+    """编译查询中的具名参数占位符，执行时按名称传值"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __repr__(self) -> str:
+        return f"Param({self.name!r})"
+
+
+def bind(stmt: Statement, params: Dict[str, Any]) -> Statement:
+    """将语句中的 Param 替换为实际参数值"""
+    start = time.perf_counter()
+    args: List[Any] = []
+    for arg in stmt.get_args():
+        if isinstance(arg, Param):
+            if arg.name not in params:
+                raise ValueError(f"missing value for parameter {arg.name!r}")
+            args.append(params[arg.name])
+        else:
+            args.append(arg)
+    return Statement(stmt.get_sql(), tuple(args), time.perf_counter() - start, stmt.tables)
+
+
+class CompiledSelect(Generic[M]):
+    """编译后的查询，SQL 模板只生成一次，执行时只绑定参数"""
+
+    def __init__(self, select: "Select[M]"):
+        self._select = select
+        self._get = select._statement("get")
+        self._first = select._statement("first")
+        self._list = select._statement("list")
+        self._count = select._statement("count")
+
+    @property
+    def sql(self) -> str:
+        return self._list.get_sql()
+
+    def get(self, **params: Any) -> M:
+        return self._select._fetch_one(bind(self._get, params))
+
+    def one(self, **params: Any) -> M | None:
+        return self._select._fetch_one_or_none(bind(self._get, params))
+
+    def first(self, **params: Any) -> M | None:
+        return self._select._fetch_one_or_none(bind(self._first, params))
+
+    def list(self, **params: Any) -> List[M]:
+        return self._select._fetch_all(bind(self._list, params))
+
+    def iter(self, batch_size: int = 1000, **params: Any) -> Iterator[M]:
+        return self._select._fetch_iter(bind(self._list, params), batch_size)
+
+    def count(self, **params: Any) -> int:
+        return self._select._fetch_count(bind(self._count, params))
+
+
+class CompiledStatement:
+    """编译后的更新/删除语句"""
+
+    def __init__(self, stmt: Statement, run: Callable[[Statement], int] = Executor.execute):
+        self._stmt = stmt
+        self._run = run
+
+    @property
+    def sql(self) -> str:
+        return self._stmt.get_sql()
+
+    def statement(self, **params: Any) -> Statement:
+        return bind(self._stmt, params)
+
+    def execute(self, **params: Any) -> int:
+        return self._run(bind(self._stmt, params))
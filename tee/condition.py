@@ -1,4 +1,4 @@
-from typing import Any, List, Tuple
+from typing import Any, Callable, Iterable, List, Sequence, Tuple
 
 from .operation import Operation
 
@@ -9,8 +9,29 @@ class Condition:
         self.value: Any = value
         self.operation: Operation = operation
 
-    def parse(self, placeholder: str = "?") -> tuple[str, Any]:
-        return f"{self.field} {self.operation.value} {placeholder}", self.value
+    def parse(self, placeholder: str = "?", qualify: Callable[[str], str] | None = None) -> tuple[str, Any]:
+        field = qualify(self.field) if qualify is not None else self.field
+        return f"{field} {self.operation.value} {placeholder}", self.value
+
+    def shape(self) -> Tuple[str, str]:
+        """条件的结构(字段和操作符)，与参数值无关"""
+        return self.field, self.operation.value
+
+
+class RowCondition(Condition):
+    """行构造器条件，用于复合键：(a, b) IN ((1, 2), (3, 4))"""
+
+    def __init__(self, fields: Sequence[str], values: Iterable[Sequence[Any]], operation: Operation = Operation.IN):
+        rows = [tuple(value) for value in values]
+        if any(len(row) != len(fields) for row in rows):
+            raise ValueError(f"each value must have {len(fields)} items to match fields {tuple(fields)}")
+        super().__init__(f"({', '.join(fields)})", rows, operation)
+        self.fields = tuple(fields)
+
+    def parse(self, placeholder: str = "?", qualify: Callable[[str], str] | None = None) -> tuple[str, Any]:
+        if qualify is None:
+            return super().parse(placeholder)
+        return f"({', '.join(map(qualify, self.fields))}) {self.operation.value} {placeholder}", self.value
 
 
 class ConditionTree:
@@ -29,18 +50,33 @@ class ConditionTree:
         self.conditions.append(condition_tree)
         return self
 
-    def parse(self, placeholder: str = "?") -> Tuple[str, Tuple[Any, ...]]:
+    def parse(self, placeholder: str = "?", qualify: Callable[[str], str] | None = None) -> Tuple[str, Tuple[Any, ...]]:
+        """渲染条件，qualify 用于将字段名转换为带表名的列名"""
         if len(self.conditions) == 0:
             return "", ()
         args: List[Any] = []
         exps: List[str] = []
         for condition in self.conditions:
             if isinstance(condition, ConditionTree):
-                exp, arg = condition.parse(placeholder)
+                exp, arg = condition.parse(placeholder, qualify)
                 exps.append(f"({exp})")
                 args.extend(arg)
             else:
-                exp, arg = condition.parse(placeholder)
+                exp, arg = condition.parse(placeholder, qualify)
                 exps.append(exp)
                 args.append(arg)
         return f" {self.logic} ".join(exps), tuple(args)
+
+    def shape(self) -> Tuple[Any, ...]:
+        """条件树的结构，可作为 SQL 模板缓存的键"""
+        return self.logic, tuple(condition.shape() for condition in self.conditions)
+
+    def values(self) -> List[Any]:
+        """按 parse 的顺序收集参数值"""
+        args: List[Any] = []
+        for condition in self.conditions:
+            if isinstance(condition, ConditionTree):
+                args.extend(condition.values())
+            else:
+                args.append(condition.value)
+        return args
@@ -1,24 +1,37 @@
+import contextvars
 import threading
+import time
+from collections import deque
 from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List
 
 import pymysql
 from pymysql.connections import Connection
 
-from .database import get_db
+from .database import MysqlDatabase, get_db
+from .errors import PoolTimeoutError
 
-thread_local = threading.local()
+# 当前事务的连接上下文；保存在 contextvars 中，同一线程内的协程任务互不可见，复制上下文到线程池时随之传递
+_transaction_context: "contextvars.ContextVar[ConnectionContext | None]" = contextvars.ContextVar(
+    "tee_transaction_context", default=None
+)
 
 
 class ConnectionContext:
     """连接上下文,用于跟踪连接状态"""
 
-    def __init__(self, connection: Connection, in_transaction: bool = False):
+    def __init__(self, connection: Connection, in_transaction: bool = False, pool: "ConnectionPool | None" = None):
         self.connection = connection
         self.in_transaction = in_transaction
+        self.pool = pool
+        self.streaming = False  # 连接上是否有未读完的无缓冲结果集
+        self.after_commit: List[Callable[[], None]] = []  # 事务提交后执行的回调
+        self.after_rollback: List[Callable[[], None]] = []  # 事务回滚后执行的回调
+        # 异步事务中的语句可能在不同线程中执行，同一时间只允许一条语句使用连接
+        self.lock = threading.RLock()
 
 
-def new_connection(db_name: str = "default", autocommit: bool = True) -> Connection:
-    db = get_db(db_name)
+def _connect(db: MysqlDatabase, autocommit: bool = True) -> Connection:
     connection: Connection = pymysql.connect(
         host=db.host,
         port=db.port,
@@ -32,30 +45,352 @@ def new_connection(db_name: str = "default", autocommit: bool = True) -> Connect
     return connection
 
 
-def get_connection(db_name: str = "default"):
-    """获取当前线程的连接,如果在事务中则返回事务连接"""
-    # 优先返回事务连接
-    if hasattr(thread_local, "transaction_context") and thread_local.transaction_context is not None:
-        return thread_local.transaction_context.connection
+def new_connection(db_name: str = "default", autocommit: bool = True) -> Connection:
+    """新建一个不经过连接池的连接"""
+    return _connect(get_db(db_name), autocommit=autocommit)
+
+
+class _PoolEntry:
+    __slots__ = ("connection", "created_at", "last_used_at")
+
+    def __init__(self, connection: Connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+
+
+class ConnectionPool:
+    """
+    连接池, 每个具名数据库一个
+
+    连接以 autocommit 模式创建; 空闲回收与存活时间检查在借出/归还时顺带完成, 不启动后台线程。
+    """
+
+    def __init__(self, db_name: str, database: MysqlDatabase):
+        self.db_name = db_name
+        self.database = database
+        self.config = database.pool
+        self._cond = threading.Condition()
+        self._idle: Deque[_PoolEntry] = deque()
+        self._in_use: Dict[int, _PoolEntry] = {}
+        self._size = 0  # 已创建(含正在创建)且未关闭的连接数
+        self._waiters = 0
+        self._closed = False
+
+        # 统计信息
+        self._acquires = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+
+    def fill(self) -> None:
+        """预先创建 min_size 个连接"""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.config.min_size:
+                    return
+                self._size += 1
+            try:
+                entry = self._create()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                self._idle.append(entry)
+                self._cond.notify()
+
+    def acquire(self, timeout: float | None = None) -> Connection:
+        """借出一个可用连接, 池满时最多等待 timeout 秒"""
+        timeout = self.config.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        while True:
+            entry = self._checkout(start, deadline)
+            if self._is_alive(entry):
+                break
+            self._discard(entry)
+
+        entry.last_used_at = time.monotonic()
+        with self._cond:
+            self._in_use[id(entry.connection)] = entry
+        return entry.connection
+
+    def release(self, connection: Connection, discard: bool = False) -> None:
+        """归还连接, discard 为 True 或连接已失效时直接关闭"""
+        now = time.monotonic()
+        stale: List[_PoolEntry] = []
+        with self._cond:
+            entry = self._in_use.pop(id(connection), None)
+            if entry is None:
+                # 不是本池借出的连接
+                stale.append(_PoolEntry(connection))
+            elif discard or self._closed or not connection.open or self._expired(entry, now):
+                self._size -= 1
+                self._discarded += 1
+                stale.append(entry)
+            else:
+                entry.last_used_at = now
+                self._idle.append(entry)
+            stale.extend(self._evict_idle_locked(now))
+            self._cond.notify()
+        self._close_all(stale)
+
+    def close(self) -> None:
+        """关闭连接池, 正在使用的连接会在归还时关闭"""
+        with self._cond:
+            self._closed = True
+            stale = list(self._idle)
+            self._idle.clear()
+            self._size -= len(stale)
+            self._cond.notify_all()
+        self._close_all(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池统计信息, 用于评估池大小"""
+        with self._cond:
+            return {
+                "db_name": self.db_name,
+                "min_size": self.config.min_size,
+                "max_size": self.config.max_size,
+                "size": self._size,
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                "waiters": self._waiters,
+                "acquires": self._acquires,
+                "waits": self._waits,
+                "wait_time": self._wait_time,
+                "max_wait_time": self._max_wait_time,
+                "avg_wait_time": self._wait_time / self._waits if self._waits else 0.0,
+                "timeouts": self._timeouts,
+                "created": self._created,
+                "discarded": self._discarded,
+            }
+
+    def _checkout(self, start: float, deadline: float) -> _PoolEntry:
+        stale: List[_PoolEntry] = []
+        try:
+            entry = self._take_locked_or_reserve(start, deadline, stale)
+        finally:
+            self._close_all(stale)
+
+        if entry is not None:
+            return entry
+        try:
+            return self._create()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def _take_locked_or_reserve(self, start: float, deadline: float, stale: List[_PoolEntry]) -> _PoolEntry | None:
+        """取出一个空闲连接; 没有空闲连接但未达上限时预留名额并返回 None"""
+        waited = False
+        with self._cond:
+            try:
+                while True:
+                    if self._closed:
+                        raise RuntimeError(f"Connection pool for database {self.db_name!r} is closed")
+                    now = time.monotonic()
+                    stale.extend(self._evict_idle_locked(now))
+                    while self._idle:
+                        entry = self._idle.pop()  # 后进先出, 让多余的连接自然空闲回收
+                        if not self._expired(entry, now):
+                            return entry
+                        self._size -= 1
+                        self._discarded += 1
+                        stale.append(entry)
+                    if self._size < self.config.max_size:
+                        self._size += 1
+                        return None
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"Timed out after {deadline - start:.3f}s waiting for a connection to {self.db_name!r}"
+                        )
+                    self._waiters += 1
+                    waited = True
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiters -= 1
+            finally:
+                self._acquires += 1
+                if waited:
+                    wait_time = time.monotonic() - start
+                    self._waits += 1
+                    self._wait_time += wait_time
+                    self._max_wait_time = max(self._max_wait_time, wait_time)
+
+    def _create(self) -> _PoolEntry:
+        entry = _PoolEntry(_connect(self.database, autocommit=True))
+        with self._cond:
+            self._created += 1
+        return entry
+
+    def _is_alive(self, entry: _PoolEntry) -> bool:
+        ping_interval = self.config.ping_interval
+        if ping_interval is None or time.monotonic() - entry.last_used_at < ping_interval:
+            return True
+        try:
+            entry.connection.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, entry: _PoolEntry) -> None:
+        with self._cond:
+            self._size -= 1
+            self._discarded += 1
+            self._cond.notify()
+        self._close_all([entry])
+
+    def _expired(self, entry: _PoolEntry, now: float) -> bool:
+        max_lifetime = self.config.max_lifetime
+        return max_lifetime is not None and now - entry.created_at >= max_lifetime
+
+    def _evict_idle_locked(self, now: float) -> List[_PoolEntry]:
+        idle_timeout = self.config.idle_timeout
+        evicted: List[_PoolEntry] = []
+        if idle_timeout is None:
+            return evicted
+        # 队首是最久未使用的连接
+        while self._idle and self._size > self.config.min_size and now - self._idle[0].last_used_at >= idle_timeout:
+            evicted.append(self._idle.popleft())
+            self._size -= 1
+            self._discarded += 1
+        return evicted
+
+    @staticmethod
+    def _close_all(entries: List[_PoolEntry]) -> None:
+        for entry in entries:
+            try:
+                entry.connection.close()
+            except Exception:
+                pass
 
-    # 否则返回或创建普通连接
-    if not hasattr(thread_local, "connection_context") or thread_local.connection_context is None:
-        connection = new_connection(db_name=db_name, autocommit=True)
-        thread_local.connection_context = ConnectionContext(connection, in_transaction=False)
-    return thread_local.connection_context.connection
 
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
 
-def close_connection():
-    """关闭普通连接(不会关闭事务连接)"""
-    if hasattr(thread_local, "connection_context") and thread_local.connection_context is not None:
-        if not thread_local.connection_context.in_transaction:
-            thread_local.connection_context.connection.close()
-            thread_local.connection_context = None
+
+def get_pool(db_name: str = "default") -> ConnectionPool:
+    """获取数据库对应的连接池, 数据库配置变更后会重建连接池"""
+    database = get_db(db_name)
+    pool = _pools.get(db_name)
+    if pool is not None and pool.database is database:
+        return pool
+    with _pools_lock:
+        pool = _pools.get(db_name)
+        if pool is None or pool.database is not database:
+            if pool is not None:
+                pool.close()
+            pool = ConnectionPool(db_name, database)
+            _pools[db_name] = pool
+    pool.fill()
+    return pool
+
+
+def pool_stats(db_name: str | None = None) -> Dict[str, Any]:
+    """获取连接池统计信息, 不指定 db_name 时返回所有连接池"""
+    if db_name is not None:
+        return get_pool(db_name).stats()
+    return {name: pool.stats() for name, pool in list(_pools.items())}
+
+
+def close_pools() -> None:
+    """关闭所有连接池"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+@contextmanager
+def checkout(db_name: str = "default") -> Iterator[Connection]:
+    """借出连接: 事务中返回事务连接, 否则从连接池借出并在结束时归还"""
+    transaction_context = _transaction_context.get()
+    if transaction_context is not None:
+        if transaction_context.streaming:
+            raise RuntimeError("Cannot execute a statement while a result stream is open in the same transaction")
+        with transaction_context.lock:
+            yield transaction_context.connection
+        return
+
+    pool = get_pool(db_name)
+    connection = pool.acquire()
+    broken = False
+    try:
+        yield connection
+    except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+        broken = True
+        raise
+    finally:
+        pool.release(connection, discard=broken)
+
+
+@contextmanager
+def checkout_stream(db_name: str = "default") -> Iterator[Connection]:
+    """
+    借出用于无缓冲流式读取的连接
+
+    事务中使用事务连接, 流未关闭前同一事务内不能执行其他语句;
+    否则独占一个连接池连接, 流提前结束时直接关闭连接, 避免读完剩余的行。
+    """
+    transaction_context = _transaction_context.get()
+    if transaction_context is not None:
+        if transaction_context.streaming:
+            raise RuntimeError("Another result stream is already open in the same transaction")
+        transaction_context.streaming = True
+        try:
+            yield transaction_context.connection
+        finally:
+            transaction_context.streaming = False
+        return
+
+    pool = get_pool(db_name)
+    connection = pool.acquire()
+    completed = False
+    try:
+        yield connection
+        completed = True
+    finally:
+        pool.release(connection, discard=not completed)
+
+
+def on_commit(callback: Callable[[], None]) -> None:
+    """在当前事务提交后执行回调，不在事务中时立即执行；事务回滚时丢弃"""
+    transaction_context = _transaction_context.get()
+    if transaction_context is None:
+        callback()
+    else:
+        transaction_context.after_commit.append(callback)
+
+
+def on_rollback(callback: Callable[[], None]) -> None:
+    """在当前事务回滚后按注册的逆序执行回调，用于恢复内存中的状态；不在事务中或事务提交时丢弃"""
+    transaction_context = _transaction_context.get()
+    if transaction_context is not None:
+        transaction_context.after_rollback.append(callback)
 
 
 def is_in_transaction() -> bool:
-    """检查当前线程是否在事务中"""
-    return hasattr(thread_local, "transaction_context") and thread_local.transaction_context is not None
+    """检查当前线程(或协程任务)是否在事务中"""
+    return _transaction_context.get() is not None
+
+
+def transaction_db() -> str | None:
+    """当前事务所在的数据库名，不在事务中时返回 None"""
+    transaction_context = _transaction_context.get()
+    if transaction_context is None or transaction_context.pool is None:
+        return None
+    return transaction_context.pool.db_name
 
 
 @contextmanager
@@ -69,16 +404,28 @@ def transaction(db_name: str = "default"):
             cursor.execute("INSERT INTO users (name) VALUES (%s)", ("Alice",))
             cursor.execute("UPDATE accounts SET balance = balance - 100 WHERE user_id = 1")
     """
-    conn = new_connection(db_name, autocommit=False)
-    old_transaction_context = getattr(thread_local, "transaction_context", None)
-    thread_local.transaction_context = ConnectionContext(conn, in_transaction=True)
+    pool = get_pool(db_name)
+    conn = pool.acquire()
+    old_transaction_context = _transaction_context.get()
+    context = ConnectionContext(conn, in_transaction=True, pool=pool)
+    _transaction_context.set(context)
 
+    # 未正常提交或回滚的连接可能残留事务, 不能放回连接池
+    finished = False
     try:
+        conn.begin()
         yield conn
         conn.commit()
+        finished = True
     except Exception:
         conn.rollback()
+        finished = True
+        for callback in reversed(context.after_rollback):
+            callback()
         raise
     finally:
-        conn.close()
-        thread_local.transaction_context = old_transaction_context
+        pool.release(conn, discard=not finished)
+        _transaction_context.set(old_transaction_context)
+
+    for callback in context.after_commit:
+        callback()
@@ -1,33 +1,82 @@
 from typing import Any, Dict
 
 
+class PoolConfig:
+    """连接池配置"""
+
+    def __init__(
+        self,
+        min_size: int = 0,
+        max_size: int = 10,
+        timeout: float = 10.0,
+        idle_timeout: float | None = 300.0,
+        max_lifetime: float | None = 3600.0,
+        ping_interval: float | None = 1.0,
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("pool size must satisfy 0 <= min_size <= max_size and max_size >= 1")
+        self.min_size = min_size  # 常驻的最少连接数，空闲回收不会低于该值
+        self.max_size = max_size  # 最多同时存在的连接数
+        self.timeout = timeout  # 借出连接的最长等待秒数
+        self.idle_timeout = idle_timeout  # 空闲超过该秒数的连接会被回收，None 表示不回收
+        self.max_lifetime = max_lifetime  # 连接的最长存活秒数，None 表示不限制
+        self.ping_interval = ping_interval  # 空闲超过该秒数的连接借出前先 ping，0 表示每次都 ping，None 表示不 ping
+
+
 class MysqlDatabase:
-    def __init__(self, host: str, port: int, user: str, password: str, database: str, ssl: Any = None):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        database: str,
+        ssl: Any = None,
+        pool: PoolConfig | None = None,
+    ):
         self.host = host
         self.port = port
         self.user = user
         self.password = password
         self.database = database
         self.ssl = ssl
+        self.pool = pool if pool is not None else PoolConfig()
 
 
 db: Dict[str, MysqlDatabase] = {}
 
 
-def set_default_db(host: str, port: int, user: str, password: str, database: str):
+def set_default_db(
+    host: str,
+    port: int,
+    user: str,
+    password: str,
+    database: str,
+    ssl: Any = None,
+    pool: PoolConfig | None = None,
+):
     global db
-    db["default"] = MysqlDatabase(host, port, user, password, database)
+    db["default"] = MysqlDatabase(host, port, user, password, database, ssl, pool)
 
 
 def get_default_db() -> MysqlDatabase:
     return db["default"]
 
 
-def set_db(name: str, host: str, port: int, user: str, password: str, database: str, ssl: Any = None):
+def set_db(
+    name: str,
+    host: str,
+    port: int,
+    user: str,
+    password: str,
+    database: str,
+    ssl: Any = None,
+    pool: PoolConfig | None = None,
+):
     if name == "default":
         raise ValueError('Database name "default" is reserved for the default database.')
     global db
-    db[name] = MysqlDatabase(host, port, user, password, database, ssl)
+    db[name] = MysqlDatabase(host, port, user, password, database, ssl, pool)
 
 
 def get_db(name: str) -> MysqlDatabase:
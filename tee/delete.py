@@ -1,7 +1,13 @@
+import time
 from typing import Any, Generic, List, Type, TypeVar
 
+from .aio import AsyncExecutor
+from .compiler import CompiledStatement, cached_sql
+from .condition import ConditionTree
+from .entity_cache import invalidate_entities, touched_keys
 from .executor import Executor
 from .model import Field, Model
+from .sharding import route, single
 from .statement import Statement
 from .where import Where
 
@@ -14,6 +20,8 @@ class Delete(Generic[M]):
     def __init__(self, model: Type[M]):
         self._model = model
         self._where = Where()
+        # 分片模型按分片键路由后的数据库
+        self._database: str | None = None
 
     def or_(self):
         pass
@@ -59,17 +67,41 @@ class Delete(Generic[M]):
         return self
 
     def execute(self) -> int:
+        """执行删除，分片模型按条件中的分片键路由，没有分片键条件时依次删除所有分片"""
+        shards = route(self)
+        if shards is not None:
+            return sum(shard.execute() for shard in shards)
+        return self._run(self._statement())
+
+    async def aexecute(self) -> int:
+        """异步版本的 execute()，在线程池中执行，不阻塞事件循环"""
+        return await AsyncExecutor.run(self.execute)
+
+    def compile(self) -> CompiledStatement:
+        """编译删除语句，条件值可以使用 Param 占位，执行时按名称传入"""
+        shard = single(self, "compile")
+        return CompiledStatement(shard._statement(), shard._run)
+
+    def _run(self, stmt: Statement) -> int:
+        affected = Executor.execute(stmt, self._database or "default")
+        invalidate_entities(self._model, touched_keys(self._model, self._where.tree()))
+        return affected
+
+    def _statement(self) -> Statement:
+        if self._where.count() == 0:
+            raise ValueError("Delete operation requires at least one condition to prevent full table deletion.")
+
+        start = time.perf_counter()
+        where_tree = self._where.tree()
+        key = ("delete", self._model, where_tree.shape())
+        sql = cached_sql(key, lambda: self._render(where_tree))
+        return Statement(sql, tuple(where_tree.values()), time.perf_counter() - start, (self._model.get_table_name(),))
+
+    def _render(self, where_tree: ConditionTree) -> str:
         table_name = self._model.get_table_name()
         sql = f"DELETE FROM {table_name}"
-        args = ()
 
         # 构建 WHERE 部分
-        if self._where.count() > 0:
-            where_sql, where_args = self._where.tree().parse("%s")
-            sql += f" WHERE {where_sql}"
-            args += where_args
-        else:
-            raise ValueError("Delete operation requires at least one condition to prevent full table deletion.")
-
-        stmt = Statement(sql, where_args)
-        return Executor.execute(stmt)
+        where_sql, _ = where_tree.parse("%s")
+        sql += f" WHERE {where_sql}"
+        return sql
@@ -0,0 +1,206 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Hashable, Iterable, List, Set, Tuple, Type, TypeVar
+
+from .condition import ConditionTree
+from .connection import is_in_transaction, on_commit
+from .executor import Executor
+from .sharding import pinned_values
+
+if TYPE_CHECKING:
+    from .model import Model
+
+M = TypeVar("M", bound="Model")
+
+# 按单条 IN 查询加载的主键数量上限
+LOAD_BATCH_SIZE = 1000
+
+
+class EntityCache:
+    """
+    按主键缓存的实体缓存，缓存按模型字段顺序排列的元组行，带 TTL 和 LRU 容量限制
+
+    每张表维护一个代数，更新、删除时增加代数；加载期间代数变化的行不写入缓存。
+    """
+
+    def __init__(self, max_size: int = 10000, default_ttl: float = 300.0):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self._data: "OrderedDict[Tuple[str, str, Hashable], Tuple[float, Tuple[Any, ...]]]" = OrderedDict()
+        self._by_table: Dict[Tuple[str, str], Set[Tuple[str, str, Hashable]]] = {}
+        self._generations: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def configure(self, max_size: int | None = None, default_ttl: float | None = None) -> None:
+        """修改容量和默认 TTL，超出容量的条目按 LRU 淘汰"""
+        with self._lock:
+            if max_size is not None:
+                if max_size < 1:
+                    raise ValueError("max_size must be positive")
+                self.max_size = max_size
+            if default_ttl is not None:
+                if default_ttl <= 0:
+                    raise ValueError("default_ttl must be positive")
+                self.default_ttl = default_ttl
+            self._shrink_locked()
+
+    def get_many(self, db_name: str, table: str, pks: List[Hashable]) -> Tuple[Dict[Hashable, Tuple[Any, ...]], int]:
+        """返回命中的行和表的当前代数"""
+        found: Dict[Hashable, Tuple[Any, ...]] = {}
+        now = time.monotonic()
+        with self._lock:
+            for pk in pks:
+                key = (db_name, table, pk)
+                entry = self._data.get(key)
+                if entry is None:
+                    self.misses += 1
+                    continue
+                if entry[0] <= now:
+                    self._remove_locked(key)
+                    self.expirations += 1
+                    self.misses += 1
+                    continue
+                self._data.move_to_end(key)
+                self.hits += 1
+                found[pk] = entry[1]
+            return found, self._generations.get((db_name, table), 0)
+
+    def put_many(self, db_name: str, table: str, rows: Dict[Hashable, Tuple[Any, ...]], generation: int) -> None:
+        """缓存加载的行，加载期间表被修改时丢弃"""
+        expires_at = time.monotonic() + self.default_ttl
+        table_key = (db_name, table)
+        with self._lock:
+            if self._generations.get(table_key, 0) != generation:
+                return
+            keys = self._by_table.setdefault(table_key, set())
+            for pk, row in rows.items():
+                key = (db_name, table, pk)
+                self._data[key] = (expires_at, row)
+                self._data.move_to_end(key)
+                keys.add(key)
+            self._shrink_locked()
+
+    def invalidate(self, db_name: str, table: str, pks: Iterable[Hashable] | None = None) -> None:
+        """删除指定主键的缓存，pks 为 None 时清空整张表的缓存"""
+        table_key = (db_name, table)
+        with self._lock:
+            self._generations[table_key] = self._generations.get(table_key, 0) + 1
+            if pks is None:
+                keys = list(self._by_table.get(table_key, ()))
+            else:
+                keys = [(db_name, table, pk) for pk in pks]
+            for key in keys:
+                if key in self._data:
+                    self._remove_locked(key)
+                    self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._by_table.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove_locked(self, key: Tuple[str, str, Hashable]) -> None:
+        del self._data[key]
+        keys = self._by_table.get(key[:2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_table[key[:2]]
+
+    def _shrink_locked(self) -> None:
+        while len(self._data) > self.max_size:
+            self._remove_locked(next(iter(self._data)))
+            self.evictions += 1
+
+
+entity_cache = EntityCache()
+
+
+def load_by_pk(model: Type[M], pks: Iterable[Any], db_name: str = "default") -> Dict[Any, M]:
+    """按主键批量获取实体，命中的从缓存构建，未命中的用 IN 查询加载；事务中不使用缓存"""
+    keys = list(dict.fromkeys(pks))
+    if not keys:
+        return {}
+    table = model.get_table_name()
+    columns = tuple(model.get_field_names())
+    decoder = model._decoder(columns)
+
+    if is_in_transaction():
+        return {pk: decoder(row) for pk, row in _fetch_rows(model, columns, keys).items()}
+
+    rows, generation = entity_cache.get_many(db_name, table, keys)
+    misses = [pk for pk in keys if pk not in rows]
+    if misses:
+        loaded = _fetch_rows(model, columns, misses)
+        entity_cache.put_many(db_name, table, loaded, generation)
+        rows.update(loaded)
+    # 按传入主键的顺序返回
+    return {pk: decoder(rows[pk]) for pk in keys if pk in rows}
+
+
+def _fetch_rows(model: Type["Model"], columns: Tuple[str, ...], pks: List[Any]) -> Dict[Any, Tuple[Any, ...]]:
+    primary_key = model.get_primary_key()
+    position = columns.index(primary_key)
+    field = model.field(primary_key)
+    rows: Dict[Any, Tuple[Any, ...]] = {}
+    for start in range(0, len(pks), LOAD_BATCH_SIZE):
+        # 从主库加载：副本可能还没有复制已使缓存失效的写入，读到的旧数据会被缓存到 TTL 结束
+        select = model.select(list(columns)).in_(field, pks[start : start + LOAD_BATCH_SIZE]).using("primary")
+        if model._shards is not None:
+            # 主键不是分片键时需要查询所有分片
+            for item in select.list():
+                rows[getattr(item, primary_key)] = tuple(getattr(item, name) for name in columns)
+            continue
+        for row in Executor.select_rows(select._statement("list"), select._read_db()):
+            rows[row[position]] = tuple(row)
+    return rows
+
+
+def touched_keys(model: Type["Model"], where_tree: ConditionTree) -> List[Any] | None:
+    """
+    从条件树中找出受影响行的主键范围
+
+    顶层为 AND 且包含主键的 = 或 IN 条件时返回这些主键，否则(包括主键为 Param 占位)返回 None。
+    """
+    primary_key = model._primary_key
+    if primary_key is None:
+        return None
+    return pinned_values(where_tree, primary_key)
+
+
+def invalidate_entities(model: Type["Model"], pks: Iterable[Any] | None, db_name: str = "default") -> None:
+    """写操作后使实体缓存失效，pks 为 None 时清空整张表；事务中提交后再次失效"""
+    keys = None if pks is None else tuple(pks)
+    table = model.get_table_name()
+    entity_cache.invalidate(db_name, table, keys)
+    if is_in_transaction():
+        on_commit(functools.partial(entity_cache.invalidate, db_name, table, keys))
+
+
+def configure_entity_cache(max_size: int | None = None, default_ttl: float | None = None) -> None:
+    """修改实体缓存的容量和默认 TTL(秒)"""
+    entity_cache.configure(max_size, default_ttl)
+
+
+def entity_cache_stats() -> Dict[str, int]:
+    """返回实体缓存的命中、未命中、淘汰、过期和失效计数"""
+    return entity_cache.stats()
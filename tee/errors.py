@@ -10,3 +10,10 @@ class MultipleRecordsError(Exception):
 
     def __init__(self, message: str = "Multiple records found"):
         super().__init__(message)
+
+
+class PoolTimeoutError(Exception):
+    """连接池借出连接超时错误"""
+
+    def __init__(self, message: str = "Timed out waiting for a pooled connection"):
+        super().__init__(message)
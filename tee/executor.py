@@ -1,73 +1,344 @@
+import functools
 import logging
-from typing import Any, Dict, Tuple
+import time
+import weakref
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Sequence, Tuple, Type
 
-from pymysql.cursors import DictCursor
+from pymysql.cursors import Cursor, DictCursor, SSCursor, SSDictCursor
 
-from .connection import close_connection, get_connection
+from .connection import checkout, checkout_stream, is_in_transaction, on_commit
+from .database import MysqlDatabase, get_db
+from .hooks import QueryEvent, get_hooks
+from .replicas import Replica, get_replica, last_write, record_write
+from .result_cache import _freeze, invalidate_tables
+from .single_flight import single_flight
 from .statement import Statement
 
+logger = logging.getLogger(__name__)
+
+# 按数据库配置缓存服务端的 max_allowed_packet
+_max_allowed_packet: "weakref.WeakKeyDictionary[MysqlDatabase, int]" = weakref.WeakKeyDictionary()
+
+# 按连接缓存会话的 auto_increment_increment
+_auto_increment_increment: "weakref.WeakKeyDictionary[Any, int]" = weakref.WeakKeyDictionary()
+
 
 class Executor:
 
     @staticmethod
     def select(stmt: Statement, db_name: str = "default") -> Tuple[Dict[str, Any], ...]:
         """执行查询语句，返回结果元组"""
+        if single_flight.enabled and not is_in_transaction():
+            results, shared = single_flight.do(
+                _flight_key("dict", stmt, db_name), lambda: _select(stmt, db_name), last_write(db_name)
+            )
+            # 字典行是可变的，共享的结果为每个调用方复制一份
+            return tuple(dict(row) for row in results) if shared else results
+        return _select(stmt, db_name)
+
+    @staticmethod
+    def select_rows(
+        stmt: Statement,
+        db_name: str = "default",
+        decoder: Callable[[Tuple[Any, ...]], Any] | None = None,
+    ) -> Sequence[Any]:
+        """执行查询语句，按查询列顺序返回元组行，不为每行构建字典；指定 decoder 时返回解码后的对象"""
+        if single_flight.enabled and not is_in_transaction():
+            # 共享不可变的元组行，每个调用方各自解码
+            rows, _ = single_flight.do(
+                _flight_key("tuple", stmt, db_name), lambda: _select_rows(stmt, db_name, None), last_write(db_name)
+            )
+            return rows if decoder is None else list(map(decoder, rows))
+        return _select_rows(stmt, db_name, decoder)
+
+    @staticmethod
+    def stream(
+        stmt: Statement,
+        db_name: str = "default",
+        batch_size: int = 1000,
+        cursor_class: Type[SSCursor] = SSDictCursor,
+        decoder: Callable[[Any], Any] | None = None,
+    ) -> Iterator[List[Any]]:
+        """使用无缓冲游标执行查询语句，按批返回结果；cursor_class 为 SSCursor 时返回元组行"""
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        in_transaction = is_in_transaction()
+        event = _begin("stream", stmt, db_name)
+        replica = _start_replica(db_name)
+        failed = False
         try:
-            conn = get_connection(db_name=db_name)
-            # logging.debug(f"Executing SQL: {sql}, Args: {args}")
-            cursor: DictCursor = conn.cursor(DictCursor)
-            sql = stmt.get_sql()
-            args = stmt.get_args()
-            logging.debug(f"Executing SQL: {sql}, Args: {args}")
-            cursor.execute(sql, args)
-            results = cursor.fetchall()
-            cursor.close()
+            t = _clock(event)
+            with checkout_stream(db_name) as conn:
+                t = _lap(event, "acquire_time", t)
+                cursor: SSCursor = conn.cursor(cursor_class)
+                exhausted = False
+                try:
+                    cursor.execute(stmt.get_sql(), stmt.get_args())
+                    t = _lap(event, "execute_time", t)
+                    while True:
+                        rows = cursor.fetchmany(batch_size)
+                        t = _lap(event, "fetch_time", t)
+                        if not rows:
+                            exhausted = True
+                            break
+                        if decoder is not None:
+                            rows = list(map(decoder, rows))
+                            _lap(event, "hydrate_time", t)
+                        if event is not None:
+                            event.rows += len(rows)
+                        yield rows
+                        # 不计入调用方处理每批数据的时间
+                        t = _clock(event)
+                finally:
+                    # 关闭无缓冲游标会读完剩余的行; 事务外提前结束时由连接池直接丢弃连接
+                    if exhausted or in_transaction:
+                        cursor.close()
+        except Exception as e:
+            failed = True
+            _fail(event, e)
+            raise
         finally:
-            close_connection()
-        return results
+            _finish_replica(replica)
+            # 调用方提前结束迭代时也视为成功
+            if event is not None and not failed:
+                _end(event)
 
     @staticmethod
     def execute(stmt: Statement, db_name: str = "default") -> int:
         """执行更新语句，返回受影响的行数"""
+        event = _begin("execute", stmt, db_name)
         try:
-            conn = get_connection(db_name=db_name)
-            cursor: DictCursor = conn.cursor(DictCursor)
-            sql = stmt.get_sql()
-            args = stmt.get_args()
-            logging.debug(f"Executing SQL: {sql}, Args: {args}")
-            affected = cursor.execute(sql, args)
-            cursor.close()
-            return affected
-        finally:
-            close_connection()
+            t = _clock(event)
+            with checkout(db_name) as conn:
+                t = _lap(event, "acquire_time", t)
+                cursor: DictCursor = conn.cursor(DictCursor)
+                affected = cursor.execute(stmt.get_sql(), stmt.get_args())
+                _lap(event, "execute_time", t)
+                cursor.close()
+        except Exception as e:
+            _fail(event, e)
+            raise
+        _written(db_name, stmt)
+        if event is not None:
+            event.affected = affected
+            _end(event)
+        return affected
 
     @staticmethod
     def execute_many(stmt: Statement, db_name: str = "default") -> int:
         """执行批量更新或插入语句，返回受影响的行数"""
+        event = _begin("execute_many", stmt, db_name)
         try:
-            conn = get_connection(db_name=db_name)
-            cursor: DictCursor = conn.cursor(DictCursor)
-            sql = stmt.get_sql()
-            args = stmt.get_args()
-            logging.debug(f"Executing SQL: {sql}, Args: {args}")
-            affected = cursor.executemany(sql, args)
-            cursor.close()
-            return affected or 0
-        finally:
-            close_connection()
+            t = _clock(event)
+            with checkout(db_name) as conn:
+                t = _lap(event, "acquire_time", t)
+                cursor: DictCursor = conn.cursor(DictCursor)
+                affected = cursor.executemany(stmt.get_sql(), stmt.get_args()) or 0
+                _lap(event, "execute_time", t)
+                cursor.close()
+        except Exception as e:
+            _fail(event, e)
+            raise
+        _written(db_name, stmt)
+        if event is not None:
+            event.affected = affected
+            _end(event)
+        return affected
 
     @staticmethod
     def insert(stmt: Statement, db_name: str = "default") -> int:
         """执行 INSERT 语句，返回新增记录的自增主键 ID"""
+        event = _begin("insert", stmt, db_name)
+        try:
+            t = _clock(event)
+            with checkout(db_name) as conn:
+                t = _lap(event, "acquire_time", t)
+                cursor: DictCursor = conn.cursor(DictCursor)
+                affected = cursor.execute(stmt.get_sql(), stmt.get_args())
+                _lap(event, "execute_time", t)
+                last_id = cursor.lastrowid  # 获取最后插入的 ID
+                cursor.close()
+        except Exception as e:
+            _fail(event, e)
+            raise
+        _written(db_name, stmt)
+        if event is not None:
+            event.affected = affected
+            _end(event)
+        return last_id
+
+    @staticmethod
+    def insert_bulk(stmt: Statement, db_name: str = "default") -> Tuple[int, int, int]:
+        """
+        执行多行 INSERT 语句，返回首个自增主键 ID、受影响的行数和会话的 auto_increment_increment
+
+        auto_increment_increment 按连接缓存，每个连接只在首次批量插入时查询一次。
+        """
+        event = _begin("insert", stmt, db_name)
         try:
-            conn = get_connection(db_name=db_name)
+            t = _clock(event)
+            with checkout(db_name) as conn:
+                t = _lap(event, "acquire_time", t)
+                cursor: DictCursor = conn.cursor(DictCursor)
+                affected = cursor.execute(stmt.get_sql(), stmt.get_args())
+                first_id = cursor.lastrowid  # 多行插入时为第一行的 ID
+                increment = _auto_increment_increment.get(conn)
+                if increment is None:
+                    cursor.execute("SELECT @@auto_increment_increment AS increment")
+                    increment = _auto_increment_increment[conn] = int(cursor.fetchone()["increment"])
+                _lap(event, "execute_time", t)
+                cursor.close()
+        except Exception as e:
+            _fail(event, e)
+            raise
+        _written(db_name, stmt)
+        if event is not None:
+            event.affected = affected
+            _end(event)
+        return first_id, affected, increment
+
+    @staticmethod
+    def gather(*stmts: Statement, db_name: str = "default") -> List[Tuple[Dict[str, Any], ...]]:
+        """并发执行互不依赖的查询语句，每条语句使用各自的连接，按传入顺序返回结果；参见 tee.parallel"""
+        from .parallel import parallel
+
+        return parallel(*(functools.partial(Executor.select, stmt, db_name) for stmt in stmts))
+
+    @staticmethod
+    def max_allowed_packet(db_name: str = "default") -> int:
+        """获取服务端的 max_allowed_packet，结果按数据库配置缓存"""
+        database = get_db(db_name)
+        size = _max_allowed_packet.get(database)
+        if size is None:
+            rows = Executor.select(Statement("SELECT @@max_allowed_packet AS max_allowed_packet"), db_name)
+            size = int(rows[0]["max_allowed_packet"])
+            _max_allowed_packet[database] = size
+        return size
+
+
+def _select(stmt: Statement, db_name: str) -> Tuple[Dict[str, Any], ...]:
+    event = _begin("select", stmt, db_name)
+    replica = _start_replica(db_name)
+    try:
+        t = _clock(event)
+        with checkout(db_name) as conn:
+            t = _lap(event, "acquire_time", t)
             cursor: DictCursor = conn.cursor(DictCursor)
-            sql = stmt.get_sql()
-            args = stmt.get_args()
-            logging.debug(f"Executing SQL: {sql}, Args: {args}")
-            cursor.execute(sql, args)
-            last_id = cursor.lastrowid  # 获取最后插入的 ID
+            cursor.execute(stmt.get_sql(), stmt.get_args())
+            t = _lap(event, "execute_time", t)
+            results = cursor.fetchall()
+            _lap(event, "fetch_time", t)
             cursor.close()
-            return last_id
-        finally:
-            close_connection()
+    except Exception as e:
+        _fail(event, e)
+        raise
+    finally:
+        _finish_replica(replica)
+    if event is not None:
+        event.rows = len(results)
+        _end(event)
+    return results
+
+
+def _select_rows(stmt: Statement, db_name: str, decoder: Callable[[Tuple[Any, ...]], Any] | None) -> Sequence[Any]:
+    event = _begin("select", stmt, db_name)
+    replica = _start_replica(db_name)
+    try:
+        t = _clock(event)
+        with checkout(db_name) as conn:
+            t = _lap(event, "acquire_time", t)
+            cursor: Cursor = conn.cursor(Cursor)
+            cursor.execute(stmt.get_sql(), stmt.get_args())
+            t = _lap(event, "execute_time", t)
+            results: Sequence[Any] = cursor.fetchall()
+            t = _lap(event, "fetch_time", t)
+            cursor.close()
+        _finish_replica(replica)
+        replica = None
+        # 连接归还后再解码
+        if decoder is not None:
+            results = list(map(decoder, results))
+            _lap(event, "hydrate_time", t)
+    except Exception as e:
+        _fail(event, e)
+        raise
+    finally:
+        _finish_replica(replica)
+    if event is not None:
+        event.rows = len(results)
+        _end(event)
+    return results
+
+
+def _start_replica(db_name: str) -> Tuple[Replica, float] | None:
+    """副本上的查询计入正在执行的查询数和延迟，供负载均衡策略使用"""
+    replica = get_replica(db_name)
+    if replica is None:
+        return None
+    replica.start()
+    return replica, time.perf_counter()
+
+
+def _finish_replica(started: Tuple[Replica, float] | None) -> None:
+    if started is not None:
+        started[0].finish(time.perf_counter() - started[1])
+
+
+def _written(db_name: str, stmt: Statement) -> None:
+    """写操作成功后使相关缓存失效，并记录写入时间(读己之写窗口、不合并写入前开始的查询)"""
+    invalidate_tables(db_name, stmt.tables)
+    record_write(db_name)
+    if is_in_transaction():
+        # 提交前开始的查询读不到事务中的写入，提交时再记录一次
+        on_commit(functools.partial(record_write, db_name))
+
+
+def _flight_key(kind: str, stmt: Statement, db_name: str) -> Hashable:
+    return kind, db_name, stmt.get_sql(), _freeze(stmt.get_args())
+
+
+def _begin(kind: str, stmt: Statement, db_name: str) -> QueryEvent | None:
+    """记录调试日志；注册了钩子时创建事件并调用 before，否则返回 None"""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Executing SQL: %s, Args: %s", stmt.get_sql(), stmt.get_args())
+    hooks = get_hooks()
+    if not hooks:
+        return None
+    event = QueryEvent(kind, stmt, db_name)
+    for hook in hooks:
+        _call_hook(hook.before, event)
+    return event
+
+
+def _end(event: QueryEvent) -> None:
+    for hook in get_hooks():
+        _call_hook(hook.after, event)
+
+
+def _fail(event: QueryEvent | None, error: Exception) -> None:
+    if event is None:
+        return
+    event.error = error
+    for hook in get_hooks():
+        _call_hook(hook.error, event)
+
+
+def _call_hook(callback: Callable[[QueryEvent], None], event: QueryEvent) -> None:
+    # 钩子抛出的异常只记录日志，不影响语句执行
+    try:
+        callback(event)
+    except Exception:
+        logger.exception("Query hook %r failed", callback)
+
+
+def _clock(event: QueryEvent | None) -> float:
+    return time.perf_counter() if event is not None else 0.0
+
+
+def _lap(event: QueryEvent | None, phase: str, start: float) -> float:
+    """将 start 到现在的耗时累加到事件的 phase 阶段，返回当前时间"""
+    if event is None:
+        return 0.0
+    now = time.perf_counter()
+    setattr(event, phase, getattr(event, phase) + now - start)
+    return now
@@ -2,15 +2,65 @@ import decimal
 from typing import Any, Optional, Type, Union, overload
 
 
+class _Unset:
+    """紧凑模型中未赋值字段的占位符"""
+
+    def __repr__(self) -> str:
+        return "UNSET"
+
+
+UNSET: Any = _Unset()
+
+# 尚未保存到数据库的新实例的状态标记，新实例不记录修改
+NEW: Any = object()
+
+
 class Field:
-    def __init__(self, type: str):
+    def __init__(self, type: str, primary_key: bool = False):
         self.name: str = ""  # 字段名，稍后由元类设置
         self._type = type
+        self.primary_key = primary_key
+        self._index = -1  # 紧凑模型中的存储位置，由元类设置
+        self.model: Any = None  # 字段所属的模型，由元类设置
+
+    def _get_value(self, instance: Any) -> Any:
+        """从实例读取字段值，紧凑模型按位置读取"""
+        if self._index >= 0:
+            value = instance._row[self._index]
+            return None if value is UNSET else value
+        if not hasattr(instance, "_values"):
+            return None
+        return instance._values.get(self.name, None)
+
+    def _set_value(self, instance: Any, value: Any) -> None:
+        """向实例写入字段值，紧凑模型按位置写入"""
+        if instance is None:
+            raise ValueError("Instance cannot be None when setting a value.")
+        # 已加载的实例在字段首次修改时记录原值
+        original = getattr(instance, "_original", None)
+        if original is not NEW:
+            if original is None:
+                original = instance._original = {}
+            if self.name not in original:
+                original[self.name] = self._raw_value(instance)
+        if self._index >= 0:
+            instance._row[self._index] = value
+            return
+        if not hasattr(instance, "_values"):
+            instance._values = {}
+        instance._values[self.name] = value
+
+    def _raw_value(self, instance: Any) -> Any:
+        """读取字段值，未赋值时返回 UNSET"""
+        if self._index >= 0:
+            return instance._row[self._index]
+        values = getattr(instance, "_values", None)
+        return UNSET if values is None else values.get(self.name, UNSET)
 
 
 class Str(Field):
-    def __init__(self):
-        super().__init__("str")
+    def __init__(self, primary_key: bool = False):
+        super().__init__("str", primary_key)
 
     @overload
     def __get__(self, instance: None, owner: Optional[Type] = None) -> "Str": ...
@@ -22,23 +72,17 @@ class Str(Field):
         """描述符协议：获取字段值"""
         if instance is None:
             return self
-        if not hasattr(instance, "_values"):
-            return None
-        value: Optional[str] = instance._values.get(self.name, None)
+        value: Optional[str] = self._get_value(instance)
         return value
 
     def __set__(self, instance: Any, value: Optional[str]) -> None:
         """描述符协议：设置字段值"""
-        if instance is None:
-            raise ValueError("Instance cannot be None when setting a value.")
-        if not hasattr(instance, "_values"):
-            instance._values = {}
-        instance._values[self.name] = value
+        self._set_value(instance, value)
 
 
 class Int(Field):
-    def __init__(self):
-        super().__init__("int")
+    def __init__(self, primary_key: bool = False):
+        super().__init__("int", primary_key)
 
     @overload
     def __get__(self, instance: None, owner: Optional[Type] = None) -> "Int": ...
@@ -50,23 +94,17 @@ class Int(Field):
         """描述符协议：获取字段值"""
         if instance is None:
             return self
-        if not hasattr(instance, "_values"):
-            return None
-        value: Optional[int] = instance._values.get(self.name, None)
+        value: Optional[int] = self._get_value(instance)
         return value
 
     def __set__(self, instance: Any, value: Optional[int]) -> None:
         """描述符协议：设置字段值"""
-        if instance is None:
-            raise ValueError("Instance cannot be None when setting a value.")
-        if not hasattr(instance, "_values"):
-            instance._values = {}
-        instance._values[self.name] = value
+        self._set_value(instance, value)
 
 
 class Decimal(Field):
-    def __init__(self):
-        super().__init__("decimal")
+    def __init__(self, primary_key: bool = False):
+        super().__init__("decimal", primary_key)
 
     @overload
     def __get__(self, instance: None, owner: Optional[Type] = None) -> "Decimal": ...
@@ -78,23 +116,17 @@ class Decimal(Field):
         """描述符协议：获取字段值"""
         if instance is None:
             return self
-        if not hasattr(instance, "_values"):
-            return None
-        value: Optional[decimal.Decimal] = instance._values.get(self.name, None)
+        value: Optional[decimal.Decimal] = self._get_value(instance)
         return value
 
     def __set__(self, instance: Any, value: Optional[decimal.Decimal]) -> None:
         """描述符协议：设置字段值"""
-        if instance is None:
-            raise ValueError("Instance cannot be None when setting a value.")
-        if not hasattr(instance, "_values"):
-            instance._values = {}
-        instance._values[self.name] = decimal.Decimal(value) if value is not None else None
+        self._set_value(instance, decimal.Decimal(value) if value is not None else None)
 
 
 class Float(Field):
-    def __init__(self):
-        super().__init__("float")
+    def __init__(self, primary_key: bool = False):
+        super().__init__("float", primary_key)
 
     @overload
     def __get__(self, instance: None, owner: Optional[Type] = None) -> "Float": ...
@@ -106,23 +138,17 @@ class Float(Field):
         """描述符协议：获取字段值"""
         if instance is None:
             return self
-        if not hasattr(instance, "_values"):
-            return None
-        value: Optional[float] = instance._values.get(self.name, None)
+        value: Optional[float] = self._get_value(instance)
         return value
 
     def __set__(self, instance: Any, value: Optional[float]) -> None:
         """描述符协议：设置字段值"""
-        if instance is None:
-            raise ValueError("Instance cannot be None when setting a value.")
-        if not hasattr(instance, "_values"):
-            instance._values = {}
-        instance._values[self.name] = float(value) if value is not None else None
+        self._set_value(instance, float(value) if value is not None else None)
 
 
 class DateTime(Field):  # 假设 DateTime 存储为字符串
-    def __init__(self):
-        super().__init__("datetime")
+    def __init__(self, primary_key: bool = False):
+        super().__init__("datetime", primary_key)
 
     @overload
     def __get__(self, instance: None, owner: Optional[Type] = None) -> "DateTime": ...
@@ -134,15 +160,9 @@ class DateTime(Field):  # 假设 DateTime 存储为字符串
         """描述符协议：获取字段值"""
         if instance is None:
             return self
-        if not hasattr(instance, "_values"):
-            return None
-        value: Optional[str] = instance._values.get(self.name, None)
+        value: Optional[str] = self._get_value(instance)
         return value
 
     def __set__(self, instance: Any, value: Optional[str]) -> None:
         """描述符协议：设置字段值"""
-        if instance is None:
-            raise ValueError("Instance cannot be None when setting a value.")
-        if not hasattr(instance, "_values"):
-            instance._values = {}
-        instance._values[self.name] = value
+        self._set_value(instance, value)
@@ -0,0 +1,86 @@
+import threading
+from typing import Any, Tuple
+
+from .statement import Statement
+
+
+class QueryEvent:
+    """
+    一次语句执行的事件，记录各阶段耗时(秒)和结果行数
+
+    build_time: 构建 SQL；acquire_time: 借出连接；execute_time: 发送语句并等待服务端响应；
+    fetch_time: 读取结果；hydrate_time: 将结果行解码为模型对象。
+    """
+
+    __slots__ = (
+        "kind",
+        "db_name",
+        "sql",
+        "args",
+        "build_time",
+        "acquire_time",
+        "execute_time",
+        "fetch_time",
+        "hydrate_time",
+        "rows",
+        "affected",
+        "error",
+        "context",
+    )
+
+    def __init__(self, kind: str, stmt: Statement, db_name: str):
+        self.kind = kind  # select / stream / execute / execute_many / insert
+        self.db_name = db_name
+        self.sql = stmt.get_sql()
+        self.args = stmt.get_args()
+        self.build_time = stmt.build_time
+        self.acquire_time = 0.0
+        self.execute_time = 0.0
+        self.fetch_time = 0.0
+        self.hydrate_time = 0.0
+        self.rows = 0  # 返回的行数
+        self.affected = 0  # 受影响的行数
+        self.error: BaseException | None = None
+        self.context: Any = None  # 供钩子在 before/after 之间保存状态
+
+    @property
+    def total_time(self) -> float:
+        return self.build_time + self.acquire_time + self.execute_time + self.fetch_time + self.hydrate_time
+
+
+class QueryHook:
+    """查询钩子基类，按需重写 before/after/error"""
+
+    def before(self, event: QueryEvent) -> None:
+        """语句执行前调用"""
+
+    def after(self, event: QueryEvent) -> None:
+        """语句执行成功后调用"""
+
+    def error(self, event: QueryEvent) -> None:
+        """语句执行失败后调用，event.error 为异常对象"""
+
+
+# 写时复制，执行路径上只读取元组
+_hooks: Tuple[QueryHook, ...] = ()
+_hooks_lock = threading.Lock()
+
+
+def add_hook(hook: QueryHook) -> QueryHook:
+    """注册查询钩子"""
+    global _hooks
+    with _hooks_lock:
+        if hook not in _hooks:
+            _hooks = _hooks + (hook,)
+    return hook
+
+
+def remove_hook(hook: QueryHook) -> None:
+    """移除查询钩子"""
+    global _hooks
+    with _hooks_lock:
+        _hooks = tuple(h for h in _hooks if h is not hook)
+
+
+def get_hooks() -> Tuple[QueryHook, ...]:
+    return _hooks
@@ -1,25 +1,40 @@
-from typing import Any, Dict, Generic, List, Literal, Tuple, Type, TypeVar
+import copy
+import datetime
+import decimal
+import time
+from contextlib import nullcontext
+from typing import Any, Dict, Generic, Iterable, Iterator, List, Literal, Tuple, Type, TypeVar
 
+from .aio import AsyncExecutor
+from .connection import is_in_transaction, transaction
+from .entity_cache import invalidate_entities
 from .executor import Executor
 from .model import Model
+from .sharding import group_rows, shard_of
 from .statement import Statement
 from .where import Where
 
 # 将 T 的约束修改为 Model 的子类
 M = TypeVar("M", bound=Model)
 
+# 按估算大小分块时只使用 max_allowed_packet 的一部分，为转义和协议头留出余量
+PACKET_BUDGET_RATIO = 0.75
+
 
 class Insert(Generic[M]):
 
     def __init__(self, model: Type[M]):
         self._model = model
         self._where = Where()
+        # 分片模型按分片键路由后的数据库
+        self._database: str | None = None
 
     def execute(
         self,
         data: Dict[str, Any] | M,
         duplicate_key_update: List[str] | Literal["all"] | None = None,
     ) -> int:
+        start = time.perf_counter()
         fields: List[str] = []
         args: Tuple[Any, ...] = ()
         placeholder: List[str] = []
@@ -27,6 +42,7 @@ class Insert(Generic[M]):
 
         if isinstance(data, Model):
             data = data.to_dict()
+        db_name = self._database or ("default" if self._model._shards is None else shard_of(self._model, data))
 
         for k, v in data.items():
             if k in field_names:
@@ -39,40 +55,213 @@ class Insert(Generic[M]):
 
         table_name = self._model.get_table_name()
         sql = f'INSERT INTO {table_name}({",".join(fields)}) VALUES({",".join(placeholder)})'
+        sql += _duplicate_key_update_sql(fields, duplicate_key_update)
 
-        if duplicate_key_update is not None:
-            if isinstance(duplicate_key_update, str) and duplicate_key_update == "all":
-                sql += f' ON DUPLICATE KEY UPDATE {",".join([f"{k}=VALUES({k})" for k in fields])}'
-            elif len(duplicate_key_update) > 0:
-                sql += f' ON DUPLICATE KEY UPDATE {",".join([f"{k}=VALUES({k})" for k in duplicate_key_update])}'
+        stmt = Statement(sql, args, time.perf_counter() - start, (table_name,))
+        last_id = Executor.insert(stmt, db_name)
+        if duplicate_key_update:
+            # ON DUPLICATE KEY UPDATE 可能修改已有的行
+            invalidate_entities(self._model, None)
+        return last_id
 
-        stmt = Statement(sql, args)
-        return Executor.insert(stmt)
+    async def aexecute(
+        self,
+        data: Dict[str, Any] | M,
+        duplicate_key_update: List[str] | Literal["all"] | None = None,
+    ) -> int:
+        """异步版本的 execute()，在线程池中执行，不阻塞事件循环"""
+        return await AsyncExecutor.run(self.execute, data, duplicate_key_update)
 
-    def execute_bulk(self, data_list: List[Dict[str, Any]]) -> int:
-        if len(data_list) == 0:
+    async def aexecute_bulk(self, data_list: Iterable[Dict[str, Any] | M], **options: Any) -> int:
+        """异步版本的 execute_bulk()，参数相同"""
+        return await AsyncExecutor.run(self.execute_bulk, data_list, **options)
+
+    def execute_bulk(
+        self,
+        data_list: Iterable[Dict[str, Any] | M],
+        duplicate_key_update: List[str] | Literal["all"] | None = None,
+        batch_size: int = 1000,
+        max_packet_size: int | None = None,
+        atomic: bool = False,
+    ) -> int:
+        """
+        批量插入，生成多行 INSERT ... VALUES (...),(...) 语句，返回受影响的行数
+
+        data_list 可以是字典或模型对象的任意可迭代对象，按需读取，不会一次性构建全部参数。
+        每条语句最多 batch_size 行，且估算大小不超过 max_packet_size(默认读取服务端 max_allowed_packet)。
+        atomic 为 True 时所有语句在同一个事务中执行。分片模型按分片键分组后写入各分片，atomic 的写入不能跨分片。
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        if self._model._shards is not None and self._database is None:
+            items = list(data_list)
+            groups = group_rows(self._model, items, atomic)
+            return sum(
+                self._on(db_name).execute_bulk(
+                    [items[i] for i in indexes], duplicate_key_update, batch_size, max_packet_size, atomic
+                )
+                for db_name, indexes in groups.items()
+            )
+
+        db_name = self._database or "default"
+        rows = iter(data_list)
+        first = next(rows, None)
+        if first is None:
             return 0
+        first_data = first.to_dict() if isinstance(first, Model) else first
 
-        fields: List[str] = []
-        placeholder: List[str] = []
         field_names = self._model.get_field_names()
-        for k in data_list[0].keys():
-            if k in field_names:
-                fields.append(k)
-                placeholder.append("%s")
+        fields = [k for k in first_data.keys() if k in field_names]
+        if len(fields) == 0:
+            raise ValueError("no valid field found")
+
+        with transaction(db_name) if atomic and not is_in_transaction() else nullcontext():
+            if max_packet_size is None:
+                max_packet_size = Executor.max_allowed_packet(db_name)
+            affected = 0
+            for stmt, _ in self._bulk_statements(
+                fields, first, first_data, rows, duplicate_key_update, batch_size, max_packet_size
+            ):
+                affected += Executor.execute(stmt, db_name)
+                if duplicate_key_update:
+                    invalidate_entities(self._model, None)
+            return affected
+
+    def execute_bulk_with_ids(
+        self,
+        data_list: Iterable[Dict[str, Any] | M],
+        batch_size: int = 1000,
+        max_packet_size: int | None = None,
+        atomic: bool = False,
+    ) -> List[int]:
+        """
+        批量插入并返回每行生成的自增主键，传入的模型对象会被回填主键
 
+        每条多行 INSERT 的主键由首个插入 ID、行数和会话的 auto_increment_increment 推算；
+        InnoDB 为行数已知的简单 INSERT 一次性分配连续的自增值。
+        为保证推算可靠，数据中不能带主键值，也不支持 ON DUPLICATE KEY UPDATE；
+        数据按需读取，遇到带主键值的行时已执行的批次不会撤销，需要时使用 atomic=True。
+        分片模型按分片键分组写入各分片，返回的主键与传入的顺序一致。
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        if self._model._shards is not None and self._database is None:
+            items = list(data_list)
+            shard_ids = [0] * len(items)
+            for db_name, indexes in group_rows(self._model, items, atomic).items():
+                generated = self._on(db_name).execute_bulk_with_ids(
+                    [items[i] for i in indexes], batch_size, max_packet_size, atomic
+                )
+                for index, generated_id in zip(indexes, generated):
+                    shard_ids[index] = generated_id
+            return shard_ids
+
+        db_name = self._database or "default"
+        primary_key = self._model.get_primary_key()
+        rows = iter(data_list)
+        first = next(rows, None)
+        if first is None:
+            return []
+        first_data = first.to_dict() if isinstance(first, Model) else first
+
+        field_names = self._model.get_field_names()
+        fields = [k for k in first_data.keys() if k in field_names and k != primary_key]
         if len(fields) == 0:
             raise ValueError("no valid field found")
 
+        ids: List[int] = []
+        with transaction(db_name) if atomic and not is_in_transaction() else nullcontext():
+            if max_packet_size is None:
+                max_packet_size = Executor.max_allowed_packet(db_name)
+            for stmt, items in self._bulk_statements(
+                fields, first, first_data, rows, None, batch_size, max_packet_size, primary_key
+            ):
+                first_id, affected, increment = Executor.insert_bulk(stmt, db_name)
+                if affected != len(items) or not first_id or increment < 1:
+                    raise ValueError(
+                        f"cannot derive generated ids: inserted {affected} of {len(items)} rows, "
+                        f"first id {first_id}, auto_increment_increment {increment}"
+                    )
+                for i, item in enumerate(items):
+                    generated_id = first_id + i * increment
+                    if isinstance(item, Model):
+                        setattr(item, primary_key, generated_id)
+                    ids.append(generated_id)
+        return ids
+
+    def _on(self, db_name: str) -> "Insert[M]":
+        """路由到指定分片的副本"""
+        shard = copy.copy(self)
+        shard._database = db_name
+        return shard
+
+    def _bulk_statements(
+        self,
+        fields: List[str],
+        first: Dict[str, Any] | M,
+        first_data: Dict[str, Any],
+        rows: Iterator[Dict[str, Any] | M],
+        duplicate_key_update: List[str] | Literal["all"] | None,
+        batch_size: int,
+        max_packet_size: int,
+        forbidden_key: str | None = None,
+    ) -> Iterator[Tuple[Statement, List[Dict[str, Any] | M]]]:
+        """按行数和估算大小切分批量插入，同时返回每条语句对应的原始数据"""
         table_name = self._model.get_table_name()
-        sql = f'INSERT INTO {table_name}({",".join(fields)}) VALUES({",".join(placeholder)})'
+        prefix = f'INSERT INTO {table_name}({",".join(fields)}) VALUES'
+        suffix = _duplicate_key_update_sql(fields, duplicate_key_update)
+        row_placeholder = f'({",".join(["%s"] * len(fields))})'
+        budget = int(max_packet_size * PACKET_BUDGET_RATIO) - len(prefix) - len(suffix)
+
+        args: List[Any] = []
+        items: List[Dict[str, Any] | M] = []
+        size = 0
+        start = time.perf_counter()
+        item: Dict[str, Any] | M | None = first
+        data: Dict[str, Any] | None = first_data
+        while item is not None and data is not None:
+            if forbidden_key is not None and data.get(forbidden_key) is not None:
+                raise ValueError(f"rows must not carry a value for {forbidden_key} when ids are generated")
+            values = [data.get(k) for k in fields]
+            row_size = len(row_placeholder) + sum(_estimate_size(v) for v in values)
+            if items and (len(items) >= batch_size or size + row_size > budget):
+                sql = prefix + ",".join([row_placeholder] * len(items)) + suffix
+                yield Statement(sql, tuple(args), time.perf_counter() - start, (table_name,)), items
+                args = []
+                items = []
+                size = 0
+                start = time.perf_counter()
+            args.extend(values)
+            items.append(item)
+            size += row_size
+
+            item = next(rows, None)
+            data = item.to_dict() if isinstance(item, Model) else item
+
+        sql = prefix + ",".join([row_placeholder] * len(items)) + suffix
+        yield Statement(sql, tuple(args), time.perf_counter() - start, (table_name,)), items
+
+
+def _duplicate_key_update_sql(fields: List[str], duplicate_key_update: List[str] | Literal["all"] | None) -> str:
+    if duplicate_key_update is None:
+        return ""
+    if isinstance(duplicate_key_update, str) and duplicate_key_update == "all":
+        return f' ON DUPLICATE KEY UPDATE {",".join([f"{k}=VALUES({k})" for k in fields])}'
+    if len(duplicate_key_update) > 0:
+        return f' ON DUPLICATE KEY UPDATE {",".join([f"{k}=VALUES({k})" for k in duplicate_key_update])}'
+    return ""
 
-        args = ()
-        for data in data_list:
-            arg: Tuple[Any, ...] = ()
-            for k in fields:
-                arg += (data.get(k),)
-            args += (arg,)
 
-        stmt = Statement(sql, args)
-        return Executor.execute_many(stmt)
+def _estimate_size(value: Any) -> int:
+    """估算参数转义为 SQL 字面量后的字节数"""
+    if value is None:
+        return 4
+    if isinstance(value, str):
+        return (len(value) if value.isascii() else len(value.encode("utf-8"))) + 2
+    if isinstance(value, (bytes, bytearray)):
+        return len(value) + 10
+    if isinstance(value, (bool, int, float, decimal.Decimal)):
+        return 24
+    if isinstance(value, (datetime.date, datetime.time, datetime.timedelta)):
+        return 28
+    return len(str(value)) + 2
@@ -0,0 +1,188 @@
+import asyncio
+from typing import Any, Dict, Generic, Hashable, List, Sequence, Tuple, Type, TypeVar
+
+from .aio import AsyncExecutor
+from .fields import Field
+from .model import Model
+from .relations import fetch_by_keys
+
+M = TypeVar("M", bound=Model)
+T = TypeVar("T")
+
+# 分组键：(模型, 键字段名)
+_Group = Tuple[Type[Model], Tuple[str, ...]]
+
+
+class Deferred(Generic[T]):
+    """Loader 返回的延迟结果，首次 get() 时批量查询当前收集到的所有键"""
+
+    __slots__ = ("_loader", "_value", "_done")
+
+    def __init__(self, loader: "Loader") -> None:
+        self._loader = loader
+        self._value: Any = None
+        self._done = False
+
+    def get(self) -> T:
+        if not self._done:
+            self._loader.dispatch()
+        return self._value
+
+    def _resolve(self, value: Any) -> None:
+        self._value = value
+        self._done = True
+
+
+class _LoaderBase:
+    def __init__(self, max_batch_size: int = 1000):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be positive")
+        self.max_batch_size = max_batch_size
+        # 作用域内已加载的结果：分组 -> 键 -> 记录列表
+        self._loaded: Dict[_Group, Dict[Hashable, List[Model]]] = {}
+
+    def _group(self, model: Type[Model], by: Field | Sequence[Field] | None) -> _Group:
+        if by is None:
+            return model, (model.get_primary_key(),)
+        if isinstance(by, Field):
+            return model, (by.name,)
+        if not by:
+            raise ValueError("by must contain at least one field")
+        return model, tuple(field.name for field in by)
+
+    def _fetch(self, group: _Group, keys: List[Hashable]) -> Dict[Hashable, List[Model]]:
+        """按 max_batch_size 切分键，每批一条 IN 查询，结果按键分组"""
+        results = fetch_by_keys(group[0], group[1], keys, self.max_batch_size)
+        self._loaded.setdefault(group, {}).update(results)
+        return results
+
+
+class Loader(_LoaderBase):
+    """
+    批量加载器，消除循环中逐条查询的 N+1 问题
+
+    作用域内 load() 只收集键，首次取值时每个模型只发出一条 IN 查询(按 max_batch_size 切分)，
+    键会去重，同一作用域内重复加载的键直接返回已加载的结果：
+        with Loader() as loader:
+            authors = [loader.load(User, post.user_id) for post in posts]
+            for post, author in zip(posts, authors):
+                print(post.title, author.get().name)
+
+    by 指定按哪些字段加载，默认为主键；多个字段时键为元组，使用 (a, b) IN (...) 查询。
+    """
+
+    def __init__(self, max_batch_size: int = 1000):
+        super().__init__(max_batch_size)
+        self._pending: Dict[_Group, Dict[Hashable, List[Tuple[Deferred, bool]]]] = {}
+
+    def __enter__(self) -> "Loader":
+        return self
+
+    def __exit__(self, exc_type: Any, exc_val: Any, exc_tb: Any) -> None:
+        if exc_type is None:
+            self.dispatch()
+
+    def load(self, model: Type[M], key: Any, by: Field | Sequence[Field] | None = None) -> Deferred[M | None]:
+        """按键加载一条记录，不存在时结果为 None"""
+        return self._enqueue(model, key, by, many=False)
+
+    def load_all(self, model: Type[M], key: Any, by: Field | Sequence[Field] | None = None) -> Deferred[List[M]]:
+        """按键加载所有匹配的记录(一对多)"""
+        return self._enqueue(model, key, by, many=True)
+
+    def dispatch(self) -> None:
+        """立即查询所有收集到的键"""
+        while self._pending:
+            group, waiters = self._pending.popitem()
+            try:
+                results = self._fetch(group, list(waiters))
+            except Exception:
+                # 保留未完成的键，下次取值时重新查询
+                self._pending[group] = waiters
+                raise
+            for key, deferreds in waiters.items():
+                for deferred, many in deferreds:
+                    deferred._resolve(_result(results.get(key, []), many))
+
+    def _enqueue(self, model: Type[Model], key: Any, by: Field | Sequence[Field] | None, many: bool) -> Deferred:
+        group = self._group(model, by)
+        key = _normalize_key(key, group)
+        deferred: Deferred = Deferred(self)
+        loaded = self._loaded.get(group)
+        if loaded is not None and key in loaded:
+            deferred._resolve(_result(loaded[key], many))
+        else:
+            self._pending.setdefault(group, {}).setdefault(key, []).append((deferred, many))
+        return deferred
+
+
+class AsyncLoader(_LoaderBase):
+    """
+    异步批量加载器，同一个事件循环轮次内 load() 的键合并为一次查询，查询在线程池中执行：
+        loader = AsyncLoader()
+        authors = await asyncio.gather(*(loader.load(User, post.user_id) for post in posts))
+    """
+
+    def __init__(self, max_batch_size: int = 1000):
+        super().__init__(max_batch_size)
+        self._pending: Dict[_Group, Dict[Hashable, List[Tuple[asyncio.Future, bool]]]] = {}
+        self._task: "asyncio.Task[None] | None" = None
+
+    def load(self, model: Type[M], key: Any, by: Field | Sequence[Field] | None = None) -> "asyncio.Future[M | None]":
+        """按键加载一条记录，不存在时结果为 None"""
+        return self._enqueue(model, key, by, many=False)
+
+    def load_all(
+        self, model: Type[M], key: Any, by: Field | Sequence[Field] | None = None
+    ) -> "asyncio.Future[List[M]]":
+        """按键加载所有匹配的记录(一对多)"""
+        return self._enqueue(model, key, by, many=True)
+
+    def _enqueue(
+        self, model: Type[Model], key: Any, by: Field | Sequence[Field] | None, many: bool
+    ) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        group = self._group(model, by)
+        key = _normalize_key(key, group)
+        future = loop.create_future()
+        loaded = self._loaded.get(group)
+        if loaded is not None and key in loaded:
+            future.set_result(_result(loaded[key], many))
+            return future
+        self._pending.setdefault(group, {}).setdefault(key, []).append((future, many))
+        if self._task is None:
+            # 任务在下一轮次才开始执行，同一轮次内的键会合并到一次查询
+            self._task = loop.create_task(self._dispatch())
+        return future
+
+    async def _dispatch(self) -> None:
+        pending, self._pending = self._pending, {}
+        self._task = None
+        for group, waiters in pending.items():
+            try:
+                results = await AsyncExecutor.run(self._fetch, group, list(waiters))
+            except Exception as e:
+                for futures in waiters.values():
+                    for future, _ in futures:
+                        if not future.done():
+                            future.set_exception(e)
+                continue
+            for key, futures in waiters.items():
+                for future, many in futures:
+                    if not future.done():
+                        future.set_result(_result(results.get(key, []), many))
+
+
+def _normalize_key(key: Any, group: _Group) -> Hashable:
+    """复合键统一为元组"""
+    if len(group[1]) == 1:
+        return key
+    if not isinstance(key, (tuple, list)) or len(key) != len(group[1]):
+        raise ValueError(f"key must be a tuple of {len(group[1])} values for fields {group[1]}")
+    return tuple(key)
+
+
+def _result(items: List[Model], many: bool) -> Any:
+    if many:
+        return list(items)
+    return items[0] if items else None
@@ -1,31 +1,104 @@
+import functools
 import json
 import re
-from typing import Any, Dict, List, Tuple, Type, TypeVar
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Tuple, Type, TypeVar
 
-from .fields import Field  # 确保 Field 类可用
+from .connection import on_rollback
+from .fields import NEW, UNSET, Field  # 确保 Field 类可用
+from .relations import Relation, register_model
+
+if TYPE_CHECKING:
+    from .sharding import ShardStrategy
 
 M = TypeVar("M", bound="Model")
 
 
+def _compact_values(self: Any) -> Dict[str, Any]:
+    """紧凑模型的字段字典视图，只包含已赋值的字段"""
+    return {name: value for name, value in zip(self._fields, self._row) if value is not UNSET}
+
+
 class ModelMeta(type):
-    def __new__(cls, name: str, bases: Tuple[type, ...], dct: Dict[str, Any]) -> type:
+    def __new__(
+        cls,
+        name: str,
+        bases: Tuple[type, ...],
+        dct: Dict[str, Any],
+        compact: bool = False,
+        shards: "ShardStrategy | None" = None,
+    ) -> type:
         # 遍历类属性，找到所有字段
         fields: Dict[str, Field] = {}
+        relations: Dict[str, Relation] = {}
+        primary_key: str | None = None
         for attr_name, attr_value in dct.items():
+            if isinstance(attr_value, Relation):
+                attr_value.name = attr_name
+                relations[attr_name] = attr_value
             if isinstance(attr_value, Field):
                 attr_value.name = attr_name  # 将字段名绑定到字段实例
                 fields[attr_name] = attr_value
+                if attr_value.primary_key:
+                    if primary_key is not None:
+                        raise TypeError(f"{name} declares more than one primary key field")
+                    primary_key = attr_name
+
+        # 未显式声明主键时，默认使用 id 字段
+        if primary_key is None and "id" in fields:
+            primary_key = "id"
+
+        # 分片模型：按分片键字段路由到不同的数据库
+        if shards is not None and shards.key not in fields:
+            raise TypeError(f"{name} shard key {shards.key!r} is not a field")
+        dct["_shards"] = shards
 
         # 存储字段信息到类中
         dct["_fields"] = fields
-        return super().__new__(cls, name, bases, dct)
+        dct["_primary_key"] = primary_key
+        dct["_relations"] = relations
+        # 表名默认为类名的 snake case，只计算一次
+        dct.setdefault("_table_name", re.sub(r"(?<!^)(?=[A-Z])", "_", name).lower())
+        # 按查询字段缓存的行解码函数
+        dct["_decoders"] = {}
+
+        # 紧凑模式：字段值按声明顺序存放在 __slots__ 中的列表里，实例没有 __dict__
+        if compact:
+            for index, field in enumerate(fields.values()):
+                field._index = index
+            # _original 记录修改前的值；有关联时额外保存已加载的关联记录
+            dct["__slots__"] = ("_row", "_original", "_related") if relations else ("_row", "_original")
+            dct["_values"] = property(_compact_values)
+        dct["_compact"] = compact
+        model = super().__new__(cls, name, bases, dct)
+        for field in fields.values():
+            field.model = model
+        for relation in relations.values():
+            relation.owner = model
+        register_model(model)
+        return model
 
 
 class Model(metaclass=ModelMeta):
+    # 子类默认拥有 __dict__，紧凑模型由元类生成 __slots__
+    __slots__ = ()
+
     # 类型注解：告诉类型检查器这个属性存在（由元类设置）
     _fields: Dict[str, Field] = {}
+    _primary_key: str | None = None
+    _relations: Dict[str, Relation] = {}
+    _table_name: str = ""
+    _decoders: Dict[Tuple[str, ...], Callable[[Tuple[Any, ...]], Any]] = {}
+    _compact: bool = False
+    _shards: "ShardStrategy | None" = None
+    # 持久化状态：None 表示从数据库加载且未修改，字典为修改过的字段的原值，NEW 表示尚未保存的新实例
+    _original: Any = None
 
     def __init__(self, **kwargs):
+        self._original = NEW
+        if self._compact:
+            self._row = [kwargs.get(field_name, UNSET) for field_name in self._fields]
+            return
+
         # 初始化字段值
         self._values: Dict[str, Any] = {}
 
@@ -72,6 +145,169 @@ class Model(metaclass=ModelMeta):
         """返回所有键值对"""
         return self._values.items()
 
+    def is_new(self) -> bool:
+        """是否为尚未保存的新实例"""
+        return getattr(self, "_original", None) is NEW
+
+    def get_changes(self) -> Dict[str, Any]:
+        """
+        返回需要保存的字段：字段名 -> 当前值
+
+        已加载的实例只包含值与加载时不同的字段(改回原值的不算修改)，主键排在最后；新实例包含所有已赋值的字段。
+        """
+        original = getattr(self, "_original", None)
+        if original is NEW:
+            return self.to_dict()
+        if not original:
+            return {}
+        changes: Dict[str, Any] = {}
+        for name, old in original.items():
+            value = self._fields[name]._raw_value(self)
+            if value is not old and value != old:
+                changes[name] = value
+        if self._primary_key in changes:
+            changes[self._primary_key] = changes.pop(self._primary_key)
+        return changes
+
+    def is_dirty(self) -> bool:
+        """是否有需要保存的修改"""
+        return bool(self.get_changes())
+
+    def save(self) -> int:
+        """
+        保存实例，返回影响的行数
+
+        新实例执行 INSERT 并回填自增主键；已加载的实例只 UPDATE 修改过的字段，没有修改时不执行 SQL。
+        """
+        cls = type(self)
+        if self.is_new():
+            last_id = cls.insert().execute(self.to_dict())
+            primary_key = cls._primary_key
+            generated = primary_key is not None and getattr(self, primary_key) is None and bool(last_id)
+            if generated:
+                setattr(self, primary_key, last_id)
+            self._mark_saved(generated)
+            return 1
+
+        changes = self.get_changes()
+        if not changes:
+            return 0
+        primary_key = cls.get_primary_key()
+        query = cls.update().set(changes).eq(cls._fields[primary_key], self._original_pk())
+        if cls._shards is not None:
+            # 按加载时的分片键定位分片
+            query.eq(cls._fields[cls._shards.key], self._shard_key())
+        affected = query.execute()
+        self._mark_saved()
+        return affected
+
+    async def asave(self) -> int:
+        """异步版本的 save()，在线程池中执行，不阻塞事件循环"""
+        from .aio import AsyncExecutor
+
+        return await AsyncExecutor.run(self.save)
+
+    @classmethod
+    def save_all(
+        cls,
+        models: Iterable["Model"],
+        batch_size: int = 1000,
+        max_packet_size: int | None = None,
+        atomic: bool = False,
+    ) -> int:
+        """
+        批量保存，返回影响的行数
+
+        已加载的实例按 (模型, 修改的字段) 分组，每组生成 UPDATE ... SET col = CASE 主键 ... END 语句；
+        新实例按 (模型, 已赋值的字段) 分组批量插入；没有修改的实例不执行 SQL。
+        每条语句最多 batch_size 行，且估算大小不超过 max_packet_size(默认读取服务端 max_allowed_packet)。
+        atomic 为 True 时所有语句在同一个事务中执行。
+        """
+        from .persistence import save_all
+
+        return save_all(models, batch_size, max_packet_size, atomic)
+
+    def _mark_saved(self, generated_pk: bool = False) -> None:
+        """
+        保存后清除修改记录
+
+        事务回滚时恢复保存前的记录，实例仍需要保存(新实例同时清除回填的自增主键)；
+        回滚前在同一事务中再次 save() 只保存之后的修改，不会重复插入。
+        """
+        snapshot = self._original
+        self._original = None
+        on_rollback(functools.partial(self._restore_original, snapshot, generated_pk))
+
+    def _restore_original(self, snapshot: Any, generated_pk: bool) -> None:
+        if snapshot is NEW:
+            self._original = NEW
+            if generated_pk:
+                setattr(self, self.get_primary_key(), None)
+            return
+        # 保存后的修改记录的是事务中的值，回滚后以保存前的记录为准
+        original = self._original if isinstance(self._original, dict) else {}
+        original.update(snapshot or {})
+        self._original = original or None
+
+    def _original_pk(self) -> Any:
+        """修改前的主键值，用于定位要更新的行"""
+        value = self._original_value(self.get_primary_key())
+        if value is UNSET or value is None:
+            raise ValueError(f"cannot save {type(self).__name__} without a primary key value")
+        return value
+
+    def _shard_key(self) -> Any:
+        """加载时的分片键值，用于定位实例所在的分片"""
+        strategy = self._shards
+        assert strategy is not None
+        key = strategy.key
+        value = self._original_value(key)
+        if value is UNSET or value is None:
+            raise ValueError(f"cannot save {type(self).__name__} without a value for the shard key {key}")
+        return value
+
+    def _original_value(self, name: str) -> Any:
+        """字段修改前的值，未修改时为当前值，没有值时为 UNSET"""
+        original = getattr(self, "_original", None)
+        value = original.get(name, UNSET) if isinstance(original, dict) else UNSET
+        if value is UNSET:
+            value = self._fields[name]._raw_value(self)
+        return value
+
+    @classmethod
+    def _from_values(cls: Type[M], values: Dict[str, Any]) -> M:
+        """跳过 __init__ 直接构建实例，values 只能包含模型字段"""
+        instance = cls.__new__(cls)
+        if cls._compact:
+            instance._row = [values.get(field_name, UNSET) for field_name in cls._fields]
+        else:
+            instance._values = values
+        return instance
+
+    @classmethod
+    def _decoder(cls: Type[M], columns: Tuple[str, ...]) -> Callable[[Tuple[Any, ...]], M]:
+        """
+        获取按列位置将元组行解码为实例的函数
+
+        每个 (模型, 查询列) 只生成一次，直接构造字段字典(紧凑模型为按位置的列表)，不经过 __init__；
+        非模型字段的列会被忽略。
+        """
+        decoder = cls._decoders.get(columns)
+        if decoder is None:
+            if cls._compact:
+                positions = {name: i for i, name in enumerate(columns)}
+                items = ", ".join(f"row[{positions[name]}]" if name in positions else "UNSET" for name in cls._fields)
+                assign = f"instance._row = [{items}]"
+            else:
+                items = ", ".join(f"{name!r}: row[{i}]" for i, name in enumerate(columns) if name in cls._fields)
+                assign = f"instance._values = {{{items}}}"
+            source = f"def decode(row):\n    instance = new(cls)\n    {assign}\n    return instance\n"
+            namespace: Dict[str, Any] = {"new": cls.__new__, "cls": cls, "UNSET": UNSET}
+            exec(source, namespace)  # nosec B102 - 源码只由模型字段名和列位置生成
+            decoder = namespace["decode"]
+            cls._decoders[columns] = decoder
+        return decoder
+
     @classmethod
     def field(cls, field_name: str) -> Field:
         """获取指定字段"""
@@ -87,11 +323,31 @@ class Model(metaclass=ModelMeta):
         """获取所有字段名"""
         return list(cls._fields.keys())
 
+    @classmethod
+    def get_primary_key(cls) -> str:
+        """获取主键字段名（声明 primary_key=True 的字段，默认为 id）"""
+        if cls._primary_key is None:
+            raise ValueError(f"{cls.__name__} has no primary key field")
+        return cls._primary_key
+
     @classmethod
     def get_table_name(cls) -> str:
         """获取表名（默认为类名的 snake case）"""
-        snake_case = re.sub(r"(?<!^)(?=[A-Z])", "_", cls.__name__).lower()
-        return snake_case
+        return cls._table_name
+
+    @classmethod
+    def get_by_pk(cls: Type[M], pk: Any) -> M | None:
+        """按主键获取记录，优先使用实体缓存，不存在时返回 None"""
+        from .entity_cache import load_by_pk
+
+        return load_by_pk(cls, [pk]).get(pk)
+
+    @classmethod
+    def get_many_by_pk(cls: Type[M], pks: Iterable[Any]) -> Dict[Any, M]:
+        """按主键批量获取记录，只查询缓存未命中的主键(单条 IN 查询)，返回 主键 -> 记录，不存在的主键不包含在内"""
+        from .entity_cache import load_by_pk
+
+        return load_by_pk(cls, pks)
 
     @classmethod
     def select(cls: type[M], fields: List[str] | None = None):
@@ -0,0 +1,67 @@
+import base64
+import binascii
+import json
+from typing import Any, Generic, List, Sequence, Tuple, TypeVar
+
+from .condition import Condition, ConditionTree
+from .operation import Operation
+
+T = TypeVar("T")
+
+
+class Page(Generic[T]):
+    """游标分页结果"""
+
+    def __init__(self, items: List[T], next_token: str | None):
+        self.items = items
+        self.next_token = next_token  # 下一页的分页令牌，没有下一页时为 None
+
+    @property
+    def has_more(self) -> bool:
+        return self.next_token is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+def seek_condition(order_by: Sequence[Tuple[str, str]], values: Sequence[Any]) -> ConditionTree:
+    """
+    根据排序列和上一页最后一行的值构建 keyset 条件
+
+    (a asc, b desc) 之后的行为: a > va or (a = va and b < vb)
+    """
+    if len(order_by) != len(values):
+        raise ValueError("keyset values must match the ORDER BY columns")
+
+    tree = ConditionTree("or")
+    for i, (field, direction) in enumerate(order_by):
+        operation = Operation.LT if direction == "desc" else Operation.GT
+        branch = ConditionTree("and")
+        for j in range(i):
+            branch.add_condition(Condition(order_by[j][0], values[j]))
+        branch.add_condition(Condition(field, values[i], operation))
+        tree.add_tree(branch)
+    return tree
+
+
+def encode_token(order_by: Sequence[Tuple[str, str]], values: Sequence[Any]) -> str:
+    """将排序列与值编码为不透明的分页令牌"""
+    payload = {"k": [f"{field} {direction}" for field, direction in order_by], "v": list(values)}
+    raw = json.dumps(payload, default=str, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_token(order_by: Sequence[Tuple[str, str]], token: str) -> List[Any]:
+    """解码分页令牌，排序列与当前查询不一致时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        keys, values = payload["k"], payload["v"]
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise ValueError("invalid page token") from e
+    if keys != [f"{field} {direction}" for field, direction in order_by]:
+        raise ValueError("page token does not match the query ordering")
+    return values
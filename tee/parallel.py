@@ -0,0 +1,100 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import FIRST_EXCEPTION, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, List
+
+from .aio import AsyncExecutor
+from .connection import is_in_transaction
+from .replicas import bind_write_session
+
+# 默认的线程数，与连接池默认的最大连接数一致
+DEFAULT_MAX_WORKERS = 10
+
+_pool: ThreadPoolExecutor | None = None
+_max_workers = DEFAULT_MAX_WORKERS
+_lock = threading.Lock()
+# 标记并发查询的工作线程，嵌套调用时直接顺序执行，避免等待同一个线程池造成死锁
+_worker = threading.local()
+
+
+def configure_parallel(max_workers: int) -> None:
+    """修改并发查询的线程数，正在执行的查询不受影响"""
+    global _pool, _max_workers
+    if max_workers < 1:
+        raise ValueError("max_workers must be positive")
+    with _lock:
+        old, _pool = _pool, None
+        _max_workers = max_workers
+    if old is not None:
+        old.shutdown(wait=False)
+
+
+def parallel(*queries: Any) -> List[Any]:
+    """
+    并发执行互不依赖的查询，每个查询使用各自的连接池连接，按传入顺序返回结果
+
+    查询可以是 Select(返回 list() 的结果)或无参数的函数：
+        users, total, orders = parallel(
+            User.select().gt(User.age, 18).limit(20),
+            lambda: User.select().count(),
+            Order.select().eq(Order.user_id, 1),
+        )
+    任一查询出错时取消尚未开始的查询并抛出第一个错误。
+    事务中的查询必须使用事务连接，此时在当前线程中顺序执行。
+    """
+    calls = [_callable(query) for query in queries]
+    if len(calls) <= 1 or is_in_transaction() or getattr(_worker, "active", False):
+        return [call() for call in calls]
+
+    executor = _executor()
+    bind_write_session()
+    futures: List[Future] = [executor.submit(contextvars.copy_context().run, _run, call) for call in calls]
+    done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+    for future in futures:
+        if future in done and future.exception() is not None:
+            for other in pending:
+                other.cancel()
+            raise future.exception()  # type: ignore[misc]
+    return [future.result() for future in futures]
+
+
+async def aparallel(*queries: Any) -> List[Any]:
+    """parallel() 的异步版本，在 AsyncExecutor 的线程池中执行，不阻塞事件循环"""
+    tasks = [asyncio.ensure_future(AsyncExecutor.run(_callable(query))) for query in queries]
+    if not tasks:
+        return []
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    for task in tasks:
+        if task in done and task.exception() is not None:
+            for other in pending:
+                other.cancel()
+            raise task.exception()  # type: ignore[misc]
+    return [task.result() for task in tasks]
+
+
+def _callable(query: Any) -> Callable[[], Any]:
+    if callable(query):
+        return query
+    if hasattr(query, "list"):
+        return query.list
+    raise TypeError(f"cannot run {type(query).__name__} in parallel, expected a Select or a callable")
+
+
+def _run(call: Callable[[], Any]) -> Any:
+    _worker.active = True
+    try:
+        return call()
+    finally:
+        _worker.active = False
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    pool = _pool
+    if pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(_max_workers, thread_name_prefix="tee-parallel")
+            pool = _pool
+    return pool
@@ -0,0 +1,75 @@
+import itertools
+from contextlib import nullcontext
+from typing import Any, Dict, Iterable, List, Tuple, Type
+
+from .connection import is_in_transaction, transaction
+from .entity_cache import invalidate_entities
+from .executor import Executor
+from .fields import NEW
+from .model import Model
+from .sharding import shard_of
+from .update import case_statements
+
+
+def save_all(
+    models: Iterable[Model], batch_size: int = 1000, max_packet_size: int | None = None, atomic: bool = False
+) -> int:
+    """批量保存实例，参见 Model.save_all"""
+    if batch_size < 1:
+        raise ValueError("batch_size must be positive")
+
+    # (模型, 字段, 是否生成主键, 数据库) -> 新实例
+    inserts: Dict[Tuple[Type[Model], Tuple[str, ...], bool, str], List[Model]] = {}
+    # (模型, 修改的字段, 数据库) -> (实例, 原主键, 新值)
+    updates: Dict[Tuple[Type[Model], Tuple[str, ...], str], List[Tuple[Model, Any, List[Any]]]] = {}
+    for item in models:
+        cls = type(item)
+        if getattr(item, "_original", None) is NEW:
+            data = item.to_dict()
+            generate = cls._primary_key is not None and data.get(cls._primary_key) is None
+            inserts.setdefault((cls, tuple(data), generate, _database(item, data)), []).append(item)
+            continue
+        changes = item.get_changes()
+        if changes:
+            key = (cls, tuple(changes), _database(item, changes))
+            updates.setdefault(key, []).append((item, item._original_pk(), list(changes.values())))
+    if not inserts and not updates:
+        return 0
+
+    databases = {key[-1] for key in inserts} | {key[-1] for key in updates}
+    if atomic and len(databases) > 1:
+        raise ValueError(f"atomic save_all cannot span databases: {', '.join(sorted(databases))}")
+
+    affected = 0
+    with transaction(databases.pop()) if atomic and not is_in_transaction() else nullcontext():
+        for (cls, _, generate, _), items in inserts.items():
+            if generate:
+                affected += len(cls.insert().execute_bulk_with_ids(items, batch_size, max_packet_size))
+            else:
+                affected += cls.insert().execute_bulk(items, None, batch_size, max_packet_size)
+            for item in items:
+                item._mark_saved(generate)
+
+        for (cls, names, db_name), entries in updates.items():
+            primary_key = cls.get_primary_key()
+            saved = iter(entries)
+            rows = ((pk, values) for _, pk, values in entries)
+            packet_size = Executor.max_allowed_packet(db_name) if max_packet_size is None else max_packet_size
+            for stmt, keys in case_statements(cls, primary_key, names, rows, batch_size, packet_size):
+                affected += Executor.execute(stmt, db_name)
+                # 修改主键时无法确定受影响的缓存条目，清空整张表
+                invalidate_entities(cls, None if primary_key in names else keys)
+                for item, _, _ in itertools.islice(saved, len(keys)):
+                    item._mark_saved()
+    return affected
+
+
+def _database(item: Model, data: Dict[str, Any]) -> str:
+    """实例所在的数据库：分片模型按分片键(已加载的实例按加载时的值)选择分片，data 为要写入的字段"""
+    cls = type(item)
+    strategy = cls._shards
+    if strategy is None:
+        return "default"
+    if not item.is_new() and strategy.key in data:
+        raise ValueError(f"cannot update shard key {strategy.key} of {cls.__name__}, the row would change shards")
+    return shard_of(cls, {strategy.key: item._shard_key()})
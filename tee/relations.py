@@ -0,0 +1,179 @@
+from abc import ABC, abstractmethod
+from typing import (
+    TYPE_CHECKING, Any, Dict, Generic, Hashable, Iterable, List, Optional, Sequence, Set, Type, TypeVar, Union
+)
+
+if TYPE_CHECKING:
+    from .model import Model
+
+R = TypeVar("R", bound="Model")
+
+# 完整名(模块.类名)和类名 -> 模型类，用于解析以字符串声明的关联目标
+_models: Dict[str, type] = {}
+# 不同模块中有同名模型的类名，只能用完整名引用
+_ambiguous: Set[str] = set()
+
+# 未加载关联时的占位符(关联值本身可能为 None)
+_MISSING = object()
+
+
+def register_model(model: type) -> None:
+    """登记模型，同名模型重复定义(例如重新加载模块)时替换，不同模块中的同名模型需要用完整名引用"""
+    full_name = _full_name(model)
+    existing = _models.get(model.__name__)
+    if existing is not None and _full_name(existing) != full_name:
+        _ambiguous.add(model.__name__)
+    _models[model.__name__] = model
+    _models[full_name] = model
+
+
+def _full_name(model: type) -> str:
+    return f"{model.__module__}.{model.__qualname__}"
+
+
+class Relation(ABC, Generic[R]):
+    """模型之间的关联，不对应数据表中的列"""
+
+    def __init__(self, target: Union[Type[R], str], foreign_key: str):
+        self._target = target
+        self.foreign_key = foreign_key  # 外键字段名
+        self.name: str = ""  # 关联名，稍后由元类设置
+        self.owner: Any = None  # 声明关联的模型，稍后由元类设置
+
+    @property
+    def target(self) -> Type[R]:
+        """关联的目标模型，字符串声明时按类名或完整名(模块.类名)解析"""
+        if isinstance(self._target, str):
+            if self._target in _ambiguous:
+                raise ValueError(
+                    f"model name {self._target!r} in relation {self.owner.__name__}.{self.name} is defined in "
+                    "several modules, use the full name module.ClassName"
+                )
+            if self._target not in _models:
+                raise ValueError(f"unknown model {self._target!r} in relation {self.owner.__name__}.{self.name}")
+            self._target = _models[self._target]
+        return self._target
+
+    def __get__(self, instance: Any, owner: Optional[type] = None) -> Any:
+        """描述符协议：获取关联记录，未预加载时单独查询"""
+        if instance is None:
+            return self
+        value = self._get_cached(instance)
+        if value is _MISSING:
+            value = self._load(instance)
+            self._set_cached(instance, value)
+        return value
+
+    def _get_cached(self, instance: Any) -> Any:
+        related = getattr(instance, "_related", None)
+        if related is None or self.name not in related:
+            return _MISSING
+        return related[self.name]
+
+    def _set_cached(self, instance: Any, value: Any) -> None:
+        if getattr(instance, "_related", None) is None:
+            instance._related = {}
+        instance._related[self.name] = value
+
+    @abstractmethod
+    def _load(self, instance: Any) -> Any: ...
+
+    @abstractmethod
+    def _prefetch(self, items: Sequence[Any], batch_size: int) -> None: ...
+
+    @abstractmethod
+    def _required_fields(self) -> List[str]:
+        """预加载时主查询必须包含的字段"""
+
+
+class BelongsTo(Relation[R]):
+    """
+    多对一关联，外键在当前模型上：
+        class Post(Model):
+            user_id = Int()
+            user = BelongsTo("User", "user_id")
+    """
+
+    def __set__(self, instance: Any, value: Optional[R]) -> None:
+        """描述符协议：设置关联记录，同时更新外键"""
+        setattr(instance, self.foreign_key, None if value is None else getattr(value, value.get_primary_key()))
+        self._set_cached(instance, value)
+
+    def _load(self, instance: Any) -> Optional[R]:
+        key = getattr(instance, self.foreign_key)
+        if key is None:
+            return None
+        target = self.target
+        return target.select().eq(target.field(target.get_primary_key()), key).one()
+
+    def _prefetch(self, items: Sequence[Any], batch_size: int) -> None:
+        keys = list(dict.fromkeys(key for key in (getattr(item, self.foreign_key) for item in items) if key is not None))
+        target = self.target
+        related = fetch_by_keys(target, (target.get_primary_key(),), keys, batch_size) if keys else {}
+        for item in items:
+            rows = related.get(getattr(item, self.foreign_key))
+            self._set_cached(item, rows[0] if rows else None)
+
+    def _required_fields(self) -> List[str]:
+        return [self.foreign_key]
+
+
+class HasMany(Relation[R]):
+    """
+    一对多关联，外键在目标模型上：
+        class User(Model):
+            id = Int()
+            posts = HasMany("Post", "user_id")
+    """
+
+    def __set__(self, instance: Any, value: List[R]) -> None:
+        self._set_cached(instance, list(value))
+
+    def _load(self, instance: Any) -> List[R]:
+        key = getattr(instance, instance.get_primary_key())
+        if key is None:
+            return []
+        target = self.target
+        return target.select().eq(target.field(self.foreign_key), key).list()
+
+    def _prefetch(self, items: Sequence[Any], batch_size: int) -> None:
+        primary_key = self.owner.get_primary_key()
+        keys = list(dict.fromkeys(key for key in (getattr(item, primary_key) for item in items) if key is not None))
+        related = fetch_by_keys(self.target, (self.foreign_key,), keys, batch_size) if keys else {}
+        for item in items:
+            self._set_cached(item, related.get(getattr(item, primary_key), []))
+
+    def _required_fields(self) -> List[str]:
+        return [self.owner.get_primary_key()]
+
+
+def fetch_by_keys(
+    model: Type[R], names: Sequence[str], keys: List[Hashable], batch_size: int = 1000
+) -> Dict[Hashable, List[R]]:
+    """
+    按键字段批量查询记录，结果按键分组
+
+    每 batch_size 个键一条 IN 查询；多个键字段时键为元组，使用 (a, b) IN (...) 查询。
+    """
+    fields = [model.field(name) for name in names]
+    results: Dict[Hashable, List[R]] = {key: [] for key in keys}
+    for start in range(0, len(keys), batch_size):
+        chunk = keys[start : start + batch_size]
+        select = model.select()
+        if len(fields) == 1:
+            select.in_(fields[0], chunk)
+        else:
+            select.row_in(fields, chunk)
+        for item in select.list():
+            key = getattr(item, names[0]) if len(names) == 1 else tuple(getattr(item, name) for name in names)
+            if key in results:
+                results[key].append(item)
+    return results
+
+
+def prefetch_related(items: Sequence[Any], relations: Iterable[Relation], batch_size: int = 1000) -> None:
+    """为已查询的记录预加载关联，每个关联一次批量查询"""
+    if not items:
+        return
+    for relation in relations:
+        relation._prefetch(items, batch_size)
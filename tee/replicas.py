@@ -0,0 +1,194 @@
+import contextvars
+import itertools
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Sequence
+
+from .connection import is_in_transaction
+from .database import db
+
+# 延迟的指数加权移动平均系数
+LATENCY_ALPHA = 0.2
+
+
+class Replica:
+    """只读副本的运行状态：正在执行的查询数和查询延迟的移动平均"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.outstanding = 0
+        self.latency: float | None = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            self.outstanding += 1
+
+    def finish(self, elapsed: float) -> None:
+        with self._lock:
+            self.outstanding -= 1
+            if self.latency is None:
+                self.latency = elapsed
+            else:
+                self.latency += LATENCY_ALPHA * (elapsed - self.latency)
+
+
+class ReplicaPolicy(ABC):
+    """副本选择策略，可以继承实现自定义的负载均衡"""
+
+    @abstractmethod
+    def choose(self, replicas: Sequence[Replica]) -> Replica: ...
+
+
+class RoundRobin(ReplicaPolicy):
+    """依次轮流使用每个副本"""
+
+    def __init__(self) -> None:
+        self._counter = itertools.count()
+
+    def choose(self, replicas: Sequence[Replica]) -> Replica:
+        return replicas[next(self._counter) % len(replicas)]
+
+
+class LeastOutstanding(ReplicaPolicy):
+    """选择正在执行的查询最少的副本，相同时轮流使用"""
+
+    def __init__(self) -> None:
+        self._counter = itertools.count()
+
+    def choose(self, replicas: Sequence[Replica]) -> Replica:
+        offset = next(self._counter) % len(replicas)
+        rotated = list(replicas[offset:]) + list(replicas[:offset])
+        return min(rotated, key=lambda replica: replica.outstanding)
+
+
+class LatencyWeighted(ReplicaPolicy):
+    """按延迟移动平均的倒数加权随机选择，还没有延迟数据的副本优先使用"""
+
+    def choose(self, replicas: Sequence[Replica]) -> Replica:
+        for replica in replicas:
+            if replica.latency is None:
+                return replica
+        weights = [1.0 / max(replica.latency or 0.0, 1e-6) for replica in replicas]
+        return random.choices(replicas, weights)[0]
+
+
+POLICIES: Dict[str, Callable[[], ReplicaPolicy]] = {
+    "round_robin": RoundRobin,
+    "least_outstanding": LeastOutstanding,
+    "latency_weighted": LatencyWeighted,
+}
+
+
+class ReplicaGroup:
+    def __init__(self, primary: str, replicas: List[Replica], policy: ReplicaPolicy, read_your_writes: float):
+        self.primary = primary
+        self.replicas = replicas
+        self.policy = policy
+        self.read_your_writes = read_your_writes
+
+
+# 主库名 -> 副本组
+_groups: Dict[str, ReplicaGroup] = {}
+# 副本名 -> 副本状态
+_replicas: Dict[str, Replica] = {}
+# 副本名 -> 主库名
+_primaries: Dict[str, str] = {}
+
+# 当前线程(或协程任务)最近一次写入各数据库的时间，用于读己之写和合并查询
+_last_writes: "contextvars.ContextVar[Dict[str, float] | None]" = contextvars.ContextVar(
+    "tee_last_writes", default=None
+)
+
+
+def set_replicas(
+    primary: str,
+    replicas: Sequence[str],
+    policy: str | ReplicaPolicy = "round_robin",
+    read_your_writes: float = 1.0,
+) -> None:
+    """
+    为主库配置只读副本，副本需先用 set_db 注册
+
+    Select 按 policy(round_robin / least_outstanding / latency_weighted 或 ReplicaPolicy 实例)
+    路由到副本；写操作和事务使用主库。同一线程(或协程任务)写入后 read_your_writes 秒内的查询
+    也使用主库，避免读到复制延迟前的数据。replicas 为空时取消配置。
+    """
+    for name in [primary, *replicas]:
+        if name not in db:
+            raise ValueError(f"unknown database {name!r}")
+    if read_your_writes < 0:
+        raise ValueError("read_your_writes must not be negative")
+    if isinstance(policy, str):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown replica policy {policy!r}, expected one of {sorted(POLICIES)}")
+        policy = POLICIES[policy]()
+
+    old = _groups.pop(primary, None)
+    if old is not None:
+        for replica in old.replicas:
+            _replicas.pop(replica.name, None)
+            _primaries.pop(replica.name, None)
+    if not replicas:
+        return
+    group = ReplicaGroup(primary, [Replica(name) for name in replicas], policy, read_your_writes)
+    for replica in group.replicas:
+        _replicas[replica.name] = replica
+        _primaries[replica.name] = primary
+    _groups[primary] = group
+
+
+def route_read(primary: str, using: str | None = None) -> str:
+    """
+    选择执行查询的数据库
+
+    using 为 "primary" 时使用主库，为 "replica" 时使用副本(忽略读己之写)，为其他名称时直接使用该数据库；
+    事务中始终使用主库。
+    """
+    if using is not None and using not in ("primary", "replica"):
+        return using
+    group = _groups.get(primary)
+    if group is None or using == "primary" or is_in_transaction():
+        return primary
+    if using is None and group.read_your_writes > 0:
+        writes = _last_writes.get()
+        written_at = writes.get(primary) if writes is not None else None
+        if written_at is not None and time.monotonic() - written_at < group.read_your_writes:
+            return primary
+    return group.policy.choose(group.replicas).name
+
+
+def primary_of(name: str) -> str:
+    """副本所属的主库，其他数据库返回自身"""
+    return _primaries.get(name, name)
+
+
+def get_replica(name: str) -> Replica | None:
+    return _replicas.get(name)
+
+
+def record_write(db_name: str) -> None:
+    """记录写入时间，开启读己之写窗口"""
+    writes = _last_writes.get()
+    if writes is None:
+        writes = {}
+        _last_writes.set(writes)
+    writes[db_name] = time.monotonic()
+
+
+def last_write(db_name: str) -> float | None:
+    """当前线程(或协程任务)最近一次写入该数据库(副本按其主库)的时间"""
+    writes = _last_writes.get()
+    return None if writes is None else writes.get(primary_of(db_name))
+
+
+def bind_write_session() -> None:
+    """
+    在复制上下文到其他线程执行前调用，保证写入时间记录在调用方可见的字典中
+
+    线程池中对 ContextVar 的 set 不会传回调用方，共享同一个字典才能让后续查询看到写入。
+    """
+    if _last_writes.get() is None:
+        _last_writes.set({})
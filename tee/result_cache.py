@@ -0,0 +1,191 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Set, Tuple
+
+from .connection import is_in_transaction, on_commit
+from .statement import Statement
+
+
+class _Entry:
+    __slots__ = ("value", "created_at", "expires_at", "tables", "generations")
+
+    def __init__(
+        self,
+        value: Any,
+        created_at: float,
+        expires_at: float,
+        tables: Tuple[Tuple[str, str], ...],
+        generations: Tuple[int, ...],
+    ):
+        self.value = value
+        self.created_at = created_at
+        self.expires_at = expires_at
+        self.tables = tables
+        self.generations = generations
+
+
+class ResultCache:
+    """
+    查询结果缓存，按 (数据库, SQL, 参数) 缓存，带 TTL 和 LRU 容量限制
+
+    每张表维护一个代数，通过 tee 执行的写操作会增加表的代数并删除相关缓存；
+    结果查询前记录代数，写入缓存时代数已变化则丢弃，避免并发写入后缓存旧数据。
+    """
+
+    def __init__(self, max_size: int = 10000, default_ttl: float = 60.0):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self._data: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._by_table: Dict[Tuple[str, str], Set[Hashable]] = {}
+        self._generations: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def configure(self, max_size: int | None = None, default_ttl: float | None = None) -> None:
+        """修改容量和默认 TTL，超出容量的条目按 LRU 淘汰"""
+        with self._lock:
+            if max_size is not None:
+                if max_size < 1:
+                    raise ValueError("max_size must be positive")
+                self.max_size = max_size
+            if default_ttl is not None:
+                if default_ttl <= 0:
+                    raise ValueError("default_ttl must be positive")
+                self.default_ttl = default_ttl
+            self._shrink_locked()
+
+    def fetch(
+        self,
+        db_name: str,
+        tables: Iterable[str],
+        stmt: Statement,
+        load: Callable[[], Any],
+        ttl: float | None = None,
+        max_age: float | None = None,
+    ) -> Any:
+        """
+        返回缓存的结果，未命中或已过期时调用 load 查询并缓存；事务中直接查询
+
+        max_age 限制可接受的缓存时间，早于该时间写入的条目视为未命中。
+        """
+        if is_in_transaction():
+            return load()
+
+        key = (db_name, stmt.get_sql(), _freeze(stmt.get_args()))
+        table_keys = tuple((db_name, table) for table in tables)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry.expires_at > now and (max_age is None or now - entry.created_at <= max_age):
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry.value
+                self._remove_locked(key)
+                self.expirations += 1
+            self.misses += 1
+            generations = tuple(self._generations.get(table, 0) for table in table_keys)
+
+        created_at = time.monotonic()
+        value = load()
+
+        expires_at = time.monotonic() + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            if generations != tuple(self._generations.get(table, 0) for table in table_keys):
+                # 查询期间表被修改，结果可能已过时
+                return value
+            if key in self._data:
+                self._remove_locked(key)
+            self._data[key] = _Entry(value, created_at, expires_at, table_keys, generations)
+            for table in table_keys:
+                self._by_table.setdefault(table, set()).add(key)
+            self._shrink_locked()
+        return value
+
+    def invalidate(self, db_name: str, table: str) -> None:
+        """增加表的代数并删除与之相关的缓存"""
+        table_key = (db_name, table)
+        with self._lock:
+            self._generations[table_key] = self._generations.get(table_key, 0) + 1
+            keys = self._by_table.pop(table_key, None)
+            if not keys:
+                return
+            for key in keys:
+                if key in self._data:
+                    self._remove_locked(key)
+                    self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._by_table.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove_locked(self, key: Hashable) -> None:
+        entry = self._data.pop(key)
+        for table in entry.tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def _shrink_locked(self) -> None:
+        while len(self._data) > self.max_size:
+            key = next(iter(self._data))
+            self._remove_locked(key)
+            self.evictions += 1
+
+
+def _freeze(value: Any) -> Hashable:
+    """将参数中的列表等转为可哈希的元组"""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    return value
+
+
+result_cache = ResultCache()
+
+
+def invalidate_tables(db_name: str, tables: Iterable[str]) -> None:
+    """写操作后使表的缓存失效；事务中提交后会再次失效，避免事务期间其他线程缓存提交前的数据"""
+    names = tuple(tables)
+    if not names:
+        return
+    _invalidate(db_name, names)
+    if is_in_transaction():
+        on_commit(functools.partial(_invalidate, db_name, names))
+
+
+def _invalidate(db_name: str, tables: Tuple[str, ...]) -> None:
+    for table in tables:
+        result_cache.invalidate(db_name, table)
+
+
+def configure_result_cache(max_size: int | None = None, default_ttl: float | None = None) -> None:
+    """修改结果缓存的容量和默认 TTL(秒)"""
+    result_cache.configure(max_size, default_ttl)
+
+
+def result_cache_stats() -> Dict[str, int]:
+    """返回结果缓存的命中、未命中、淘汰、过期和失效计数"""
+    return result_cache.stats()
@@ -1,15 +1,38 @@
-from typing import Any, Generic, List, Type, TypeVar
-
+import functools
+import time
+from collections import namedtuple
+from typing import Any, Callable, Dict, Generic, Iterable, Iterator, List, Sequence, Tuple, Type, TypeVar
+
+from pymysql.cursors import SSCursor
+
+from .aggregates import AGGREGATES, Aggregate, Having
+from .aio import AsyncExecutor
+from .columns import ColumnKind, collect_columns
+from .compiler import CompiledSelect, cached_sql
+from .condition import ConditionTree
+from .connection import is_in_transaction
 from .errors import MultipleRecordsError, NotFoundError
 from .executor import Executor
-from .fields import Field
+from .fields import Field, Str
 from .model import Model
+from .pagination import Page, decode_token, encode_token, seek_condition
+from .parallel import parallel
+from .relations import Relation, prefetch_related
+from .replicas import primary_of, route_read
+from .result_cache import result_cache
+from .sharding import route, single
 from .statement import Statement
 from .where import Where
 
 # 将 T 的约束修改为 Model 的子类
 M = TypeVar("M", bound=Model)
 
+# 连接条件：(左字段, 右字段) 或其列表
+JoinOn = Tuple[Field, Field] | Sequence[Tuple[Field, Field]]
+
+# 模型组合 -> 行的具名元组类型
+_row_types: Dict[Tuple[Type[Model], ...], Any] = {}
+
 
 class Select(Generic[M]):
 
@@ -20,57 +43,96 @@ class Select(Generic[M]):
         if self.fields is None:
             self.fields = model.get_field_names()
         self._where = Where()
-        self._order_by: List[str] = []
+        self._order_by: List[Tuple[str, str]] = []
+        self._after: Dict[str, Any] = {}
+        self._limit: int | None = None
+        self._offset: int | None = None
+        self._cached = False
+        self._cache_ttl: float | None = None
+        self._prefetch: List[Relation] = []
+        self._joins: List[Tuple[str, Type[Model], Tuple[Tuple[str, str], ...]]] = []
+        self._group_by: List[str] = []
+        self._having: List[Having] = []
+        self._using: str | None = None
+        # 分片模型按分片键路由后的数据库
+        self._database: str | None = None
 
     def or_(self):
         pass
 
     def eq(self, field: Field, value: Any) -> "Select[M]":
-        self._where.eq(field.name, value)
+        self._where.eq(self._name(field), value)
         return self
 
     def ne(self, field: Field, value: Any) -> "Select[M]":
-        self._where.ne(field.name, value)
+        self._where.ne(self._name(field), value)
         return self
 
     def gt(self, field: Field, value: Any) -> "Select[M]":
-        self._where.gt(field.name, value)
+        self._where.gt(self._name(field), value)
         return self
 
     def ge(self, field: Field, value: Any) -> "Select[M]":
-        self._where.ge(field.name, value)
+        self._where.ge(self._name(field), value)
         return self
 
     def lt(self, field: Field, value: Any) -> "Select[M]":
-        self._where.lt(field.name, value)
+        self._where.lt(self._name(field), value)
         return self
 
     def le(self, field: Field, value: Any) -> "Select[M]":
-        self._where.le(field.name, value)
+        self._where.le(self._name(field), value)
         return self
 
     def in_(self, field: Field, value: Any) -> "Select[M]":
-        self._where.in_(field.name, value)
+        self._where.in_(self._name(field), value)
+        return self
+
+    def row_in(self, fields: Sequence[Field], values: Iterable[Sequence[Any]]) -> "Select[M]":
+        """复合键条件：(a, b) IN ((1, 2), (3, 4))"""
+        self._where.row_in([self._name(field) for field in fields], values)
         return self
 
     def l_like(self, field: Field, value: Any) -> "Select[M]":
-        self._where.l_like(field.name, value)
+        self._where.l_like(self._name(field), value)
         return self
 
     def r_like(self, field: Field, value: Any) -> "Select[M]":
-        self._where.r_like(field.name, value)
+        self._where.r_like(self._name(field), value)
         return self
 
     def like(self, field: Field, value: Any) -> "Select[M]":
-        self._where.like(field.name, value)
+        self._where.like(self._name(field), value)
         return self
 
     def desc(self, *order_by: Field) -> "Select[M]":
-        self._order_by.extend([f"{field.name} desc" for field in order_by])
+        self._order_by.extend([(self._name(field), "desc") for field in order_by])
         return self
 
     def asc(self, *order_by: Field) -> "Select[M]":
-        self._order_by.extend([f"{field.name} asc" for field in order_by])
+        self._order_by.extend([(self._name(field), "asc") for field in order_by])
+        return self
+
+    def join(self, model: Type[Model], on: JoinOn) -> "Select[M]":
+        """
+        内连接其他模型，on 为 (左字段, 右字段) 或其列表，例如 Post.select().join(User, on=(Post.user_id, User.id))
+
+        连接后条件和排序可以使用被连接模型的字段，列名自动带上表名；list() 等只返回主模型，rows() 返回所有模型。
+        """
+        return self._join("JOIN", model, on)
+
+    def left_join(self, model: Type[Model], on: JoinOn) -> "Select[M]":
+        """左连接其他模型，没有匹配行时 rows() 中对应的模型为 None"""
+        return self._join("LEFT JOIN", model, on)
+
+    def group_by(self, *fields: Field) -> "Select[M]":
+        """按字段分组，与 aggregate() 一起使用"""
+        self._group_by.extend(self._name(field) for field in fields)
+        return self
+
+    def having(self, *conditions: Having) -> "Select[M]":
+        """分组后的过滤条件，例如 having(Sum(Order.amount) > 100)，多个条件为 AND"""
+        self._having.extend(conditions)
         return self
 
     def limit(self, limit: int) -> "Select[M]":
@@ -81,90 +143,649 @@ class Select(Generic[M]):
         self._offset = offset
         return self
 
+    def after(self, field: Field, value: Any) -> "Select[M]":
+        """
+        keyset 分页：只返回排序位置在 value 之后的记录
+
+        字段未参与排序时按升序追加到排序列；多次调用可按多列定位，所有排序列都需要给出值。
+        """
+        name = self._name(field)
+        if name not in [column for column, _ in self._order_by]:
+            self._order_by.append((name, "asc"))
+        self._after[name] = value
+        return self
+
+    def cache(self, ttl: float | None = None) -> "Select[M]":
+        """
+        缓存 get/one/first/list/count 的结果，ttl 为缓存秒数，默认使用结果缓存的 default_ttl
+
+        通过 tee 对该表执行的插入、更新、删除会使缓存失效；事务中的查询不使用缓存。
+        """
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl must be positive")
+        self._cached = True
+        self._cache_ttl = ttl
+        return self
+
+    def using(self, name: str) -> "Select[M]":
+        """
+        指定执行查询的数据库
+
+        "primary" 使用主库(例如需要读到刚写入的数据)，"replica" 使用副本(忽略读己之写)，其他名称直接使用该数据库。
+        """
+        self._using = name
+        return self
+
+    def prefetch(self, *relations: Relation) -> "Select[M]":
+        """
+        预加载关联记录：主查询之后每个关联只发出一次批量 IN 查询，结果挂到每条记录上
+
+        iter() 按批预加载，每批一次查询：
+            for post in Post.select().prefetch(Post.user).iter(batch_size=500):
+                print(post.user.name)
+        """
+        for relation in relations:
+            if relation.owner is not self._model:
+                raise ValueError(f"relation {relation.name!r} does not belong to {self._model.__name__}")
+            missing = [name for name in relation._required_fields() if self.fields and name not in self.fields]
+            if missing:
+                raise ValueError(f"prefetch {relation.name!r} requires selected columns: {', '.join(missing)}")
+        self._prefetch.extend(relations)
+        return self
+
     def one(self) -> M | None:
-        try:
-            return self.get()
-        except NotFoundError:
-            return None
+        shards = self._shards()
+        if shards is not None:
+            try:
+                return self._only(self._gather(shards, None, None))
+            except NotFoundError:
+                return None
+        return self._fetch_one_or_none(self._statement("get"))
 
     def first(self) -> M | None:
+        shards = self._shards()
+        if shards is not None:
+            items = self._gather(shards, 1, None)
+            return items[0] if items else None
+        return self._fetch_one_or_none(self._statement("first"))
+
+    def get(self, first: bool = False) -> M:
+        shards = self._shards()
+        if shards is not None:
+            return self._only(self._gather(shards, 1 if first else None, None))
+        return self._fetch_one(self._statement("first" if first else "get"))
+
+    def list(self) -> List[M]:
+        """查询所有记录，返回 Statement"""
+        shards = self._shards()
+        if shards is not None:
+            return self._gather(shards, self._limit, self._offset)
+        return self._fetch_all(self._statement("list"))
+
+    async def aone(self) -> M | None:
+        """异步版本的 one()，在线程池中执行，不阻塞事件循环"""
+        return await AsyncExecutor.run(self.one)
+
+    async def afirst(self) -> M | None:
+        """异步版本的 first()"""
+        return await AsyncExecutor.run(self.first)
+
+    async def aget(self, first: bool = False) -> M:
+        """异步版本的 get()"""
+        return await AsyncExecutor.run(self.get, first)
+
+    async def alist(self) -> List[M]:
+        """异步版本的 list()"""
+        return await AsyncExecutor.run(self.list)
+
+    def rows(self) -> List[Any]:
+        """
+        查询所有记录，每行返回一个具名元组，属性名为各模型的表名：
+            for row in Post.select().join(User, on=(Post.user_id, User.id)).rows():
+                print(row.post.title, row.user.name)
+        """
+        routed = self._routed("rows")
+        if routed is not self:
+            return routed.rows()
+        models = [self._model] + [model for _, model, _ in self._joins]
+        row_type = _row_types.get(tuple(models))
+        if row_type is None:
+            row_type = namedtuple("Row", [model.get_table_name() for model in models])  # type: ignore[misc]
+            _row_types[tuple(models)] = row_type
+
+        parts = []
+        start = 0
+        for index, (model, columns) in enumerate(self._join_columns()):
+            optional = index > 0 and self._joins[index - 1][0] == "LEFT JOIN"
+            parts.append((model._decoder(tuple(columns)), start, start + len(columns), optional))
+            start += len(columns)
+
+        def decode(row: Tuple[Any, ...]) -> Any:
+            values = []
+            for decoder, begin, end, optional in parts:
+                chunk = row[begin:end]
+                # 左连接没有匹配行时所有列为 NULL
+                values.append(None if optional and all(value is None for value in chunk) else decoder(chunk))
+            return row_type(*values)
+
+        return list(map(decode, self._raw_rows(self._statement("rows"))))
+
+    def iter(self, batch_size: int = 1000) -> Iterator[M]:
+        """流式查询所有记录，使用无缓冲游标按批读取，内存占用与结果集大小无关"""
+        routed = self._routed("iter")
+        if routed is not self:
+            return routed.iter(batch_size)
+        return self._fetch_iter(self._statement("list"), batch_size)
+
+    def to_columns(self, kind: ColumnKind = "list", batch_size: int = 10000) -> Dict[str, Any]:
+        """
+        按列返回查询结果，不为每行构建模型对象
+
+        kind 为 list 时每列是列表；为 array 时 Int/Float 列是 array.array；
+        为 numpy 时按字段类型转为 NumPy 数组，含 NULL 的列返回 masked array。
+        """
+        routed = self._routed("to_columns")
+        if routed is not self:
+            return routed.to_columns(kind, batch_size)
+        columns = list(self.fields or ())
+        stmt = self._statement("list")
+        batches = Executor.stream(stmt, self._read_db(), batch_size=batch_size, cursor_class=SSCursor)
+        return collect_columns(batches, columns, self._model.get_fields(), kind)
+
+    def compile(self) -> CompiledSelect[M]:
+        """
+        编译查询，返回可重复执行的查询对象
+
+        条件值可以使用 Param 占位，执行时按名称传入：
+            by_id = User.select().eq(User.id, Param("id")).compile()
+            by_id.get(id=1)
+        分片模型的分片键需要使用固定值，编译后的查询只访问该分片。
+        """
+        return CompiledSelect(self._routed("compile"))
+
+    def page(self, size: int, token: str | None = None) -> Page[M]:
+        """
+        keyset 分页查询，token 为上一页返回的 next_token
+
+        排序列默认为主键升序，未包含主键时追加主键作为唯一的排序依据；排序列不能为 NULL，可以是被连接模型的字段。
+        """
+        if size < 1:
+            raise ValueError("page size must be positive")
+        if self._limit is not None or self._offset is not None or self._after:
+            raise ValueError("page() cannot be combined with limit(), offset() or after()")
+        routed = self._routed("page")
+        if routed is not self:
+            return routed.page(size, token)
+        order_by = list(self._order_by)
+        primary_key = self._model.get_primary_key()
+        if primary_key not in [name for name, _ in order_by]:
+            order_by.append((primary_key, "asc"))
+        self._check_selected([name for name, _ in order_by])
+
+        seek = seek_condition(order_by, decode_token(order_by, token)) if token is not None else None
+        items, last = self._fetch_keyset(seek, order_by, size + 1, size)
+
+        next_token = None
+        if len(items) > size:
+            next_token = encode_token(order_by, last)
+        return Page(items[:size], next_token)
+
+    def chunks(self, size: int = 1000) -> Iterator[List[M]]:
+        """按主键顺序分块遍历所有符合条件的记录，每块使用主键范围定位，耗时与遍历位置无关"""
+        if size < 1:
+            raise ValueError("chunk size must be positive")
+        if self._order_by or self._limit is not None or self._offset is not None:
+            raise ValueError("chunks() orders by primary key and cannot be combined with order, limit or offset")
+        routed = self._routed("chunks")
+        if routed is not self:
+            yield from routed.chunks(size)
+            return
+        primary_key = self._model.get_primary_key()
+        self._check_selected([primary_key])
+        order_by = [(primary_key, "asc")]
+
+        seek: ConditionTree | None = None
+        while True:
+            items, last = self._fetch_keyset(seek, order_by, size, size)
+            if items:
+                yield items
+            if len(items) < size:
+                return
+            seek = seek_condition(order_by, last)
+
+    def aggregate(self, **aggregates: Aggregate | Field) -> Any:
+        """
+        在数据库中计算聚合值，结果按字段类型解码
+
+        参数名为结果名，值为聚合表达式；值为字段时参数名即聚合函数(count/sum/avg/min/max)：
+            Order.select().aggregate(sum=Order.amount, max=Order.created_at)  # {"sum": ..., "max": ...}
+            Order.select().aggregate(total=Sum(Order.amount), n=Count())
+
+        未分组时返回字典；group_by() 之后每组返回一个具名元组，属性为分组字段和结果名。
+        """
+        if not aggregates:
+            raise ValueError("aggregate() requires at least one aggregate")
+        routed = self._routed("aggregate")
+        if routed is not self:
+            return routed.aggregate(**aggregates)
+        items: List[Tuple[str, Aggregate]] = []
+        for alias, value in aggregates.items():
+            if isinstance(value, Field):
+                if alias not in AGGREGATES:
+                    raise ValueError(f"unknown aggregate function {alias!r}, use one of {', '.join(AGGREGATES)}")
+                value = AGGREGATES[alias](value)
+            items.append((alias, value))
+
+        seek = self._seek_tree()
+        stmt = self._build_statement(seek, self._order_by, self._limit, self._offset, "aggregate", tuple(items))
+        rows = self._raw_rows(stmt)
+
+        groups = len(self._group_by)
+        if not groups:
+            row = rows[0]
+            return {alias: aggregate.decode(value) for (alias, aggregate), value in zip(items, row)}
+
+        names = [name.rsplit(".", 1)[-1] for name in self._group_by] + [alias for alias, _ in items]
+        if len(set(names)) != len(names):
+            raise ValueError(f"group_by fields and aggregate names must be distinct: {', '.join(names)}")
+        row_type = namedtuple("AggregateRow", names)  # type: ignore[misc]
+        return [
+            row_type(*row[:groups], *(aggregate.decode(value) for (_, aggregate), value in zip(items, row[groups:])))
+            for row in rows
+        ]
+
+    def count(self, max_age: float | None = None) -> int:
+        """
+        统计记录数，返回数量
+
+        max_age 为可接受的最大缓存时间(秒)，指定时使用结果缓存中不超过该时间的结果，
+        通过 tee 对表的写操作会使缓存失效。分片模型未固定分片键时并发统计各分片后求和。
+        """
+        shards = self._shards()
+        if shards is not None:
+            return sum(parallel(*[functools.partial(shard.count, max_age) for shard in shards]))
+        stmt = self._statement("count")
+        if max_age is None:
+            return self._fetch_count(stmt)
+        if max_age <= 0:
+            raise ValueError("max_age must be positive")
+        db_name = self._cache_db()
+        return result_cache.fetch(
+            db_name, self._tables(), stmt, lambda: self._count_rows(stmt, db_name), max_age, max_age
+        )
+
+    async def acount(self, max_age: float | None = None) -> int:
+        """异步版本的 count()"""
+        return await AsyncExecutor.run(self.count, max_age)
+
+    def exists(self) -> bool:
+        """是否存在符合条件的记录，使用 SELECT 1 ... LIMIT 1，找到第一行即停止扫描"""
+        shards = self._shards()
+        if shards is not None:
+            return any(parallel(*[shard.exists for shard in shards]))
+        stmt = self._build_statement(self._seek_tree(), [], 1, None, "exists")
+        return len(self._raw_rows(stmt)) > 0
+
+    async def aexists(self) -> bool:
+        """异步版本的 exists()"""
+        return await AsyncExecutor.run(self.exists)
+
+    def estimate_count(self) -> int:
+        """
+        估算记录数，用于分页总数等不要求精确的场景
+
+        没有条件时读取 information_schema.TABLES 中的统计行数，否则使用 EXPLAIN 中优化器估算的行数
+        (各表 rows * filtered 的乘积)。统计信息可能滞后于实际数据。
+        """
+        shards = self._shards()
+        if shards is not None:
+            return sum(parallel(*[shard.estimate_count for shard in shards]))
+        db_name = self._read_db()
+        if self._where.count() == 0 and not self._after and not self._joins and not self._group_by:
+            rows = Executor.select(
+                Statement(
+                    "SELECT TABLE_ROWS AS table_rows FROM information_schema.TABLES "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                    (self._model.get_table_name(),),
+                ),
+                db_name,
+            )
+            if rows and rows[0]["table_rows"] is not None:
+                return int(rows[0]["table_rows"])
+
+        stmt = self._build_statement(self._seek_tree(), [], None, None, "estimate")
+        estimate = 1.0
+        for row in Executor.select(Statement(f"EXPLAIN {stmt.get_sql()}", stmt.get_args()), db_name):
+            if row.get("rows") is None:
+                continue
+            filtered = row.get("filtered")
+            estimate *= float(row["rows"]) * (100.0 if filtered is None else float(filtered)) / 100.0
+        return int(round(estimate))
+
+    def _fetch_one(self, stmt: Statement) -> M:
+        return self._only(self._select_rows(stmt))
+
+    @staticmethod
+    def _only(items: List[M]) -> M:
+        if not items or len(items) == 0:
+            raise NotFoundError()
+        if len(items) > 1:
+            raise MultipleRecordsError()
+        return items[0]
+
+    def _fetch_one_or_none(self, stmt: Statement) -> M | None:
         try:
-            return self.get(first=True)
+            return self._fetch_one(stmt)
         except NotFoundError:
             return None
 
-    def get(self, first: bool = False) -> M:
-        # 构建 SELECT 部分
-        fields = ", ".join(self.fields) if self.fields else "*"
-        table_name = self._model.get_table_name()
-        sql = f"SELECT {fields} FROM {table_name}"
-        args = ()
-
-        # 构建 WHERE 部分
-        if self._where.count() > 0:
-            where_sql, where_args = self._where.tree().parse("%s")
-            sql += f" WHERE {where_sql}"
-            args += where_args
+    def _fetch_all(self, stmt: Statement) -> List[M]:
+        return self._select_rows(stmt)
+
+    def _fetch_iter(self, stmt: Statement, batch_size: int) -> Iterator[M]:
+        if self._prefetch and is_in_transaction():
+            # 事务中流式读取期间连接不能执行其他查询，预加载时改为一次读取后分批处理
+            items = list(Executor.select_rows(stmt, self._read_db(), self._decoder()))
+            for start in range(0, len(items), batch_size):
+                batch = items[start : start + batch_size]
+                prefetch_related(batch, self._prefetch, batch_size)
+                yield from batch
+            return
+        batches = Executor.stream(stmt, self._read_db(), batch_size, SSCursor, self._decoder())
+        for items in batches:
+            if self._prefetch:
+                prefetch_related(items, self._prefetch, batch_size)
+            yield from items
+
+    def _fetch_keyset(
+        self, seek: ConditionTree | None, order_by: List[Tuple[str, str]], limit: int, position: int
+    ) -> Tuple[List[M], List[Any]]:
+        """
+        keyset 查询，返回记录和第 position 行的排序列值(不足 position 行时为空列表)
+
+        排序列值从查询结果的列中读取，连接查询时同时查询被连接模型的字段，排序列可以属于被连接的模型。
+        """
+        fields = list(self.fields or ())
+        if self._joins:
+            stmt = self._build_statement(seek, order_by, limit, None, "rows")
+            columns = [f"{model.get_table_name()}.{name}" for model, names in self._join_columns() for name in names]
+        else:
+            stmt = self._build_statement(seek, order_by, limit, None)
+            columns = fields
+        rows = self._raw_rows(stmt)
+        decoder = self._decoder()
+        items = [decoder(row[: len(fields)]) for row in rows]
+        if self._prefetch:
+            prefetch_related(items, self._prefetch)
+        if len(rows) < position:
+            return items, []
+        row = rows[position - 1]
+        return items, [row[columns.index(self._qualify(name))] for name, _ in order_by]
+
+    def _decoder(self) -> Callable[[Tuple[Any, ...]], M]:
+        return self._model._decoder(tuple(self.fields or ()))
+
+    def _raw_rows(self, stmt: Statement) -> Sequence[Tuple[Any, ...]]:
+        """查询未解码的元组行，启用缓存时使用结果缓存"""
+        if not self._cached:
+            return Executor.select_rows(stmt, self._read_db())
+        db_name = self._cache_db()
+        return result_cache.fetch(
+            db_name, self._tables(), stmt, lambda: Executor.select_rows(stmt, db_name), self._cache_ttl
+        )
+
+    def _select_rows(self, stmt: Statement) -> List[M]:
+        decoder = self._decoder()
+        if not self._cached:
+            items = list(Executor.select_rows(stmt, self._read_db(), decoder))
+        else:
+            # 缓存未解码的元组行，每次返回新的模型对象
+            items = list(map(decoder, self._raw_rows(stmt)))
+        if self._prefetch:
+            prefetch_related(items, self._prefetch)
+        return items
+
+    def _fetch_count(self, stmt: Statement) -> int:
+        if self._cached:
+            db_name = self._cache_db()
+            return result_cache.fetch(
+                db_name, self._tables(), stmt, lambda: self._count_rows(stmt, db_name), self._cache_ttl
+            )
+        return self._count_rows(stmt, self._read_db())
+
+    def _count_rows(self, stmt: Statement, db_name: str) -> int:
+        rows = Executor.select(stmt, db_name)
+        return rows[0]["count"]
 
-        # 添加 ORDER BY 部分
-        if len(self._order_by) > 0:
-            order_by_sql = ", ".join(self._order_by)
-            sql += f" ORDER BY {order_by_sql}"
+    def _read_db(self) -> str:
+        """执行查询的数据库：配置了副本时按负载均衡策略和读己之写窗口选择"""
+        return route_read(self._database or "default", self._using)
 
-        # 添加 LIMIT 1
-        if first:
-            sql += " LIMIT 1"
+    def _cache_db(self) -> str:
+        """
+        填充结果缓存的查询使用主库
 
-        stmt = Statement(sql=sql, args=args)
-        rows = Executor.select(stmt)
-        if not rows or len(rows) == 0:
-            raise NotFoundError()
-        if len(rows) > 1:
-            raise MultipleRecordsError()
-        row = rows[0]
-        return self._model(**row)
+        写入使缓存失效后，落后的副本仍可能返回写入前的数据，这些数据会被缓存到 TTL 结束。
+        """
+        return primary_of(self._read_db())
 
-    def list(self) -> List[M]:
-        """查询所有记录，返回 Statement"""
+    def _shards(self) -> "List[Select[M]] | None":
+        """分片模型按分片键拆分后各分片的查询，非分片模型或 using() 指定了数据库时返回 None"""
+        if self._using not in (None, "primary", "replica"):
+            return None
+        return route(self)
+
+    def _routed(self, op: str) -> "Select[M]":
+        """只能在一个分片上执行的操作，分片键未固定到一个分片时报错"""
+        if self._using not in (None, "primary", "replica"):
+            return self
+        return single(self, op)
+
+    def _gather(self, shards: "List[Select[M]]", limit: int | None, offset: int | None) -> List[M]:
+        """
+        并发查询各分片并合并结果
+
+        每个分片取前 limit + offset 条，合并后按 ORDER BY 排序(NULL 排在升序的最前)再截取。
+        合并使用 Python 的比较，与字符串列的排序规则(如 _ci 忽略大小写)不一致，因此不支持按 Str 字段排序。
+        """
+        if len(shards) == 1:
+            shards[0]._limit, shards[0]._offset = limit, offset
+            return shards[0]._fetch_all(shards[0]._statement("list"))
+        self._check_selected([name for name, _ in self._order_by])
+        fields = self._model.get_fields()
+        strings = [name for name, _ in self._order_by if isinstance(fields[name], Str)]
+        if strings:
+            raise ValueError(
+                f"cannot merge shards of {self._model.__name__} ordered by string fields ({', '.join(strings)}): "
+                "collation order differs from Python; pin the shard key"
+            )
+        window = None if limit is None else limit + (offset or 0)
+        for shard in shards:
+            shard._limit, shard._offset = window, None
+        items = [item for chunk in parallel(*shards) for item in chunk]
+        # 稳定排序，从最后一个排序列开始依次排序
+        for name, direction in reversed(self._order_by):
+            items.sort(key=functools.partial(_sort_key, name), reverse=direction == "desc")
+        start = offset or 0
+        return items[start:] if limit is None else items[start : start + limit]
+
+    def _statement(self, kind: str) -> Statement:
+        """按查询类型(get/first/list/count)构建语句"""
+        seek = self._seek_tree()
+        if kind == "count":
+            return self._build_statement(seek, [], None, None, kind)
+        if kind == "rows":
+            return self._build_statement(seek, self._order_by, self._limit, self._offset, kind)
+        if kind == "list":
+            return self._build_statement(seek, self._order_by, self._limit, self._offset)
+        return self._build_statement(seek, self._order_by, 1 if kind == "first" else None, None)
+
+    def _build_statement(
+        self,
+        seek: ConditionTree | None,
+        order_by: List[Tuple[str, str]],
+        limit: int | None,
+        offset: int | None,
+        kind: str = "select",
+        aggregates: Tuple[Tuple[str, Aggregate], ...] = (),
+    ) -> Statement:
+        if kind != "aggregate" and (self._group_by or self._having):
+            raise ValueError("group_by() and having() only apply to aggregate()")
+        start = time.perf_counter()
+        where_tree = self._where_tree(seek)
+        has_limit = limit is not None
+        has_offset = offset is not None
+        # SQL 模板只与查询结构有关，按结构缓存，每次只收集参数
+        key = (
+            kind,
+            self._model,
+            tuple(self.fields or ()),
+            tuple(self._joins),
+            where_tree.shape(),
+            tuple(order_by),
+            has_limit,
+            has_offset,
+        )
+        if kind == "aggregate":
+            key += (
+                tuple((alias, aggregate.shape()) for alias, aggregate in aggregates),
+                tuple(self._group_by),
+                tuple(having.shape() for having in self._having),
+            )
+        sql = cached_sql(key, lambda: self._render(kind, where_tree, order_by, has_limit, has_offset, aggregates))
+
+        args = where_tree.values()
+        if kind == "aggregate":
+            args.extend(having.value for having in self._having)
+        if limit is not None:
+            args.append(limit)
+        if offset is not None:
+            args.append(offset)
+        return Statement(sql=sql, args=tuple(args), build_time=time.perf_counter() - start)
+
+    def _render(
+        self,
+        kind: str,
+        where_tree: ConditionTree,
+        order_by: List[Tuple[str, str]],
+        has_limit: bool,
+        has_offset: bool,
+        aggregates: Tuple[Tuple[str, Aggregate], ...] = (),
+    ) -> str:
         # 构建 SELECT 部分
-        fields = ", ".join(self.fields) if self.fields else "*"
         table_name = self._model.get_table_name()
-        sql = f"SELECT {fields} FROM {table_name}"
-        args = ()
+        if kind == "count":
+            sql = f"SELECT COUNT(*) AS count FROM {table_name}"
+        elif kind in ("exists", "estimate"):
+            sql = f"SELECT 1 FROM {table_name}"
+        elif kind == "aggregate":
+            columns = [self._qualify(name) for name in self._group_by]
+            # 别名来自参数名，可能是 order、group 等保留字
+            columns.extend(f"{aggregate.sql(self._column)} AS `{alias}`" for alias, aggregate in aggregates)
+            sql = f"SELECT {', '.join(columns)} FROM {table_name}"
+        elif kind == "rows":
+            columns = [f"{model.get_table_name()}.{name}" for model, names in self._join_columns() for name in names]
+            sql = f"SELECT {', '.join(columns)} FROM {table_name}"
+        else:
+            fields = ", ".join(map(self._qualify, self.fields)) if self.fields else "*"
+            sql = f"SELECT {fields} FROM {table_name}"
+
+        # 构建 JOIN 部分
+        for join_kind, model, on in self._joins:
+            on_sql = " AND ".join(f"{left} = {right}" for left, right in on)
+            sql += f" {join_kind} {model.get_table_name()} ON {on_sql}"
 
         # 构建 WHERE 部分
-        if self._where.count() > 0:
-            where_sql, where_args = self._where.tree().parse("%s")
+        if where_tree.count() > 0:
+            where_sql, _ = where_tree.parse("%s", self._qualify)
             sql += f" WHERE {where_sql}"
-            args += where_args
+
+        # 构建 GROUP BY 和 HAVING 部分
+        if kind == "aggregate" and self._group_by:
+            sql += f" GROUP BY {', '.join(map(self._qualify, self._group_by))}"
+        if kind == "aggregate" and self._having:
+            having_sql = " AND ".join(
+                f"{having.aggregate.sql(self._column)} {having.operation.value} %s" for having in self._having
+            )
+            sql += f" HAVING {having_sql}"
 
         # 添加 ORDER BY 部分
-        if len(self._order_by) > 0:
-            order_by_sql = ", ".join(self._order_by)
+        if len(order_by) > 0:
+            order_by_sql = ", ".join([f"{self._qualify(field)} {direction}" for field, direction in order_by])
             sql += f" ORDER BY {order_by_sql}"
 
         # 添加 LIMIT 和 OFFSET 部分
-        if hasattr(self, "_limit"):
-            sql += f" LIMIT {self._limit}"
-        if hasattr(self, "_offset"):
-            sql += f" OFFSET {self._offset}"
+        if has_limit:
+            sql += " LIMIT %s"
+        if has_offset:
+            sql += " OFFSET %s"
+        return sql
+
+    def _where_tree(self, seek: ConditionTree | None) -> ConditionTree:
+        """合并用户条件与 keyset 条件"""
+        if seek is None:
+            return self._where.tree()
+        tree = ConditionTree("and")
+        if self._where.count() > 0:
+            tree.add_tree(self._where.tree())
+        tree.add_tree(seek)
+        return tree
 
-        stmt = Statement(sql=sql, args=args)
-        rows = Executor.select(stmt)
-        return [self._model(**row) for row in rows]
+    def _seek_tree(self) -> ConditionTree | None:
+        if not self._after:
+            return None
+        missing = [name for name, _ in self._order_by if name not in self._after]
+        if missing:
+            raise ValueError(f"after() requires values for all ORDER BY columns, missing: {', '.join(missing)}")
+        return seek_condition(self._order_by, [self._after[name] for name, _ in self._order_by])
+
+    def _check_selected(self, names: List[str]) -> None:
+        # 被连接模型的字段带有表名，连接查询总是查询被连接模型的所有字段
+        missing = [name for name in names if self.fields and "." not in name and name not in self.fields]
+        if missing:
+            raise ValueError(f"keyset columns must be selected: {', '.join(missing)}")
+
+    def _join(self, kind: str, model: Type[Model], on: JoinOn) -> "Select[M]":
+        tables = [self._model.get_table_name()] + [joined.get_table_name() for _, joined, _ in self._joins]
+        if model.get_table_name() in tables:
+            raise ValueError(f"table {model.get_table_name()} is already part of this query")
+        pairs = [on] if isinstance(on, tuple) and len(on) == 2 and isinstance(on[0], Field) else list(on)
+        if not pairs:
+            raise ValueError("join requires at least one (left, right) field pair")
+        self._joins.append((kind, model, tuple((_column(left), _column(right)) for left, right in pairs)))
+        return self
 
-    def count(self) -> int:
-        """统计记录数，返回数量"""
-        table_name = self._model.get_table_name()
-        sql = f"SELECT COUNT(*) AS count FROM {table_name}"
-        args = ()
+    def _name(self, field: Field) -> str:
+        """条件和排序中的字段名，其他模型的字段带上表名"""
+        if field.model is None or field.model is self._model:
+            return field.name
+        return _column(field)
 
-        # 构建 WHERE 部分
-        if self._where.count() > 0:
-            where_sql, where_args = self._where.tree().parse("%s")
-            sql += f" WHERE {where_sql}"
-            args += where_args
+    def _column(self, field: Field) -> str:
+        """聚合表达式中的列名"""
+        return self._qualify(self._name(field))
 
-        stmt = Statement(sql=sql, args=args)
-        rows = Executor.select(stmt)
-        return rows[0]["count"]
+    def _qualify(self, name: str) -> str:
+        """连接查询中为主模型的字段名加上表名，非连接查询保持原样"""
+        if not self._joins or "." in name:
+            return name
+        return f"{self._model.get_table_name()}.{name}"
+
+    def _join_columns(self) -> List[Tuple[Type[Model], List[str]]]:
+        """rows() 查询的列：主模型的查询字段，以及被连接模型的所有字段"""
+        columns = [(self._model, list(self.fields or ()))]
+        columns.extend((model, model.get_field_names()) for _, model, _ in self._joins)
+        return columns
+
+    def _tables(self) -> Tuple[str, ...]:
+        """查询涉及的所有表，用于结果缓存失效"""
+        return (self._model.get_table_name(),) + tuple(model.get_table_name() for _, model, _ in self._joins)
+
+
+def _column(field: Field) -> str:
+    return f"{field.model.get_table_name()}.{field.name}"
+
+
+def _sort_key(name: str, item: Model) -> Tuple[Any, ...]:
+    value = getattr(item, name)
+    return (0,) if value is None else (1, value)
@@ -0,0 +1,201 @@
+import bisect
+import copy
+import zlib
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Any, Dict, List, Sequence, Tuple, Type, TypeVar
+
+from .compiler import Param
+from .condition import Condition, ConditionTree
+from .connection import transaction_db
+from .operation import Operation
+from .where import Where
+
+if TYPE_CHECKING:
+    from .model import Model
+
+B = TypeVar("B")
+
+
+class ShardStrategy(ABC):
+    """分片策略：按分片键的值选择数据库"""
+
+    def __init__(self, key: str):
+        self.key = key  # 分片键字段名
+
+    @abstractmethod
+    def databases(self) -> List[str]:
+        """所有分片的数据库名"""
+
+    @abstractmethod
+    def shard_for(self, value: Any) -> str:
+        """分片键的值所在的数据库名"""
+
+
+class HashShards(ShardStrategy):
+    """
+    哈希分片：整数按取模，其他值按 CRC32 取模
+        class Order(Model, shards=HashShards("user_id", ["order0", "order1"])):
+            ...
+    """
+
+    def __init__(self, key: str, databases: Sequence[str]):
+        super().__init__(key)
+        if not databases:
+            raise ValueError("databases must not be empty")
+        self._databases = list(databases)
+
+    def databases(self) -> List[str]:
+        return list(self._databases)
+
+    def shard_for(self, value: Any) -> str:
+        if value is None:
+            raise ValueError(f"shard key {self.key} must not be None")
+        if isinstance(value, int):
+            return self._databases[value % len(self._databases)]
+        return self._databases[zlib.crc32(str(value).encode("utf-8")) % len(self._databases)]
+
+
+class RangeShards(ShardStrategy):
+    """
+    范围分片：ranges 为按下界升序排列的 (下界, 数据库)，值落在下界不大于它的最后一个范围
+        RangeShards("user_id", [(0, "order0"), (1_000_000, "order1")])
+    """
+
+    def __init__(self, key: str, ranges: Sequence[Tuple[Any, str]]):
+        super().__init__(key)
+        if not ranges:
+            raise ValueError("ranges must not be empty")
+        bounds = [bound for bound, _ in ranges]
+        if bounds != sorted(bounds):
+            raise ValueError("ranges must be sorted by lower bound")
+        self._bounds = bounds
+        self._databases = [name for _, name in ranges]
+
+    def databases(self) -> List[str]:
+        return list(dict.fromkeys(self._databases))
+
+    def shard_for(self, value: Any) -> str:
+        if value is None:
+            raise ValueError(f"shard key {self.key} must not be None")
+        index = bisect.bisect_right(self._bounds, value) - 1
+        if index < 0:
+            raise ValueError(f"shard key {self.key}={value!r} is below the first range")
+        return self._databases[index]
+
+
+def pinned_values(where_tree: ConditionTree, field: str) -> List[Any] | None:
+    """顶层为 AND 且包含字段的 = 或 IN 条件时返回这些值，否则(包括值为 Param 占位)返回 None"""
+    found = _pinned(where_tree, field)
+    return None if found is None else found[1]
+
+
+def split(model: Type["Model"], where_tree: ConditionTree) -> List[Tuple[str, ConditionTree]]:
+    """
+    按分片键拆分条件，返回 (数据库, 条件树)
+
+    分片键由 = 固定时只访问一个分片；IN 的值按分片拆分，每个分片只查询属于它的值；
+    没有分片键条件时返回所有分片。事务中只能访问事务所在的分片。
+    """
+    strategy = model._shards
+    assert strategy is not None
+    found = _pinned(where_tree, strategy.key)
+    if found is None:
+        targets = [(name, where_tree) for name in strategy.databases()]
+    else:
+        index, values = found
+        groups: Dict[str, List[Any]] = {}
+        for value in values:
+            groups.setdefault(strategy.shard_for(value), []).append(value)
+        if len(groups) <= 1:
+            targets = [(name, where_tree) for name in groups]
+        else:
+            targets = [(name, _replace(where_tree, index, strategy.key, group)) for name, group in groups.items()]
+    for name, _ in targets:
+        check_transaction(name)
+    return targets
+
+
+def route(builder: B) -> List[B] | None:
+    """
+    将查询或写操作按分片键复制到各分片，每个副本只带有属于该分片的条件
+
+    构建器需要有 _model、_where 和 _database 属性；模型未分片或已确定数据库时返回 None。
+    """
+    model = builder._model  # type: ignore[attr-defined]
+    if model._shards is None or builder._database is not None:  # type: ignore[attr-defined]
+        return None
+    copies = []
+    for db_name, tree in split(model, builder._where.tree()):  # type: ignore[attr-defined]
+        clone = copy.copy(builder)
+        clone._database = db_name  # type: ignore[attr-defined]
+        clone._where = Where.of(tree)  # type: ignore[attr-defined]
+        copies.append(clone)
+    return copies
+
+
+def single(builder: B, op: str) -> B:
+    """只能在一个分片上执行的操作：返回路由到该分片的副本，分片键未固定到一个分片时报错"""
+    copies = route(builder)
+    if copies is None:
+        return builder
+    if len(copies) != 1:
+        model = builder._model  # type: ignore[attr-defined]
+        raise ValueError(f"{op}() on sharded model {model.__name__} requires the shard key pinned to one shard")
+    return copies[0]
+
+
+def group_rows(model: Type["Model"], rows: Sequence[Any], atomic: bool = False) -> Dict[str, List[int]]:
+    """按分片对待写入的行(字典或模型对象)的下标分组，atomic 的写入不能跨分片"""
+    groups: Dict[str, List[int]] = {}
+    for index, row in enumerate(rows):
+        data = row if isinstance(row, dict) else row.to_dict()
+        groups.setdefault(shard_of(model, data), []).append(index)
+    if atomic and len(groups) > 1:
+        raise ValueError(f"atomic writes to {model.__name__} cannot span shards: {', '.join(groups)}")
+    return groups
+
+
+def shard_of(model: Type["Model"], data: Dict[str, Any]) -> str:
+    """待写入的行所在的分片"""
+    strategy = model._shards
+    assert strategy is not None
+    if data.get(strategy.key) is None:
+        raise ValueError(f"{model.__name__} rows must carry a value for the shard key {strategy.key}")
+    name = strategy.shard_for(data[strategy.key])
+    check_transaction(name)
+    return name
+
+
+def check_transaction(db_name: str) -> None:
+    """事务连接属于一个数据库，路由到其他分片的语句不能在事务中执行"""
+    current = transaction_db()
+    if current is not None and current != db_name:
+        raise RuntimeError(f"statement routed to shard {db_name!r} inside a transaction on {current!r}")
+
+
+def _pinned(where_tree: ConditionTree, field: str) -> Tuple[int, List[Any]] | None:
+    if where_tree.logic != "and":
+        return None
+    for index, condition in enumerate(where_tree.conditions):
+        if not isinstance(condition, Condition) or condition.field != field:
+            continue
+        if isinstance(condition.value, Param):
+            return None
+        if condition.operation == Operation.EQ:
+            values = [condition.value]
+        elif condition.operation == Operation.IN:
+            values = list(condition.value)
+        else:
+            continue
+        if any(isinstance(value, Param) for value in values):
+            return None
+        return index, values
+    return None
+
+
+def _replace(where_tree: ConditionTree, index: int, field: str, values: List[Any]) -> ConditionTree:
+    """复制顶层条件树，将分片键条件替换为该分片的 IN 值"""
+    tree = ConditionTree(where_tree.logic)
+    tree.conditions = list(where_tree.conditions)
+    tree.conditions[index] = Condition(field, values, Operation.IN)
+    return tree
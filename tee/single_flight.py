@@ -0,0 +1,94 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    __slots__ = ("done", "value", "error", "waiters", "started")
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: BaseException | None = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    合并并发的相同查询：同一个键同一时间只执行一次，执行期间到达的调用等待并共享其结果
+
+    只合并正在执行的查询，执行结束后不保留结果，不会返回过时的数据。
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, load: Callable[[], Any], written_at: float | None = None) -> Tuple[Any, bool]:
+        """
+        返回结果和结果是否被多个调用方共享；load 出错时所有等待的调用方收到同一个异常
+
+        written_at 为调用方最近一次写入的时间(time.monotonic)，早于该时间开始的查询可能读不到这次写入，不会合并。
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            stale = call is not None and written_at is not None and call.started <= written_at
+            leader = call is None
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            elif stale:
+                self.executions += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+        if stale:
+            return load(), False
+        if leader:
+            return self._lead(key, call, load)
+        return self._wait(call)
+
+    def _lead(self, key: Hashable, call: _Call, load: Callable[[], Any]) -> Tuple[Any, bool]:
+        try:
+            call.value = load()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                shared = call.waiters > 0
+            call.done.set()
+        return call.value, shared
+
+    @staticmethod
+    def _wait(call: _Call) -> Tuple[Any, bool]:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.value, True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"in_flight": len(self._calls), "executions": self.executions, "coalesced": self.coalesced}
+
+
+single_flight = SingleFlight()
+
+
+def enable_single_flight() -> None:
+    """开启相同查询的合并，事务中的查询不会合并"""
+    single_flight.enabled = True
+
+
+def disable_single_flight() -> None:
+    single_flight.enabled = False
+
+
+def single_flight_stats() -> Dict[str, int]:
+    """返回正在执行的查询数、实际执行次数和被合并的调用次数"""
+    return single_flight.stats()
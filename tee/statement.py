@@ -2,9 +2,11 @@ from typing import Any, Tuple
 
 
 class Statement:
-    def __init__(self, sql: str, args: Tuple[Any, ...] = ()):
+    def __init__(self, sql: str, args: Tuple[Any, ...] = (), build_time: float = 0.0, tables: Tuple[str, ...] = ()):
         self.sql = sql  # SQL 语句模板
         self.args = args  # 参数列表
+        self.build_time = build_time  # 构建 SQL 的耗时(秒)
+        self.tables = tables  # 写语句修改的表，执行后使这些表的结果缓存失效
 
     def get_sql(self) -> str:
         return self.sql
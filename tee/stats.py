@@ -0,0 +1,214 @@
+import functools
+import json
+import math
+import re
+import threading
+from typing import Any, Dict, List, Literal, Tuple
+
+from .hooks import QueryEvent, QueryHook, add_hook, remove_hook
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_ROWS = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+_WHENS = re.compile(r"\bWHEN\s+\?\s+THEN\s+\?(?:\s+WHEN\s+\?\s+THEN\s+\?)*", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=4096)
+def fingerprint(sql: str) -> str:
+    """
+    归一化 SQL：字面量和占位符替换为 ?，IN 列表和多行 VALUES 折叠为 (...)，
+    连续的 WHEN ? THEN ? 折叠为 WHEN ? THEN ? ...，合并空白
+
+    参数不同、IN 列表长度不同、批量 CASE 更新行数不同的语句得到相同的指纹。
+    """
+    sql = _STRING.sub("?", sql)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _LIST.sub("(...)", sql)
+    sql = _ROWS.sub("(...)", sql)
+    sql = _WHENS.sub("WHEN ? THEN ? ...", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+class LatencyHistogram:
+    """对数分桶的流式直方图，内存占用与样本数无关，分位数相对误差约为 9%"""
+
+    BASE = 1e-6  # 最小桶的上界(秒)
+    GROWTH = 2 ** 0.25  # 相邻桶上界的比值
+
+    def __init__(self) -> None:
+        self._buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        index = 0 if value <= self.BASE else math.ceil(math.log(value / self.BASE, self.GROWTH))
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """返回第 q 分位数(0~1)所在桶的上界，不超过观测到的最大值"""
+        if self.count == 0:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                return max(self.min, min(self.max, self.BASE * self.GROWTH**index))
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class QueryStats:
+    """单个指纹的累计统计"""
+
+    def __init__(self, db_name: str, fingerprint: str):
+        self.db_name = db_name
+        self.fingerprint = fingerprint
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0  # 返回的行数
+        self.affected = 0  # 受影响的行数
+        self.latency = LatencyHistogram()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "db_name": self.db_name,
+            "fingerprint": self.fingerprint,
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_time": self.latency.total,
+            "mean_time": self.latency.mean,
+            "p50_time": self.latency.quantile(0.5),
+            "p99_time": self.latency.quantile(0.99),
+            "max_time": self.latency.max,
+            "rows": self.rows,
+            "affected": self.affected,
+        }
+
+
+SortKey = Literal["total_time", "mean_time", "p99_time", "calls", "errors", "rows", "affected"]
+
+
+class StatsRegistry(QueryHook):
+    """
+    进程内的查询统计，按 (数据库, 指纹) 汇总调用次数、耗时分布、行数和错误数
+
+    作为查询钩子注册后生效：
+        registry = enable_stats()
+        ...
+        print(registry.report(10))
+    """
+
+    def __init__(self, max_entries: int = 5000):
+        self.max_entries = max_entries
+        self._entries: Dict[Tuple[str, str], QueryStats] = {}
+        self._lock = threading.Lock()
+        self.dropped = 0  # 超过 max_entries 后未记录的语句数
+
+    def after(self, event: QueryEvent) -> None:
+        self._record(event, failed=False)
+
+    def error(self, event: QueryEvent) -> None:
+        self._record(event, failed=True)
+
+    def _record(self, event: QueryEvent, failed: bool) -> None:
+        key = (event.db_name, fingerprint(event.sql))
+        elapsed = event.total_time
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if len(self._entries) >= self.max_entries:
+                    self.dropped += 1
+                    return
+                entry = self._entries[key] = QueryStats(*key)
+            entry.calls += 1
+            entry.latency.add(elapsed)
+            if failed:
+                entry.errors += 1
+            else:
+                entry.rows += event.rows
+                entry.affected += event.affected
+
+    def top(self, n: int = 10, sort: SortKey = "total_time") -> List[Dict[str, Any]]:
+        """按 sort 指标降序返回前 n 个指纹的统计"""
+        with self._lock:
+            items = [entry.to_dict() for entry in self._entries.values()]
+        if items and sort not in items[0]:
+            raise ValueError(f"unsupported sort key: {sort}")
+        items.sort(key=lambda item: item[sort], reverse=True)
+        return items[:n]
+
+    def report(self, n: int = 10, sort: SortKey = "total_time", format: Literal["table", "json"] = "table") -> str:
+        """以文本表格或 JSON 输出前 n 个指纹的统计，耗时单位为毫秒"""
+        items = self.top(n, sort)
+        if format == "json":
+            return json.dumps(items, ensure_ascii=False, indent=2)
+        if format != "table":
+            raise ValueError(f"unsupported report format: {format}")
+
+        header = ["calls", "errors", "total_ms", "mean_ms", "p50_ms", "p99_ms", "rows", "affected", "query"]
+        lines = [header]
+        for item in items:
+            lines.append(
+                [
+                    str(item["calls"]),
+                    str(item["errors"]),
+                    f'{item["total_time"] * 1000:.2f}',
+                    f'{item["mean_time"] * 1000:.3f}',
+                    f'{item["p50_time"] * 1000:.3f}',
+                    f'{item["p99_time"] * 1000:.3f}',
+                    str(item["rows"]),
+                    str(item["affected"]),
+                    f'[{item["db_name"]}] {item["fingerprint"]}',
+                ]
+            )
+        widths = [max(len(line[i]) for line in lines) for i in range(len(header) - 1)]
+        return "\n".join(
+            "  ".join(cell.rjust(width) for cell, width in zip(line, widths)) + "  " + line[-1] for line in lines
+        )
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.dropped = 0
+
+
+_registry: StatsRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def enable_stats(max_entries: int = 5000) -> StatsRegistry:
+    """开启全局查询统计，返回统计对象；已开启时直接返回"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = StatsRegistry(max_entries)
+            add_hook(_registry)
+        return _registry
+
+
+def disable_stats() -> None:
+    """关闭全局查询统计并丢弃已收集的数据"""
+    global _registry
+    with _registry_lock:
+        if _registry is not None:
+            remove_hook(_registry)
+            _registry = None
+
+
+def get_stats() -> StatsRegistry | None:
+    """返回全局查询统计对象，未开启时返回 None"""
+    return _registry
@@ -1,7 +1,18 @@
-from typing import Any, Dict, Generic, Type, TypeVar
+import copy
+import itertools
+import time
+from contextlib import nullcontext
+from typing import Any, Dict, Generic, Iterable, Iterator, List, Sequence, Set, Tuple, Type, TypeVar
 
+from .aio import AsyncExecutor
+from .compiler import CompiledStatement, cached_sql
+from .condition import ConditionTree
+from .connection import is_in_transaction, transaction
+from .entity_cache import invalidate_entities, touched_keys
 from .executor import Executor
+from .insert import PACKET_BUDGET_RATIO, Insert, _estimate_size
 from .model import Field, Model
+from .sharding import group_rows, route, single
 from .statement import Statement
 from .where import Where
 
@@ -15,6 +26,8 @@ class Update(Generic[M]):
         self._model = model
         self._where = Where()
         self._update_fields: Dict[str, Any] = {}
+        # 分片模型按分片键路由后的数据库
+        self._database: str | None = None
 
     def or_(self):
         pass
@@ -77,17 +90,199 @@ class Update(Generic[M]):
         return self
 
     def execute(self) -> int:
+        """执行更新，分片模型按条件中的分片键路由，没有分片键条件时依次更新所有分片"""
+        shards = self._shards()
+        if shards is not None:
+            return sum(shard.execute() for shard in shards)
+        return self._run(self._statement())
+
+    async def aexecute(self) -> int:
+        """异步版本的 execute()，在线程池中执行，不阻塞事件循环"""
+        return await AsyncExecutor.run(self.execute)
+
+    def compile(self) -> CompiledStatement:
+        """编译更新语句，更新值和条件值可以使用 Param 占位，执行时按名称传入"""
+        shard = single(self, "compile")
+        if shard is not self:
+            shard._check_shard_key()
+        return CompiledStatement(shard._statement(), shard._run)
+
+    def execute_bulk(
+        self,
+        rows: Iterable[Dict[str, Any] | M],
+        key: Field | None = None,
+        upsert: bool = False,
+        batch_size: int = 1000,
+        max_packet_size: int | None = None,
+        atomic: bool = False,
+    ) -> List[int]:
+        """
+        按键批量更新，每行的值可以不同，返回每条语句影响的行数
+
+        rows 可以是字典或模型对象的任意可迭代对象，按需读取；更新第一行中除 key 以外的字段，key 默认为主键，
+        其他行的字段需与第一行相同(否则报错，已执行的批次不会撤销，需要时使用 atomic=True)：
+            UPDATE t SET a = CASE id WHEN %s THEN %s ... END, ... WHERE id IN (...)
+        upsert 为 True 时生成 INSERT ... ON DUPLICATE KEY UPDATE，不存在的行会被插入，MySQL 对插入的行计 1、修改的行计 2。
+        每条语句最多 batch_size 行，且估算大小不超过 max_packet_size(默认读取服务端 max_allowed_packet)。
+        atomic 为 True 时所有语句在同一个事务中执行。分片模型的每行需要带有分片键，按分片分组后写入各分片。
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        if self._model._shards is not None and self._database is None:
+            all_rows = list(rows)
+            results: List[int] = []
+            for db_name, indexes in group_rows(self._model, all_rows, atomic).items():
+                shard = copy.copy(self)
+                shard._database = db_name
+                results.extend(
+                    shard.execute_bulk([all_rows[i] for i in indexes], key, upsert, batch_size, max_packet_size, atomic)
+                )
+            return results
+
+        db_name = self._database or "default"
+        key_name = self._model.get_primary_key() if key is None else key.name
+        remaining = iter(rows)
+        first = next(remaining, None)
+        if first is None:
+            return []
+        first_data = first.to_dict() if isinstance(first, Model) else first
+
+        field_names = self._model.get_field_names()
+        names = [k for k in first_data.keys() if k in field_names and k != key_name]
+        if len(names) == 0:
+            raise ValueError("no valid field found")
+        checked = _same_fields(remaining, key_name, names, set(field_names))
+
+        results = []
+        with transaction(db_name) if atomic and not is_in_transaction() else nullcontext():
+            if max_packet_size is None:
+                max_packet_size = Executor.max_allowed_packet(db_name)
+            if upsert:
+                statements = Insert(self._model)._bulk_statements(
+                    [key_name] + names, first, first_data, checked, names, batch_size, max_packet_size
+                )
+                for stmt, _ in statements:
+                    results.append(Executor.execute(stmt, db_name))
+                    invalidate_entities(self._model, None)
+                return results
+
+            data = (item.to_dict() if isinstance(item, Model) else item for item in itertools.chain([first], checked))
+            values = ((row.get(key_name), [row.get(name) for name in names]) for row in data)
+            for stmt, keys in case_statements(self._model, key_name, names, values, batch_size, max_packet_size):
+                results.append(Executor.execute(stmt, db_name))
+                invalidate_entities(self._model, keys if key_name == self._model._primary_key else None)
+        return results
+
+    async def aexecute_bulk(self, rows: Iterable[Dict[str, Any] | M], **options: Any) -> List[int]:
+        """异步版本的 execute_bulk()，参数相同"""
+        return await AsyncExecutor.run(self.execute_bulk, rows, **options)
+
+    def _shards(self) -> "List[Update[M]] | None":
+        shards = route(self)
+        if shards is not None:
+            self._check_shard_key()
+        return shards
+
+    def _check_shard_key(self) -> None:
+        strategy = self._model._shards
+        assert strategy is not None
+        key = strategy.key
+        if key in self._update_fields:
+            raise ValueError(f"cannot update shard key {key} of {self._model.__name__}, the row would change shards")
+
+    def _run(self, stmt: Statement) -> int:
+        affected = Executor.execute(stmt, self._database or "default")
+        # 修改主键时无法确定受影响的缓存条目，清空整张表
+        pk_changed = self._model._primary_key in self._update_fields
+        invalidate_entities(self._model, None if pk_changed else touched_keys(self._model, self._where.tree()))
+        return affected
+
+    def _statement(self) -> Statement:
+        if self._where.count() == 0:
+            raise ValueError("Update operation requires at least one condition to prevent full table deletion.")
+
+        start = time.perf_counter()
+        where_tree = self._where.tree()
+        key = ("update", self._model, tuple(self._update_fields.keys()), where_tree.shape())
+        sql = cached_sql(key, lambda: self._render(where_tree))
+        args = tuple(self._update_fields.values()) + tuple(where_tree.values())
+        return Statement(sql, args, time.perf_counter() - start, (self._model.get_table_name(),))
+
+    def _render(self, where_tree: ConditionTree) -> str:
         table_name = self._model.get_table_name()
         sql = f'UPDATE {table_name} SET {",".join([f"{k}=%s" for k in self._update_fields.keys()])}'
-        args = tuple(self._update_fields.values())
 
         # 构建 WHERE 部分
-        if self._where.count() > 0:
-            where_sql, where_args = self._where.tree().parse("%s")
-            sql += f" WHERE {where_sql}"
-            args += where_args
-        else:
-            raise ValueError("Update operation requires at least one condition to prevent full table deletion.")
+        where_sql, _ = where_tree.parse("%s")
+        sql += f" WHERE {where_sql}"
+        return sql
+
+
+def _same_fields(
+    items: Iterator[Dict[str, Any] | M], key: str, names: Sequence[str], field_names: Set[str]
+) -> Iterator[Dict[str, Any] | M]:
+    """逐行检查更新的字段与第一行一致，缺少的字段会被写为 NULL"""
+    expected = set(names)
+    for item in items:
+        data = item.to_dict() if isinstance(item, Model) else item
+        if {k for k in data if k in field_names and k != key} != expected:
+            raise ValueError(f"every row must update the same fields as the first row: {', '.join(names)}")
+        yield item
+
+
+def case_statements(
+    model: Type[Model],
+    key: str,
+    names: Sequence[str],
+    rows: Iterable[Tuple[Any, Sequence[Any]]],
+    batch_size: int,
+    max_packet_size: int,
+) -> Iterator[Tuple[Statement, List[Any]]]:
+    """
+    按行数和估算大小切分多行更新语句，rows 为 (键值, 各字段的新值)，同时返回每条语句的键值：
+        UPDATE t SET a = CASE id WHEN %s THEN %s ... END, ... WHERE id IN %s
+
+    MySQL 按顺序执行 SET 中的赋值，修改键字段时应把键字段放在最后。
+    """
+    table_name = model.get_table_name()
+    budget = int(max_packet_size * PACKET_BUDGET_RATIO) - len(_render_case(table_name, key, names, 0))
+    chunk: List[Tuple[Any, Sequence[Any]]] = []
+    size = 0
+    for pk, values in rows:
+        if pk is None:
+            raise ValueError(f"every row must carry a value for {key}")
+        # 键值在每个 CASE 和 IN 列表中各出现一次
+        key_size = _estimate_size(pk)
+        row_size = len(names) * (key_size + len(_WHEN)) + sum(_estimate_size(v) for v in values) + key_size + 2
+        if chunk and (len(chunk) >= batch_size or size + row_size > budget):
+            yield _case_statement(table_name, key, names, chunk), [pk for pk, _ in chunk]
+            chunk = []
+            size = 0
+        chunk.append((pk, values))
+        size += row_size
+    if chunk:
+        yield _case_statement(table_name, key, names, chunk), [pk for pk, _ in chunk]
+
+
+_WHEN = " WHEN %s THEN %s"
+
+
+def _case_statement(
+    table_name: str, key: str, names: Sequence[str], rows: List[Tuple[Any, Sequence[Any]]]
+) -> Statement:
+    start = time.perf_counter()
+    # 行数各不相同，不放入 SQL 模板缓存
+    sql = _render_case(table_name, key, names, len(rows))
+    args: List[Any] = []
+    for i in range(len(names)):
+        for pk, values in rows:
+            args.append(pk)
+            args.append(values[i])
+    args.append([pk for pk, _ in rows])
+    return Statement(sql, tuple(args), time.perf_counter() - start, (table_name,))
+
 
-        stmt = Statement(sql, args)
-        return Executor.execute(stmt)
+def _render_case(table_name: str, key: str, names: Sequence[str], count: int) -> str:
+    whens = _WHEN * count
+    assignments = ", ".join(f"{name} = CASE {key}{whens} END" for name in names)
+    return f"UPDATE {table_name} SET {assignments} WHERE {key} IN %s"
@@ -1,6 +1,6 @@
-from typing import Any, TypeVar
+from typing import Any, Iterable, Sequence, TypeVar
 
-from .condition import Condition, ConditionTree
+from .condition import Condition, ConditionTree, RowCondition
 from .operation import Operation
 
 T = TypeVar("T")
@@ -10,6 +10,13 @@ class Where:
     def __init__(self, logic="and") -> None:
         self._condition_tree = ConditionTree(logic)
 
+    @classmethod
+    def of(cls, tree: ConditionTree) -> "Where":
+        """使用已有的条件树构建"""
+        where = cls(tree.logic)
+        where._condition_tree = tree
+        return where
+
     def tree(self) -> ConditionTree:
         return self._condition_tree
 
@@ -41,6 +48,10 @@ class Where:
         self._condition_tree.add_condition(Condition(field, value, Operation.IN))
         return self
 
+    def row_in(self, fields: Sequence[str], values: Iterable[Sequence[Any]]) -> "Where":
+        self._condition_tree.add_condition(RowCondition(fields, values))
+        return self
+
     def l_like(self, field: str, value: Any) -> "Where":
         self._condition_tree.add_condition(Condition(field, f"%{value}", Operation.LIKE))
         return self
@@ -1,6 +1,28 @@
+import asyncio
+import datetime
+import decimal
+import json
+import threading
+from array import array
+
 import pytest
-from unittest.mock import MagicMock, patch
-from tee import Model, Int, Str, set_default_db
+from unittest.mock import MagicMock, PropertyMock, patch
+from pymysql.cursors import Cursor
+from tee import (
+    DateTime, Decimal, Float, Model, Int, Str, Param, PoolConfig, QueryHook, add_hook, disable_stats, enable_stats,
+    pool_stats, remove_hook, set_default_db, transaction, Statement, AsyncLoader, Loader, BelongsTo, HasMany, Count,
+    Sum, Avg, AsyncExecutor, atransaction, Executor, aparallel, parallel, disable_single_flight,
+    enable_single_flight, single_flight_stats, set_db, set_replicas, LeastOutstanding, LatencyWeighted, ReplicaPolicy,
+    HashShards, RangeShards, ShardStrategy,
+)
+from tee.connection import get_pool, is_in_transaction, on_rollback
+from tee.entity_cache import entity_cache
+from tee.errors import PoolTimeoutError
+from tee.relations import Relation
+from tee.replicas import Replica, _last_writes, last_write, route_read
+from tee.result_cache import ResultCache, result_cache
+from tee.single_flight import SingleFlight
+from tee.stats import LatencyHistogram, fingerprint
 
 
 class TestUser(Model):
@@ -69,7 +91,7 @@ class TestSelect:
     def test_select_query_building(self, mock_db):
         """Test select query building"""
         mock_db['cursor'].fetchall.return_value = [
-            {"id": 1, "name": "张三", "email": "test@example.com"}
+            (1, "张三", "test@example.com")
         ]
         
         users = TestUser.select().list()
@@ -125,6 +147,46 @@ class TestUpdate:
         assert "test_user" in call_args[0]
         assert "WHERE" in call_args[0]
 
+    def test_execute_bulk_case_chunks(self, mock_db):
+        """Test execute_bulk compiles CASE updates and reports rows affected per chunk"""
+        cursor = mock_db['cursor']
+        cursor.execute.side_effect = [2, 1]
+        rows = [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}, {"id": 3, "name": "c"}]
+
+        affected = TestUser.update().execute_bulk(rows, batch_size=2, max_packet_size=1 << 20)
+
+        assert affected == [2, 1]
+        sql, args = cursor.execute.call_args_list[0][0]
+        assert sql == "UPDATE test_user SET name = CASE id WHEN %s THEN %s WHEN %s THEN %s END WHERE id IN %s"
+        assert args == (1, "a", 2, "b", [1, 2])
+        assert cursor.execute.call_args_list[1][0][1] == (3, "c", [3])
+
+    def test_execute_bulk_splits_by_packet_size_and_upserts(self, mock_db):
+        """Test execute_bulk keeps statements under the packet budget and supports ON DUPLICATE KEY UPDATE"""
+        cursor = mock_db['cursor']
+        cursor.execute.return_value = 1
+        rows = [{"id": i, "name": "x" * 300} for i in range(4)]
+
+        assert len(TestUser.update().execute_bulk(rows, max_packet_size=1000)) == 4
+
+        cursor.execute.reset_mock()
+        TestUser.update().execute_bulk(rows[:2], key=TestUser.id, upsert=True, max_packet_size=1 << 20)
+        sql, args = cursor.execute.call_args[0]
+        assert sql == "INSERT INTO test_user(id,name) VALUES(%s,%s),(%s,%s) ON DUPLICATE KEY UPDATE name=VALUES(name)"
+        assert args == (0, "x" * 300, 1, "x" * 300)
+
+        with pytest.raises(ValueError):
+            TestUser.update().execute_bulk([{"name": "a"}], max_packet_size=1 << 20)
+
+    def test_execute_bulk_rejects_heterogeneous_rows(self, mock_db):
+        """Test execute_bulk refuses rows whose fields differ from the first row instead of writing NULL"""
+        rows = [{"id": 1, "name": "a"}, {"id": 2, "email": "e"}]
+        with pytest.raises(ValueError):
+            TestUser.update().execute_bulk(rows, max_packet_size=1 << 20)
+        with pytest.raises(ValueError):
+            TestUser.update().execute_bulk(rows, upsert=True, max_packet_size=1 << 20)
+        mock_db['cursor'].execute.assert_not_called()
+
 
 class TestDelete:
     def test_delete_execute(self, mock_db):
@@ -145,5 +207,1447 @@ class TestDelete:
             TestUser.delete().execute()
 
 
+class TestConnectionPool:
+    def test_connection_reused_across_statements(self, mock_db):
+        """Test pooled connection is reused instead of reconnecting"""
+        mock_db['cursor'].fetchall.return_value = []
+
+        TestUser.select().list()
+        TestUser.select().list()
+
+        assert mock_db['connect'].call_count == 1
+        mock_db['connection'].close.assert_not_called()
+        stats = pool_stats("default")
+        assert stats["in_use"] == 0
+        assert stats["idle"] == 1
+
+    def test_acquire_timeout_when_exhausted(self, mock_db):
+        """Test acquire times out when max_size connections are checked out"""
+        mock_db['connect'].side_effect = lambda **kwargs: MagicMock()
+        set_default_db("localhost", 3306, "test", "test", "test_db", pool=PoolConfig(max_size=1, timeout=0.01))
+        pool = get_pool("default")
+
+        conn = pool.acquire()
+        with pytest.raises(PoolTimeoutError):
+            pool.acquire()
+        pool.release(conn)
+
+        stats = pool.stats()
+        assert stats["timeouts"] == 1
+        assert stats["waits"] == 1
+        assert pool.acquire() is conn
+
+    def test_expired_connection_is_replaced(self, mock_db):
+        """Test connections past max_lifetime are closed instead of reused"""
+        mock_db['connect'].side_effect = lambda **kwargs: MagicMock()
+        set_default_db("localhost", 3306, "test", "test", "test_db", pool=PoolConfig(max_lifetime=0))
+        pool = get_pool("default")
+
+        conn = pool.acquire()
+        pool.release(conn)
+
+        conn.close.assert_called_once()
+        assert pool.acquire() is not conn
+
+    def test_failed_ping_discards_connection(self, mock_db):
+        """Test a connection failing the liveness ping is not handed out"""
+        mock_db['connect'].side_effect = lambda **kwargs: MagicMock()
+        set_default_db("localhost", 3306, "test", "test", "test_db", pool=PoolConfig(ping_interval=0))
+        pool = get_pool("default")
+
+        conn = pool.acquire()
+        pool.release(conn)
+        conn.ping.side_effect = Exception("gone away")
+
+        assert pool.acquire() is not conn
+        assert pool.stats()["discarded"] == 1
+
+    def test_transaction_returns_connection_to_pool(self, mock_db):
+        """Test transaction commits and returns its connection to the pool"""
+        with transaction():
+            TestUser.update().eq(TestUser.id, 1).set(name="李四").execute()
+
+        mock_db['connection'].begin.assert_called_once()
+        mock_db['connection'].commit.assert_called_once()
+        assert pool_stats("default")["idle"] == 1
+
+
+class TestSelectIter:
+    def test_iter_hydrates_in_batches(self, mock_db):
+        """Test iter streams rows with fetchmany batches"""
+        mock_db['cursor'].fetchmany.side_effect = [
+            [(1, "a", None), (2, "b", None)],
+            [(3, "c", None)],
+            [],
+        ]
+
+        users = list(TestUser.select().iter(batch_size=2))
+
+        assert [user.id for user in users] == [1, 2, 3]
+        mock_db['cursor'].fetchmany.assert_called_with(2)
+        mock_db['cursor'].close.assert_called_once()
+        mock_db['connection'].close.assert_not_called()
+        assert pool_stats("default")["idle"] == 1
+
+    def test_iter_early_break_discards_connection(self, mock_db):
+        """Test breaking out of iter closes the connection instead of draining it"""
+        mock_db['cursor'].fetchmany.side_effect = [[(1, "a", None)], []]
+
+        stream = TestUser.select().iter()
+        next(stream)
+        stream.close()
+
+        mock_db['cursor'].close.assert_not_called()
+        mock_db['connection'].close.assert_called_once()
+        assert pool_stats("default")["idle"] == 0
+
+    def test_iter_in_transaction_drains_and_blocks_other_statements(self, mock_db):
+        """Test iter inside transaction drains the cursor and guards the shared connection"""
+        mock_db['cursor'].fetchmany.side_effect = [[(1, "a", None)], []]
+
+        with transaction():
+            stream = TestUser.select().iter()
+            next(stream)
+            with pytest.raises(RuntimeError):
+                TestUser.select().list()
+            stream.close()
+            mock_db['cursor'].close.assert_called_once()
+            TestUser.select().list()
+
+        mock_db['connection'].commit.assert_called_once()
+
+
+class TestKeysetPagination:
+    def test_after_builds_seek_condition(self, mock_db):
+        """Test after() turns the ORDER BY columns into a keyset condition"""
+        mock_db['cursor'].fetchall.return_value = []
+
+        TestUser.select().desc(TestUser.name).after(TestUser.name, "b").after(TestUser.id, 7).limit(10).list()
+
+        sql, args = mock_db['cursor'].execute.call_args[0]
+        assert "WHERE ((name < %s) or (name = %s and id > %s))" in sql
+        assert sql.endswith("ORDER BY name desc, id asc LIMIT %s")
+        assert args == ("b", "b", 7, 10)
+
+    def test_page_token_round_trip(self, mock_db):
+        """Test page() returns a token that seeks past the last row"""
+        mock_db['cursor'].fetchall.return_value = [
+            (1, "a", None),
+            (2, "b", None),
+            (3, "c", None),
+        ]
+
+        first = TestUser.select().page(2)
+
+        assert [user.id for user in first] == [1, 2]
+        assert first.has_more
+        sql = mock_db['cursor'].execute.call_args[0][0]
+        assert sql.endswith("ORDER BY id asc LIMIT %s")
+
+        mock_db['cursor'].fetchall.return_value = [(3, "c", None)]
+        page = TestUser.select().page(2, first.next_token)
+
+        sql, args = mock_db['cursor'].execute.call_args[0]
+        assert "WHERE ((id > %s))" in sql
+        assert args == (2, 3)
+        assert not page.has_more
+
+        # 令牌来自按 id 排序的查询，不能用于其他排序
+        with pytest.raises(ValueError, match="does not match the query ordering"):
+            TestUser.select().desc(TestUser.name).page(2, first.next_token)
+        with pytest.raises(ValueError):
+            TestUser.select().limit(10).page(2)
+
+    def test_chunks_walks_primary_key(self, mock_db):
+        """Test chunks() walks the table by primary key ranges"""
+        mock_db['cursor'].fetchall.side_effect = [
+            [(1, "a", None), (5, "b", None)],
+            [(9, "c", None)],
+        ]
+
+        chunks = list(TestUser.select().chunks(2))
+
+        assert [[user.id for user in chunk] for chunk in chunks] == [[1, 5], [9]]
+        sql, args = mock_db['cursor'].execute.call_args[0]
+        assert "WHERE ((id > %s)) ORDER BY id asc LIMIT %s" in sql
+        assert args == (5, 2)
+
+    def test_declared_primary_key(self):
+        """Test primary key defaults to id and can be declared explicitly"""
+
+        class Account(Model):
+            code = Str(primary_key=True)
+            id = Int()
+
+        assert TestUser.get_primary_key() == "id"
+        assert Account.get_primary_key() == "code"
+
+
+class TestInsertBulk:
+    def test_execute_bulk_multi_row_chunks(self, mock_db):
+        """Test bulk insert emits multi-row VALUES chunked by batch_size"""
+        mock_db['cursor'].execute.side_effect = lambda sql, args: len(args) // 2
+
+        rows = ({"name": f"user{i}", "email": None} for i in range(5))
+        affected = TestUser.insert().execute_bulk(rows, batch_size=2, max_packet_size=1 << 20)
+
+        assert affected == 5
+        calls = mock_db['cursor'].execute.call_args_list
+        assert len(calls) == 3
+        sql, args = calls[0][0]
+        assert sql == "INSERT INTO test_user(name,email) VALUES(%s,%s),(%s,%s)"
+        assert args == ("user0", None, "user1", None)
+        assert calls[2][0][0] == "INSERT INTO test_user(name,email) VALUES(%s,%s)"
+
+    def test_execute_bulk_respects_packet_size(self, mock_db):
+        """Test bulk insert splits statements that would exceed max_allowed_packet"""
+        rows = [TestUser(name="x" * 400) for _ in range(4)]
+
+        TestUser.insert().execute_bulk(rows, max_packet_size=1000, duplicate_key_update="all")
+
+        calls = mock_db['cursor'].execute.call_args_list
+        assert len(calls) == 4
+        assert calls[0][0][0].endswith("VALUES(%s) ON DUPLICATE KEY UPDATE name=VALUES(name)")
+
+    def test_execute_bulk_atomic(self, mock_db):
+        """Test atomic bulk insert runs all chunks in one transaction"""
+        rows = [{"name": "a"}, {"name": "b"}, {"name": "c"}]
+
+        TestUser.insert().execute_bulk(rows, batch_size=1, max_packet_size=1 << 20, atomic=True)
+
+        assert mock_db['cursor'].execute.call_count == 3
+        mock_db['connection'].begin.assert_called_once()
+        mock_db['connection'].commit.assert_called_once()
+
+
+class TestInsertBulkWithIds:
+    def test_ids_derived_and_filled(self, mock_db):
+        """Test generated ids are derived from the first insert id and increment"""
+        cursor = mock_db['cursor']
+        cursor.execute.side_effect = lambda sql, args=None: len(args) if args else 1
+        type(cursor).lastrowid = PropertyMock(side_effect=[100, 200])
+        cursor.fetchone.return_value = {"increment": 2}
+        users = [TestUser(name="a"), TestUser(name="b"), TestUser(name="c")]
+
+        ids = TestUser.insert().execute_bulk_with_ids(users, batch_size=2, max_packet_size=1 << 20)
+
+        assert ids == [100, 102, 200]
+        assert [user.id for user in users] == [100, 102, 200]
+        assert cursor.execute.call_args_list[0][0][0] == "INSERT INTO test_user(name) VALUES(%s),(%s)"
+        # 同一连接只查询一次 auto_increment_increment
+        increments = [c for c in cursor.execute.call_args_list if "auto_increment_increment" in c[0][0]]
+        assert len(increments) == 1
+
+    def test_rows_with_primary_key_rejected(self, mock_db):
+        """Test rows that already carry a primary key value are rejected"""
+        with pytest.raises(ValueError):
+            TestUser.insert().execute_bulk_with_ids([{"id": 1, "name": "a"}], max_packet_size=1 << 20)
+
+    def test_affected_mismatch_raises(self, mock_db):
+        """Test ids are not derived when the affected row count does not match"""
+        cursor = mock_db['cursor']
+        cursor.execute.return_value = 1
+        cursor.lastrowid = 10
+        cursor.fetchone.return_value = {"increment": 1}
+
+        with pytest.raises(ValueError, match="cannot derive generated ids"):
+            TestUser.insert().execute_bulk_with_ids([{"name": "a"}, {"name": "b"}], max_packet_size=1 << 20)
+
+
+class TestCompiledStatements:
+    def test_statement_cache_reuses_sql_template(self, mock_db):
+        """Test queries with the same shape reuse the cached SQL template"""
+        mock_db['cursor'].fetchall.return_value = []
+
+        TestUser.select().eq(TestUser.id, 1).in_(TestUser.name, ["a", "b"]).list()
+        first_sql, first_args = mock_db['cursor'].execute.call_args[0]
+        TestUser.select().eq(TestUser.id, 2).in_(TestUser.name, ["c"]).list()
+        second_sql, second_args = mock_db['cursor'].execute.call_args[0]
+
+        assert first_sql is second_sql
+        assert first_args == (1, ["a", "b"])
+        assert second_args == (2, ["c"])
+
+    def test_compiled_select_binds_params(self, mock_db):
+        """Test compiled select binds named parameters per call"""
+        mock_db['cursor'].fetchall.return_value = [(3, "a", None)]
+        by_name = TestUser.select().eq(TestUser.name, Param("name")).desc(TestUser.id).limit(5).compile()
+
+        users = by_name.list(name="a")
+
+        sql, args = mock_db['cursor'].execute.call_args[0]
+        assert sql == by_name.sql
+        assert args == ("a", 5)
+        assert users[0].id == 3
+        with pytest.raises(ValueError):
+            by_name.list()
+
+    def test_compiled_update(self, mock_db):
+        """Test compiled update binds values and conditions"""
+        rename = TestUser.update().set(name=Param("name")).eq(TestUser.id, Param("id")).compile()
+
+        rename.execute(name="李四", id=7)
+
+        sql, args = mock_db['cursor'].execute.call_args[0]
+        assert sql == "UPDATE test_user SET name=%s WHERE id = %s"
+        assert args == ("李四", 7)
+
+
+class TestRowDecoder:
+    def test_select_uses_tuple_cursor_and_decoder(self, mock_db):
+        """Test list() fetches tuples and hydrates them by column position"""
+        mock_db['cursor'].fetchall.return_value = [("张三", 1, "a@example.com"), ("李四", 2, None)]
+
+        users = TestUser.select(["name", "id", "email"]).list()
+
+        assert mock_db['connection'].cursor.call_args[0][0] is Cursor
+        assert users[0].to_dict() == {"name": "张三", "id": 1, "email": "a@example.com"}
+        assert users[1].id == 2
+
+    def test_decoder_cached_and_skips_unknown_columns(self):
+        """Test decoder is generated once per column tuple and ignores non-field columns"""
+        decode = TestUser._decoder(("id", "extra", "name"))
+
+        user = decode((5, "x", "王五"))
+
+        assert TestUser._decoder(("id", "extra", "name")) is decode
+        assert user.to_dict() == {"id": 5, "name": "王五"}
+        assert user.email is None
+
+
+class CompactUser(Model, compact=True):
+    id = Int()
+    name = Str()
+    email = Str()
+
+
+class TestCompactModel:
+    def test_compact_model_has_no_instance_dict(self):
+        """Test compact models store values in slots instead of __dict__"""
+        user = CompactUser(id=1, name="张三")
+
+        assert not hasattr(user, "__dict__")
+        assert user.id == 1
+        assert user.email is None
+        with pytest.raises(AttributeError):
+            user.nickname = "x"
+
+    def test_compact_model_dict_compat(self):
+        """Test to_dict, items and iteration keep working for compact models"""
+        user = CompactUser(id=1, name="张三")
+        user.email = "test@example.com"
+
+        assert user.to_dict() == {"id": 1, "name": "张三", "email": "test@example.com"}
+        assert dict(user) == user.to_dict()
+        assert list(user.items()) == [("id", 1), ("name", "张三"), ("email", "test@example.com")]
+        assert user["name"] == "张三"
+
+    def test_compact_model_select(self, mock_db):
+        """Test compact models hydrate from tuple rows"""
+        mock_db['cursor'].fetchall.return_value = [("李四", 2)]
+
+        users = CompactUser.select(["name", "id"]).list()
+
+        assert users[0].to_dict() == {"id": 2, "name": "李四"}
+
+
+class Measurement(Model):
+    id = Int()
+    label = Str()
+    value = Float()
+    created_at = DateTime()
+
+
+class TestColumns:
+    rows = [
+        [(1, "a", 1.5, datetime.datetime(2024, 1, 1)), (2, "b", None, datetime.datetime(2024, 1, 2))],
+        [(3, "c", 2.5, None)],
+        [],
+    ]
+
+    def test_to_columns_lists(self, mock_db):
+        """Test to_columns transposes streamed batches into lists"""
+        mock_db['cursor'].fetchmany.side_effect = self.rows
+
+        columns = Measurement.select().to_columns(batch_size=2)
+
+        assert columns["id"] == [1, 2, 3]
+        assert columns["label"] == ["a", "b", "c"]
+        assert columns["value"] == [1.5, None, 2.5]
+
+    def test_to_columns_arrays(self, mock_db):
+        """Test array kind uses array.array for numeric columns without NULL"""
+        mock_db['cursor'].fetchmany.side_effect = self.rows
+
+        columns = Measurement.select().to_columns(kind="array", batch_size=2)
+
+        assert columns["id"] == array("q", [1, 2, 3])
+        assert columns["value"] == [1.5, None, 2.5]
+        assert columns["label"] == ["a", "b", "c"]
+
+    def test_to_columns_unsigned_bigint_falls_back_to_list(self, mock_db):
+        """Test values beyond int64 (BIGINT UNSIGNED) turn the column into a list instead of failing"""
+        big = 2 ** 63
+        mock_db['cursor'].fetchmany.side_effect = [[(1, "a", 1.5, None)], [(big, "b", 2.5, None)], []]
+
+        columns = Measurement.select().to_columns(kind="array", batch_size=1)
+
+        assert columns["id"] == [1, big]
+        assert columns["value"] == array("d", [1.5, 2.5])
+        numpy = pytest.importorskip("numpy")
+        mock_db['cursor'].fetchmany.side_effect = [[(1, "a", 1.5, None)], [(big, "b", 2.5, None)], []]
+        assert Measurement.select().to_columns(kind="numpy", batch_size=1)["id"].tolist() == [1, big]
+
+    def test_to_columns_numpy(self, mock_db):
+        """Test numpy kind derives dtypes from field types and masks NULL"""
+        numpy = pytest.importorskip("numpy")
+        mock_db['cursor'].fetchmany.side_effect = self.rows
+
+        columns = Measurement.select().to_columns(kind="numpy", batch_size=2)
+
+        assert columns["id"].dtype == numpy.int64
+        assert columns["value"].dtype == numpy.float64
+        assert columns["value"].mask.tolist() == [False, True, False]
+        assert columns["created_at"].dtype == numpy.dtype("datetime64[us]")
+        assert columns["label"].dtype == object
+
+
+class RecordingHook(QueryHook):
+    def __init__(self):
+        self.calls = []
+
+    def before(self, event):
+        self.calls.append(("before", event))
+
+    def after(self, event):
+        self.calls.append(("after", event))
+
+    def error(self, event):
+        self.calls.append(("error", event))
+
+
+class TestQueryHooks:
+    def test_hook_receives_phase_timings(self, mock_db):
+        """Test hooks see the statement, row count and per-phase timings"""
+        mock_db['cursor'].fetchall.return_value = [("张三", 1, "a@example.com")]
+        hook = add_hook(RecordingHook())
+        try:
+            users = TestUser.select().eq(TestUser.id, 1).list()
+        finally:
+            remove_hook(hook)
+
+        assert [name for name, _ in hook.calls] == ["before", "after"]
+        event = hook.calls[-1][1]
+        assert event.kind == "select"
+        assert event.db_name == "default"
+        assert event.args == (1,)
+        assert event.rows == len(users) == 1
+        assert event.build_time > 0 and event.hydrate_time > 0
+        assert event.total_time >= event.execute_time + event.fetch_time
+
+    def test_hook_receives_errors(self, mock_db):
+        """Test error hooks are called with the exception and the error is re-raised"""
+        mock_db['cursor'].execute.side_effect = RuntimeError("boom")
+        hook = add_hook(RecordingHook())
+        try:
+            with pytest.raises(RuntimeError):
+                TestUser.update().eq(TestUser.id, 1).set(name="x").execute()
+        finally:
+            remove_hook(hook)
+
+        assert [name for name, _ in hook.calls] == ["before", "error"]
+        assert str(hook.calls[-1][1].error) == "boom"
+
+    def test_failing_hook_does_not_break_query(self, mock_db):
+        """Test exceptions raised by a hook are logged instead of propagated"""
+        mock_db['cursor'].execute.return_value = 1
+
+        class BrokenHook(QueryHook):
+            def after(self, event):
+                raise RuntimeError("hook failure")
+
+        hook = add_hook(BrokenHook())
+        try:
+            assert TestUser.delete().eq(TestUser.id, 1).execute() == 1
+        finally:
+            remove_hook(hook)
+
+    def test_stream_hook_counts_rows_on_early_exit(self, mock_db):
+        """Test stream events are completed even when iteration stops early"""
+        mock_db['cursor'].fetchmany.side_effect = [[("张三", 1, None), ("李四", 2, None)], [("王五", 3, None)], []]
+        hook = add_hook(RecordingHook())
+        try:
+            for user in TestUser.select().iter(batch_size=2):
+                break
+        finally:
+            remove_hook(hook)
+
+        assert [name for name, _ in hook.calls] == ["before", "after"]
+        assert hook.calls[-1][1].kind == "stream"
+        assert hook.calls[-1][1].rows == 2
+
+
+class TestQueryStats:
+    def test_fingerprint_collapses_literals_and_lists(self):
+        """Test literals, placeholders, IN lists, multi-row VALUES and CASE arms share one fingerprint"""
+        assert fingerprint("SELECT * FROM t1 WHERE id IN (1, 2, 3) AND name = 'a''b' LIMIT %s") == (
+            "SELECT * FROM t1 WHERE id IN (...) AND name = ? LIMIT ?"
+        )
+        bulk = fingerprint("INSERT INTO t(a,b) VALUES(%s,%s),(%s,%s)")
+        assert bulk == fingerprint("INSERT INTO t(a,b) VALUES(%s,%s)")
+        case = fingerprint("UPDATE t SET a = CASE id WHEN %s THEN %s WHEN %s THEN %s END WHERE id IN %s")
+        assert case == fingerprint("UPDATE t SET a = CASE id WHEN %s THEN %s END WHERE id IN %s")
+        assert case == "UPDATE t SET a = CASE id WHEN ? THEN ? ... END WHERE id IN ?"
+
+    def test_histogram_quantiles(self):
+        """Test streaming histogram quantiles stay within the bucket error"""
+        histogram = LatencyHistogram()
+        for i in range(1, 1001):
+            histogram.add(i / 1000)
+
+        assert histogram.count == 1000
+        assert abs(histogram.quantile(0.5) - 0.5) / 0.5 < 0.1
+        assert histogram.quantile(0.99) <= histogram.max == 1.0
+
+    def test_registry_groups_by_fingerprint(self, mock_db):
+        """Test statements of the same shape are aggregated and reported as top-N"""
+        mock_db['cursor'].fetchall.return_value = [("张三", 1, None)]
+        mock_db['cursor'].execute.return_value = 1
+        registry = enable_stats()
+        try:
+            registry.reset()
+            TestUser.select().eq(TestUser.id, 1).list()
+            TestUser.select().eq(TestUser.id, 2).list()
+            TestUser.delete().eq(TestUser.id, 3).execute()
+            mock_db['cursor'].execute.side_effect = RuntimeError("boom")
+            with pytest.raises(RuntimeError):
+                TestUser.delete().eq(TestUser.id, 4).execute()
+
+            top = registry.top(10, sort="calls")
+            report = registry.report(format="table")
+            data = json.loads(registry.report(format="json"))
+        finally:
+            disable_stats()
+
+        assert [(item["calls"], item["rows"], item["affected"], item["errors"]) for item in top] == [
+            (2, 2, 0, 0),
+            (2, 0, 1, 1),
+        ]
+        assert top[0]["fingerprint"].startswith("SELECT ")
+        assert "DELETE FROM test_user WHERE id = ?" in report
+        assert len(data) == 2
+
+
+class TestResultCache:
+    def test_cached_list_skips_database(self, mock_db):
+        """Test cached reads hit the database once and return fresh model objects"""
+        result_cache.clear()
+        mock_db['cursor'].fetchall.return_value = (("张三", 1, None),)
+        before = result_cache.stats()
+
+        first = TestUser.select(["name", "id", "email"]).eq(TestUser.id, 1).cache(ttl=30).list()
+        second = TestUser.select(["name", "id", "email"]).eq(TestUser.id, 1).cache(ttl=30).list()
+
+        assert mock_db['cursor'].execute.call_count == 1
+        assert first[0].to_dict() == second[0].to_dict()
+        assert first[0] is not second[0]
+        stats = result_cache.stats()
+        assert stats["hits"] - before["hits"] == 1
+        assert stats["misses"] - before["misses"] == 1
+
+    def test_writes_invalidate_table(self, mock_db):
+        """Test insert/update/delete through tee drop cached results of the table"""
+        result_cache.clear()
+        mock_db['cursor'].fetchall.return_value = [{"count": 3}]
+        mock_db['cursor'].execute.return_value = 1
+
+        assert TestUser.select().cache().count() == 3
+        TestUser.update().eq(TestUser.id, 1).set(name="李四").execute()
+        mock_db['cursor'].fetchall.return_value = [{"count": 4}]
+        assert TestUser.select().cache().count() == 4
+        assert TestUser.select().cache().count() == 4
+
+        selects = [c for c in mock_db['cursor'].execute.call_args_list if c[0][0].startswith("SELECT")]
+        assert len(selects) == 2
+
+    def test_transaction_bypasses_cache(self, mock_db):
+        """Test reads inside transaction() always go to the database"""
+        result_cache.clear()
+        mock_db['cursor'].fetchall.return_value = [{"count": 1}]
+
+        with transaction():
+            TestUser.select().cache().count()
+            TestUser.select().cache().count()
+
+        assert mock_db['cursor'].execute.call_count == 2
+        assert result_cache.stats()["size"] == 0
+
+    def test_ttl_and_lru_bounds(self):
+        """Test entries expire after ttl and the least recently used entry is evicted"""
+        cache = ResultCache(max_size=2, default_ttl=10)
+        with patch("tee.result_cache.time.monotonic", return_value=100.0) as clock:
+            for i in range(3):
+                cache.fetch("default", ["t"], Statement("SELECT %s", (i,)), lambda: i)
+            assert cache.stats()["evictions"] == 1
+            assert cache.fetch("default", ["t"], Statement("SELECT %s", (2,)), lambda: -1) == 2
+
+            clock.return_value = 111.0
+            assert cache.fetch("default", ["t"], Statement("SELECT %s", (2,)), lambda: -1) == -1
+            assert cache.stats()["expirations"] == 1
+
+
+class TestEntityCache:
+    def test_get_many_by_pk_fetches_only_misses(self, mock_db):
+        """Test cached keys are served from memory and misses are loaded with one IN query"""
+        entity_cache.clear()
+        cursor = mock_db['cursor']
+        cursor.fetchall.return_value = ((1, "张三", None), (2, "李四", None))
+
+        users = TestUser.get_many_by_pk([1, 2])
+        assert sorted(users) == [1, 2]
+
+        cursor.fetchall.return_value = ((3, "王五", None),)
+        users = TestUser.get_many_by_pk([2, 3, 4])
+
+        assert list(users) == [2, 3]
+        assert users[2].name == "李四"
+        sql, args = cursor.execute.call_args[0]
+        assert sql == "SELECT id, name, email FROM test_user WHERE id IN %s"
+        assert args == ([3, 4],)
+        assert cursor.execute.call_count == 2
+        assert TestUser.get_by_pk(1) is not TestUser.get_by_pk(1)
+        assert cursor.execute.call_count == 2
+
+    def test_update_by_pk_invalidates_entries(self, mock_db):
+        """Test updates by primary key drop only those entries and other updates flush the table"""
+        entity_cache.clear()
+        cursor = mock_db['cursor']
+        cursor.fetchall.return_value = ((1, "张三", None), (2, "李四", None))
+        cursor.execute.return_value = 1
+        TestUser.get_many_by_pk([1, 2])
+
+        TestUser.update().eq(TestUser.id, 1).set(name="赵六").execute()
+        assert entity_cache.stats()["size"] == 1
+
+        TestUser.delete().eq(TestUser.name, "李四").execute()
+        assert entity_cache.stats()["size"] == 0
+
+    def test_transaction_bypasses_entity_cache(self, mock_db):
+        """Test lookups inside a transaction read the database and do not populate the cache"""
+        entity_cache.clear()
+        mock_db['cursor'].fetchall.return_value = ((1, "张三", None),)
+
+        with transaction():
+            assert TestUser.get_by_pk(1).name == "张三"
+
+        assert entity_cache.stats()["size"] == 0
+
+
+class OrderLine(Model):
+    order_id = Int()
+    line_no = Int()
+    sku = Str()
+
+
+class TestLoader:
+    def test_loader_batches_and_dedupes_keys(self, mock_db):
+        """Test keys collected in a scope are deduped and loaded with one IN query"""
+        cursor = mock_db['cursor']
+        cursor.fetchall.return_value = ((1, "张三", None), (2, "李四", None))
+
+        with Loader() as loader:
+            authors = [loader.load(TestUser, user_id) for user_id in [1, 2, 1, 3]]
+            names = [author.get().name if author.get() else None for author in authors]
+
+        assert names == ["张三", "李四", "张三", None]
+        assert cursor.execute.call_count == 1
+        sql, args = cursor.execute.call_args[0]
+        assert sql.endswith("WHERE id IN %s")
+        assert args == ([1, 2, 3],)
+
+    def test_loader_splits_batches_and_groups_many(self, mock_db):
+        """Test max_batch_size bounds the IN list and load_all groups rows by key"""
+        cursor = mock_db['cursor']
+        cursor.fetchall.side_effect = [((1, "a", "x@a"), (1, "b", "y@a")), ((3, "c", None),)]
+
+        with Loader(max_batch_size=2) as loader:
+            groups = [loader.load_all(TestUser, user_id, by=TestUser.id) for user_id in [1, 2, 3]]
+
+        assert [len(group.get()) for group in groups] == [2, 0, 1]
+        assert [c[0][1] for c in cursor.execute.call_args_list] == [([1, 2],), ([3],)]
+
+    def test_composite_keys_use_row_constructor(self, mock_db):
+        """Test composite keys are loaded with a (a, b) IN ((..), (..)) condition"""
+        cursor = mock_db['cursor']
+        cursor.fetchall.return_value = ((10, 1, "apple"),)
+
+        with Loader() as loader:
+            line = loader.load(OrderLine, (10, 1), by=(OrderLine.order_id, OrderLine.line_no))
+            missing = loader.load(OrderLine, (10, 2), by=(OrderLine.order_id, OrderLine.line_no))
+
+        assert line.get().sku == "apple"
+        assert missing.get() is None
+        sql, args = cursor.execute.call_args[0]
+        assert sql == "SELECT order_id, line_no, sku FROM order_line WHERE (order_id, line_no) IN %s"
+        assert args == ([(10, 1), (10, 2)],)
+
+    def test_async_loader_coalesces_one_tick(self, mock_db):
+        """Test keys requested in the same event loop tick share one query"""
+        cursor = mock_db['cursor']
+        cursor.fetchall.return_value = ((1, "张三", None), (2, "李四", None))
+
+        async def main():
+            loader = AsyncLoader()
+            return await asyncio.gather(*(loader.load(TestUser, user_id) for user_id in [2, 1, 2]))
+
+        users = asyncio.run(main())
+
+        assert [user.name for user in users] == ["李四", "张三", "李四"]
+        assert cursor.execute.call_count == 1
+
+
+class Author(Model):
+    id = Int()
+    name = Str()
+    posts = HasMany("Post", "author_id")
+
+
+class Post(Model):
+    id = Int()
+    author_id = Int()
+    title = Str()
+    author = BelongsTo(Author, "author_id")
+
+
+class TestPrefetch:
+    def test_prefetch_belongs_to_in_one_query(self, mock_db):
+        """Test prefetch loads all referenced rows with one IN query after the main query"""
+        cursor = mock_db['cursor']
+        cursor.fetchall.side_effect = [
+            ((1, 10, "a"), (2, 11, "b"), (3, 10, "c"), (4, None, "d")),
+            ((10, "张三"), (11, "李四")),
+        ]
+
+        posts = Post.select().prefetch(Post.author).list()
+
+        assert [post.author.name if post.author else None for post in posts] == ["张三", "李四", "张三", None]
+        assert cursor.execute.call_count == 2
+        sql, args = cursor.execute.call_args[0]
+        assert sql == "SELECT id, name FROM author WHERE id IN %s"
+        assert args == ([10, 11],)
+
+    def test_prefetch_has_many(self, mock_db):
+        """Test has-many prefetch groups related rows by foreign key"""
+        mock_db['cursor'].fetchall.side_effect = [((10, "张三"), (11, "李四")), ((1, 10, "a"), (2, 10, "b"))]
+
+        authors = Author.select().prefetch(Author.posts).list()
+
+        assert [[post.title for post in author.posts] for author in authors] == [["a", "b"], []]
+        assert mock_db['cursor'].execute.call_count == 2
+
+    def test_prefetch_per_batch_with_iter(self, mock_db):
+        """Test iter() prefetches relations once per streamed batch"""
+        cursor = mock_db['cursor']
+        cursor.fetchmany.side_effect = [[(1, 10, "a"), (2, 11, "b")], [(3, 12, "c")], []]
+        cursor.fetchall.side_effect = [((10, "张三"), (11, "李四")), ((12, "王五"),)]
+
+        names = [post.author.name for post in Post.select().prefetch(Post.author).iter(batch_size=2)]
+
+        assert names == ["张三", "李四", "王五"]
+        assert [c[0][1] for c in cursor.execute.call_args_list[1:]] == [([10, 11],), ([12],)]
+
+    def test_lazy_load_and_validation(self, mock_db):
+        """Test relations load lazily when not prefetched and require the key column"""
+        mock_db['cursor'].fetchall.return_value = ((10, "张三"),)
+        post = Post(id=1, author_id=10, title="a")
+
+        assert post.author.name == "张三"
+        assert "author" not in post.to_dict()
+        with pytest.raises(ValueError):
+            Post.select(["id", "title"]).prefetch(Post.author)
+
+    def test_string_targets_with_duplicate_model_names(self):
+        """Test a class name defined in two modules must be referenced by its full module.ClassName name"""
+        blog = type("Writer", (Model,), {"__module__": "blog.models", "id": Int()})
+        type("Writer", (Model,), {"__module__": "shop.models", "id": Int()})
+        article = type("Article", (Model,), {
+            "id": Int(), "writer_id": Int(),
+            "writer": BelongsTo("Writer", "writer_id"), "blog_writer": BelongsTo("blog.models.Writer", "writer_id"),
+        })
+
+        assert article.blog_writer.target is blog
+        with pytest.raises(ValueError):
+            article.writer.target
+        with pytest.raises(TypeError):
+            Relation("Author", "author_id")
+
+
+class TestJoin:
+    def test_join_qualifies_columns_and_conditions(self, mock_db):
+        """Test join renders qualified columns, ON clauses, conditions and ordering"""
+        cursor = mock_db['cursor']
+        cursor.fetchall.return_value = ((1, 10, "a"),)
+
+        posts = Post.select().join(Author, on=(Post.author_id, Author.id)).eq(Author.name, "张三").desc(Post.id).list()
+
+        sql, args = cursor.execute.call_args[0]
+        assert sql == (
+            "SELECT post.id, post.author_id, post.title FROM post JOIN author ON post.author_id = author.id "
+            "WHERE author.name = %s ORDER BY post.id desc"
+        )
+        assert args == ("张三",)
+        assert posts[0].title == "a"
+
+    def test_rows_hydrate_each_model(self, mock_db):
+        """Test rows() returns a named tuple of model objects and None for unmatched left joins"""
+        cursor = mock_db['cursor']
+        cursor.fetchall.return_value = ((1, 10, "a", 10, "张三"), (2, 99, "b", None, None))
+
+        rows = Post.select().left_join(Author, on=[(Post.author_id, Author.id)]).rows()
+
+        sql, _ = cursor.execute.call_args[0]
+        assert sql == (
+            "SELECT post.id, post.author_id, post.title, author.id, author.name FROM post "
+            "LEFT JOIN author ON post.author_id = author.id"
+        )
+        assert rows[0].post.title == "a" and rows[0].author.name == "张三"
+        assert rows[1].post.id == 2 and rows[1].author is None
+
+    def test_keyset_pagination_on_joined_column(self, mock_db):
+        """Test page() and after() order by a joined column and read the cursor from the joined row"""
+        cursor = mock_db['cursor']
+        cursor.fetchall.return_value = ((1, 10, "a", 10, "张三"), (2, 11, "b", 11, "李四"), (3, 12, "c", 12, "王五"))
+
+        page = Post.select().join(Author, on=(Post.author_id, Author.id)).asc(Author.name).page(2)
+
+        sql = cursor.execute.call_args[0][0]
+        assert sql == (
+            "SELECT post.id, post.author_id, post.title, author.id, author.name FROM post "
+            "JOIN author ON post.author_id = author.id ORDER BY author.name asc, post.id asc LIMIT %s"
+        )
+        assert [post.title for post in page] == ["a", "b"]
+
+        cursor.fetchall.return_value = ((3, 12, "c", 12, "王五"),)
+        Post.select().join(Author, on=(Post.author_id, Author.id)).asc(Author.name).page(2, page.next_token)
+
+        sql, args = cursor.execute.call_args[0]
+        assert "WHERE ((author.name > %s) or (author.name = %s and post.id > %s))" in sql
+        assert args == ("李四", "李四", 2, 3)
+
+        Post.select().join(Author, on=(Post.author_id, Author.id)).after(Author.name, "李四").list()
+        sql = cursor.execute.call_args[0][0]
+        assert "WHERE ((author.name > %s)) ORDER BY author.name asc" in sql
+
+    def test_join_rejects_duplicate_tables(self):
+        """Test joining a table twice is rejected"""
+        with pytest.raises(ValueError):
+            Post.select().join(Post, on=(Post.id, Post.id))
+
+
+class Sale(Model):
+    id = Int()
+    region = Str()
+    qty = Int()
+    amount = Decimal()
+
+
+class TestAggregate:
+    def test_aggregate_shorthand_decodes_by_field_type(self, mock_db):
+        """Test aggregate(sum=..., max=...) runs one query and decodes values with field types"""
+        cursor = mock_db['cursor']
+        cursor.fetchall.return_value = ((decimal.Decimal("12"), 7),)
+
+        result = Sale.select().gt(Sale.amount, 1).aggregate(sum=Sale.qty, max=Sale.qty)
+
+        sql, args = cursor.execute.call_args[0]
+        assert sql == "SELECT SUM(qty) AS `sum`, MAX(qty) AS `max` FROM sale WHERE amount > %s"
+        assert args == (1,)
+        assert result == {"sum": 12, "max": 7}
+        assert type(result["sum"]) is int
+
+    def test_group_by_having_returns_rows(self, mock_db):
+        """Test group_by/having render server-side grouping and return one named tuple per group"""
+        cursor = mock_db['cursor']
+        cursor.fetchall.return_value = (("north", 3, decimal.Decimal("10.5"), decimal.Decimal("3.5")),)
+
+        rows = (
+            Sale.select()
+            .group_by(Sale.region)
+            .having(Count() > 2)
+            .asc(Sale.region)
+            .aggregate(n=Count(), total=Sum(Sale.amount), avg=Avg(Sale.amount))
+        )
+
+        sql, args = cursor.execute.call_args[0]
+        assert sql == (
+            "SELECT region, COUNT(*) AS `n`, SUM(amount) AS `total`, AVG(amount) AS `avg` FROM sale "
+            "GROUP BY region HAVING COUNT(*) > %s ORDER BY region asc"
+        )
+        assert args == (2,)
+        assert rows[0].region == "north" and rows[0].n == 3
+        assert rows[0].total == decimal.Decimal("10.5")
+
+    def test_aggregate_rejects_unknown_shorthand(self):
+        """Test a field value requires a known aggregate function name"""
+        with pytest.raises(ValueError):
+            Sale.select().aggregate(total=Sale.amount)
+
+    def test_reserved_aliases_are_quoted_and_grouping_needs_aggregate(self, mock_db):
+        """Test aliases such as order/group are backtick-quoted and group_by/having are rejected outside aggregate()"""
+        cursor = mock_db['cursor']
+        cursor.fetchall.return_value = ((4, 9),)
+
+        assert Sale.select().aggregate(order=Count(), group=Sum(Sale.qty)) == {"order": 4, "group": 9}
+        assert cursor.execute.call_args[0][0] == "SELECT COUNT(*) AS `order`, SUM(qty) AS `group` FROM sale"
+        with pytest.raises(ValueError):
+            Sale.select().group_by(Sale.region).list()
+        with pytest.raises(ValueError):
+            Sale.select().having(Count() > 2).count()
+
+
+class TestExistsAndEstimates:
+    def test_exists_uses_select_one_limit_one(self, mock_db):
+        """Test exists() compiles to SELECT 1 ... LIMIT 1"""
+        cursor = mock_db['cursor']
+        cursor.fetchall.return_value = ((1,),)
+
+        assert TestUser.select().eq(TestUser.name, "张三").exists() is True
+
+        sql, args = cursor.execute.call_args[0]
+        assert sql == "SELECT 1 FROM test_user WHERE name = %s LIMIT %s"
+        assert args == ("张三", 1)
+        cursor.fetchall.return_value = ()
+        assert TestUser.select().eq(TestUser.name, "李四").exists() is False
+
+    def test_estimate_count_sources(self, mock_db):
+        """Test estimate_count() reads table statistics without conditions and EXPLAIN otherwise"""
+        cursor = mock_db['cursor']
+        cursor.fetchall.return_value = [{"table_rows": 12345}]
+        assert TestUser.select().estimate_count() == 12345
+        assert "information_schema.TABLES" in cursor.execute.call_args[0][0]
+
+        cursor.fetchall.return_value = [{"id": 1, "rows": 1000, "filtered": 10.0}]
+        assert TestUser.select().gt(TestUser.id, 5).estimate_count() == 100
+        sql, args = cursor.execute.call_args[0]
+        assert sql == "EXPLAIN SELECT 1 FROM test_user WHERE id > %s"
+        assert args == (5,)
+
+    def test_count_max_age_bounds_staleness(self, mock_db):
+        """Test count(max_age) reuses a cached count only while it is younger than max_age"""
+        result_cache.clear()
+        cursor = mock_db['cursor']
+        cursor.fetchall.return_value = [{"count": 7}]
+        with patch("tee.result_cache.time.monotonic", return_value=100.0) as clock:
+            assert TestUser.select().count(max_age=60) == 7
+            clock.return_value = 130.0
+            assert TestUser.select().count(max_age=60) == 7
+            assert cursor.execute.call_count == 1
+
+            cursor.fetchall.return_value = [{"count": 8}]
+            assert TestUser.select().count(max_age=10) == 8
+            assert cursor.execute.call_count == 2
+
+
+class TestDirtyTracking:
+    def test_save_updates_only_changed_columns(self, mock_db):
+        """Test save() sends only modified columns and nothing when the instance is clean"""
+        cursor = mock_db['cursor']
+        cursor.fetchall.return_value = ((1, "张三", "a@example.com"),)
+        cursor.execute.return_value = 1
+        user = TestUser.select().eq(TestUser.id, 1).one()
+
+        assert user.save() == 0
+        user.email = "a@example.com"
+        assert not user.is_dirty()
+        user.name = "李四"
+        assert user.get_changes() == {"name": "李四"}
+        assert user.save() == 1
+
+        sql, args = cursor.execute.call_args[0]
+        assert sql == "UPDATE test_user SET name=%s WHERE id = %s"
+        assert args == ("李四", 1)
+        calls = cursor.execute.call_count
+        assert user.save() == 0
+        assert cursor.execute.call_count == calls
+
+    def test_save_new_instance_inserts_and_backfills_pk(self, mock_db):
+        """Test save() inserts new instances and tracks changes afterwards"""
+        cursor = mock_db['cursor']
+        cursor.lastrowid = 9
+        user = CompactUser(name="张三")
+
+        assert user.is_new()
+        assert user.save() == 1
+        assert cursor.execute.call_args[0] == ("INSERT INTO compact_user(name) VALUES(%s)", ("张三",))
+        assert user.id == 9 and not user.is_new() and not user.is_dirty()
+
+        user.email = "z@example.com"
+        assert user.get_changes() == {"email": "z@example.com"}
+
+    def test_save_all_groups_by_changed_columns(self, mock_db):
+        """Test save_all() emits one CASE update per changed-column set"""
+        cursor = mock_db['cursor']
+        cursor.fetchall.return_value = ((1, "张三", None), (2, "李四", None), (3, "王五", None))
+        cursor.execute.return_value = 1
+        users = TestUser.select().list()
+        cursor.execute.reset_mock()
+
+        users[0].name = "甲"
+        users[1].name = "乙"
+        users[2].email = "c@example.com"
+        TestUser.save_all(users, max_packet_size=1 << 20)
+
+        assert cursor.execute.call_count == 2
+        sql, args = cursor.execute.call_args_list[0][0]
+        assert sql == "UPDATE test_user SET name = CASE id WHEN %s THEN %s WHEN %s THEN %s END WHERE id IN %s"
+        assert args == (1, "甲", 2, "乙", [1, 2])
+        sql, args = cursor.execute.call_args_list[1][0]
+        assert sql == "UPDATE test_user SET email = CASE id WHEN %s THEN %s END WHERE id IN %s"
+        assert args == (3, "c@example.com", [3])
+        assert TestUser.save_all(users, max_packet_size=1 << 20) == 0
+        assert cursor.execute.call_count == 2
+
+    def test_rolled_back_saves_stay_dirty(self, mock_db):
+        """Test instances saved in a transaction that rolls back keep their changes for the next save"""
+        cursor = mock_db['cursor']
+        cursor.fetchall.return_value = ((1, "张三", None), (2, "李四", None))
+        users = TestUser.select().list()
+        users[0].name = "甲"
+        users[1].email = "b@example.com"
+        cursor.execute.side_effect = [1, RuntimeError("lost connection")]
+        with pytest.raises(RuntimeError):
+            TestUser.save_all(users, max_packet_size=1 << 20, atomic=True)
+        assert users[0].get_changes() == {"name": "甲"}
+        assert users[1].get_changes() == {"email": "b@example.com"}
+
+        cursor.execute.side_effect = None
+        cursor.execute.return_value = 1
+        cursor.lastrowid = 9
+        user = CompactUser(name="王五")
+        with pytest.raises(RuntimeError):
+            with transaction():
+                user.save()
+                user.name = "赵六"
+                assert user.save() == 1
+                assert cursor.execute.call_args[0] == ("UPDATE compact_user SET name=%s WHERE id = %s", ("赵六", 9))
+                raise RuntimeError("boom")
+        assert user.is_new() and user.id is None and user.name == "赵六"
+
+
+class TestAsync:
+    def test_async_select_and_write(self, mock_db):
+        """Test awaitable builders run in the bounded worker pool"""
+        cursor = mock_db['cursor']
+        cursor.fetchall.return_value = ((1, "张三", None),)
+        cursor.execute.return_value = 1
+
+        async def main():
+            users = await TestUser.select().eq(TestUser.id, 1).alist()
+            affected = await TestUser.update().eq(TestUser.id, 1).set(name="李四").aexecute()
+            return users, affected
+
+        users, affected = asyncio.run(main())
+
+        assert users[0].name == "张三"
+        assert affected == 1
+        assert cursor.execute.call_args[0] == ("UPDATE test_user SET name=%s WHERE id = %s", ("李四", 1))
+
+    def test_atransaction_is_scoped_to_task(self, mock_db):
+        """Test the async transaction is visible to its own statements but not to other tasks"""
+        conn = mock_db['connection']
+        mock_db['cursor'].execute.return_value = 1
+        seen = {}
+
+        async def other(started):
+            await started.wait()
+            seen["other"] = await AsyncExecutor.run(is_in_transaction)
+
+        async def work(started):
+            async with atransaction():
+                seen["inside"] = await AsyncExecutor.run(is_in_transaction)
+                started.set()
+                await TestUser.delete().eq(TestUser.id, 1).aexecute()
+                await asyncio.sleep(0)
+
+        async def main():
+            started = asyncio.Event()
+            await asyncio.gather(work(started), other(started))
+
+        asyncio.run(main())
+
+        assert seen == {"inside": True, "other": False}
+        conn.begin.assert_called_once()
+        conn.commit.assert_called_once()
+        assert not is_in_transaction()
+
+    def test_atransaction_rolls_back_on_error(self, mock_db):
+        """Test an exception inside the async transaction rolls back"""
+        conn = mock_db['connection']
+
+        async def main():
+            async with atransaction():
+                raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(main())
+        conn.rollback.assert_called_once()
+        conn.commit.assert_not_called()
+
+    def test_atransaction_cancelled_rolls_back_and_runs_callbacks(self, mock_db):
+        """Test cancelling a task inside an async transaction rolls back and runs the rollback callbacks"""
+        conn = mock_db['connection']
+        rolled_back = []
+
+        async def work(started):
+            async with atransaction():
+                await AsyncExecutor.run(on_rollback, lambda: rolled_back.append(True))
+                started.set()
+                await asyncio.sleep(10)
+
+        async def main():
+            started = asyncio.Event()
+            task = asyncio.ensure_future(work(started))
+            await started.wait()
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(main())
+        conn.rollback.assert_called_once()
+        conn.commit.assert_not_called()
+        assert rolled_back == [True]
+        assert get_pool().stats()["in_use"] == 0
+
+    def test_atransaction_cancelled_while_acquiring_releases_connection(self, mock_db):
+        """Test a task cancelled while waiting for a connection does not leak it, and waiters don't block statements"""
+        set_default_db(host="localhost", port=3306, user="test", password="test", database="test_db",
+                       pool=PoolConfig(max_size=1))
+        pool = get_pool()
+        held = pool.acquire()
+        AsyncExecutor.configure(max_workers=1)
+
+        async def main():
+            task = asyncio.ensure_future(atransaction().__aenter__())
+            await asyncio.sleep(0.05)
+            # 等待连接的任务不占用执行语句的线程
+            assert await AsyncExecutor.run(lambda: "free") == "free"
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        try:
+            asyncio.run(main())
+        finally:
+            AsyncExecutor.configure(max_workers=10)
+        pool.release(held)
+        for _ in range(100):
+            if pool.stats()["in_use"] == 0:
+                break
+            threading.Event().wait(0.01)
+        assert pool.stats()["in_use"] == 0
+
+
+class TestParallel:
+    def test_parallel_runs_on_worker_threads_in_order(self, mock_db):
+        """Test independent queries run concurrently and results keep the argument order"""
+        mock_db['cursor'].fetchall.return_value = ((1, "张三", None),)
+        barrier = threading.Barrier(2, timeout=5)
+
+        def thread_name():
+            barrier.wait()
+            return threading.current_thread().name
+
+        users, first, second = parallel(TestUser.select(), thread_name, thread_name)
+
+        assert users[0].name == "张三"
+        assert first.startswith("tee-parallel") and second.startswith("tee-parallel")
+        assert first != second
+
+    def test_parallel_propagates_first_error(self, mock_db):
+        """Test the first failure is raised to the caller"""
+        def fail():
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError, match="boom"):
+            parallel(lambda: 1, fail, lambda: 3)
+
+    def test_parallel_in_transaction_runs_inline(self, mock_db):
+        """Test queries inside a transaction run sequentially on the transaction connection"""
+        current = threading.current_thread().name
+        with transaction():
+            names = parallel(lambda: threading.current_thread().name, lambda: is_in_transaction())
+        assert names == [current, True]
+
+    def test_gather_and_aparallel(self, mock_db):
+        """Test Executor.gather runs statements and aparallel awaits queries in order"""
+        mock_db['cursor'].fetchall.return_value = ({"n": 1},)
+
+        results = Executor.gather(Statement("SELECT 1 AS n"), Statement("SELECT 2 AS n"))
+        assert results == [({"n": 1},), ({"n": 1},)]
+
+        assert asyncio.run(aparallel(lambda: 1, lambda: 2)) == [1, 2]
+
+
+class TestSingleFlight:
+    def test_concurrent_identical_calls_share_one_execution(self):
+        """Test callers arriving while a key is in flight wait for and share its result"""
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def load():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return ("row",)
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do("k", load)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(flight.do("k", load))) for _ in range(3)]
+        for thread in followers:
+            thread.start()
+        while flight.stats()["coalesced"] < 3:
+            threading.Event().wait(0.001)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        assert calls == [1]
+        assert results == [(("row",), True)] * 4
+        assert flight.stats() == {"in_flight": 0, "executions": 1, "coalesced": 3}
+        assert flight.do("k", lambda: 2) == (2, False)
+
+    def test_caller_does_not_join_flight_started_before_its_write(self, mock_db):
+        """Test a caller that wrote after an in-flight query started runs its own query"""
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def stale():
+            started.set()
+            release.wait(5)
+            return "旧"
+
+        leader = threading.Thread(target=lambda: flight.do("k", stale))
+        leader.start()
+        started.wait(5)
+        mock_db['cursor'].execute.return_value = 1
+        with transaction():
+            TestUser.update().eq(TestUser.id, 1).set(name="新").execute()
+        try:
+            assert flight.do("k", lambda: "新", last_write("default")) == ("新", False)
+        finally:
+            release.set()
+            leader.join(5)
+        assert flight.stats() == {"in_flight": 0, "executions": 2, "coalesced": 0}
+
+    def test_select_uses_single_flight_outside_transactions(self, mock_db):
+        """Test Executor reads go through single-flight only when enabled and not in a transaction"""
+        mock_db['cursor'].fetchall.return_value = ((1, "张三", None),)
+        before = single_flight_stats()["executions"]
+        enable_single_flight()
+        try:
+            assert TestUser.select().list()[0].name == "张三"
+            with transaction():
+                TestUser.select().list()
+        finally:
+            disable_single_flight()
+        assert single_flight_stats()["executions"] == before + 1
+
+
+@pytest.fixture
+def replicas(mock_db):
+    """Register two replicas of the default database"""
+    for name in ("replica1", "replica2"):
+        set_db(name, host=name, port=3306, user="test", password="test", database="test_db")
+    set_replicas("default", ["replica1", "replica2"], read_your_writes=2.0)
+    # 其他测试的写入也会记录，从空的写入记录开始
+    token = _last_writes.set(None)
+    yield mock_db
+    _last_writes.reset(token)
+    set_replicas("default", [])
+
+
+class TestReplicas:
+    def test_reads_round_robin_and_overrides(self, replicas):
+        """Test reads rotate over replicas while using("primary") and transactions stay on the primary"""
+        assert [route_read("default") for _ in range(3)] == ["replica1", "replica2", "replica1"]
+        assert route_read("default", "primary") == "default"
+        with transaction():
+            assert route_read("default") == "default"
+
+        replicas['cursor'].fetchall.return_value = ((1, "张三", None),)
+        before = pool_stats("replica2")["acquires"] if "replica2" in pool_stats() else 0
+        TestUser.select().list()
+        assert pool_stats("replica2")["acquires"] == before + 1
+
+    def test_read_your_writes_window(self, replicas):
+        """Test reads after a write in the same context go to the primary until the window passes"""
+        replicas['cursor'].execute.return_value = 1
+        with patch("tee.replicas.time.monotonic", return_value=100.0) as clock:
+            TestUser.update().eq(TestUser.id, 1).set(name="李四").execute()
+            assert route_read("default") == "default"
+            assert route_read("default", "replica").startswith("replica")
+            clock.return_value = 103.0
+            assert route_read("default").startswith("replica")
+
+        # 其他线程不受影响
+        seen = []
+        with patch("tee.replicas.time.monotonic", return_value=100.0):
+            TestUser.delete().eq(TestUser.id, 1).execute()
+            thread = threading.Thread(target=lambda: seen.append(route_read("default")))
+            thread.start()
+            thread.join(5)
+        assert seen[0].startswith("replica")
+
+    def test_cache_fills_read_from_primary(self, replicas):
+        """Test cache misses after a write are loaded from the primary, not from a lagging replica"""
+        connections = {name: MagicMock() for name in ("replica1", "replica2")}
+        replicas['connect'].side_effect = lambda host, **kwargs: connections.get(host, replicas['connection'])
+        set_db("replica1", host="replica1", port=3306, user="test", password="test", database="test_db")
+        set_db("replica2", host="replica2", port=3306, user="test", password="test", database="test_db")
+        for conn in connections.values():
+            conn.cursor.return_value.fetchall.return_value = ((1, "旧名字", None),)
+        replicas['cursor'].fetchall.return_value = ((1, "新名字", None),)
+        replicas['cursor'].execute.return_value = 1
+        entity_cache.clear()
+        try:
+            TestUser.update().eq(TestUser.id, 1).set(name="新名字").execute()
+            seen = []
+            thread = threading.Thread(target=lambda: seen.append(TestUser.get_by_pk(1).name))
+            thread.start()
+            thread.join(5)
+            assert seen == ["新名字"]
+            assert TestUser.get_by_pk(1).name == "新名字"
+            assert TestUser.select().eq(TestUser.id, 1).cache().get().name == "新名字"
+        finally:
+            replicas['connect'].side_effect = None
+
+    def test_balancing_policies(self):
+        """Test least-outstanding and latency-weighted choices"""
+        fast, busy, fresh = Replica("fast"), Replica("busy"), Replica("fresh")
+        busy.start()
+        assert LeastOutstanding().choose([busy, fast]) is fast
+
+        fast.start()
+        fast.finish(0.001)
+        busy.finish(0.5)
+        assert LatencyWeighted().choose([fast, busy, fresh]) is fresh
+        picks = [LatencyWeighted().choose([fast, busy]) for _ in range(200)]
+        assert picks.count(fast) > picks.count(busy)
+        with pytest.raises(TypeError):
+            ReplicaPolicy()
+
+
+class ShardedOrder(Model, shards=HashShards("user_id", ["shard0", "shard1"])):
+    id = Int()
+    user_id = Int()
+    amount = Int()
+
+
+class ShardedNote(Model, shards=HashShards("user_id", ["shard0", "shard1"])):
+    id = Int()
+    user_id = Int()
+    title = Str()
+
+
+@pytest.fixture
+def shards(mock_db):
+    """Register two shard databases, each with its own mocked connection and cursor"""
+    connections = {}
+    for name in ("shard0", "shard1"):
+        set_db(name, host=name, port=3306, user="test", password="test", database="test_db")
+        connections[name] = MagicMock()
+    mock_db['connect'].side_effect = lambda host, **kwargs: connections.get(host, mock_db['connection'])
+    yield {name: conn.cursor.return_value for name, conn in connections.items()}
+    mock_db['connect'].side_effect = None
+
+
+class TestSharding:
+    def test_strategies(self):
+        """Test hash and range strategies map key values to shards"""
+        assert [ShardedOrder._shards.shard_for(v) for v in (4, 7)] == ["shard0", "shard1"]
+        ranges = RangeShards("user_id", [(0, "low"), (1000, "high")])
+        assert [ranges.shard_for(v) for v in (0, 999, 1000)] == ["low", "low", "high"]
+        with pytest.raises(ValueError):
+            ranges.shard_for(-1)
+        with pytest.raises(TypeError):
+            type("Broken", (Model,), {"id": Int()}, shards=HashShards("missing", ["shard0"]))
+        with pytest.raises(TypeError):
+            ShardStrategy("user_id")
+
+    def test_pinned_key_routes_to_one_shard(self, shards):
+        """Test an eq on the shard key queries only that shard"""
+        shards["shard1"].fetchall.return_value = ((1, 3, 10),)
+        orders = ShardedOrder.select().eq(ShardedOrder.user_id, 3).list()
+        assert [order.amount for order in orders] == [10]
+        shards["shard0"].execute.assert_not_called()
+
+    def test_in_lookup_is_split_per_shard(self, shards):
+        """Test an IN on the shard key sends each shard only its own values"""
+        shards["shard0"].fetchall.return_value = ((2, 2, 20),)
+        shards["shard1"].fetchall.return_value = ((1, 1, 10), (3, 3, 30))
+        orders = ShardedOrder.select().in_(ShardedOrder.user_id, [1, 2, 3]).list()
+        assert sorted(order.id for order in orders) == [1, 2, 3]
+        assert shards["shard0"].execute.call_args[0][1] == ([2],)
+        assert shards["shard1"].execute.call_args[0][1] == ([1, 3],)
+
+    def test_scatter_gather_merges_order_and_limit(self, shards):
+        """Test queries without the key run on every shard and merge ORDER BY / LIMIT / OFFSET"""
+        shards["shard0"].fetchall.return_value = ((1, 2, 5), (2, 4, 3))
+        shards["shard1"].fetchall.return_value = ((3, 1, 7), (4, 3, None))
+        orders = ShardedOrder.select().desc(ShardedOrder.amount).limit(2).offset(1).list()
+        assert [order.amount for order in orders] == [5, 3]
+        sql, args = shards["shard0"].execute.call_args[0]
+        assert sql.endswith("ORDER BY amount desc LIMIT %s") and args == (3,)
+
+        shards["shard0"].fetchall.return_value = ({"count": 2},)
+        shards["shard1"].fetchall.return_value = ({"count": 3},)
+        assert ShardedOrder.select().gt(ShardedOrder.amount, 1).count() == 5
+        with pytest.raises(ValueError):
+            ShardedOrder.select().rows()
+        # 字符串列的合并顺序与 MySQL 的排序规则不一致
+        with pytest.raises(ValueError):
+            ShardedNote.select().asc(ShardedNote.title).limit(1).list()
+        shards["shard1"].fetchall.return_value = ((1, 1, "B"),)
+        assert ShardedNote.select().eq(ShardedNote.user_id, 1).asc(ShardedNote.title).list()[0].title == "B"
+
+    def test_writes_are_routed_by_key(self, shards):
+        """Test inserts group rows per shard, and updates/deletes follow the key"""
+        for cursor in shards.values():
+            cursor.execute.return_value = 1
+        rows = [{"user_id": 1, "amount": 10}, {"user_id": 2, "amount": 20}, {"user_id": 3, "amount": 30}]
+        assert ShardedOrder.insert().execute_bulk(rows, max_packet_size=1 << 20) == 2
+        assert shards["shard0"].execute.call_args[0][1] == (2, 20)
+        assert shards["shard1"].execute.call_args[0][1] == (1, 10, 3, 30)
+        with pytest.raises(ValueError):
+            ShardedOrder.insert().execute_bulk(rows, atomic=True)
+
+        ShardedOrder.delete().eq(ShardedOrder.id, 5).execute()
+        assert shards["shard0"].execute.call_args[0][0] == "DELETE FROM sharded_order WHERE id = %s"
+        with pytest.raises(ValueError):
+            ShardedOrder.update().eq(ShardedOrder.id, 5).set(user_id=2).execute()
+
+        order = ShardedOrder._decoder(("id", "user_id", "amount"))((7, 4, 1))
+        order.amount = 2
+        order.save()
+        assert shards["shard0"].execute.call_args[0] == (
+            "UPDATE sharded_order SET amount=%s WHERE id = %s and user_id = %s", (2, 7, 4)
+        )
+        order.user_id = 5
+        with pytest.raises(ValueError):
+            order.save()
+
+    def test_transaction_stays_on_one_shard(self, shards):
+        """Test statements routed to another shard inside a transaction are rejected"""
+        with transaction("shard0"):
+            ShardedOrder.select().eq(ShardedOrder.user_id, 2).list()
+            with pytest.raises(RuntimeError):
+                ShardedOrder.select().eq(ShardedOrder.user_id, 1).list()
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
\ No newline at end of file